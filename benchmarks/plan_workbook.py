@@ -0,0 +1,125 @@
+# plan_workbook.py
+#
+# Генератор синтетических планов закупок в формате zakup.sk.kz:
+# шапка из 10 строк со стилями и объединёнными ячейками, дальше позиции
+# плана с заданной долей строк под нужный код ТРУ. Книга пишется в режиме
+# write_only, поэтому 200 тыс. строк генерируются без роста памяти.
+
+import random
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+HEADER_ROWS = 10
+TARGET_CODE = "801019.000.000010"
+
+COLUMNS = [
+    ("№", 6),
+    ("Код ТРУ", 20),
+    ("Наименование ТРУ", 60),
+    ("Краткая характеристика", 40),
+    ("Ед. изм.", 10),
+    ("Количество", 12),
+    ("Цена за единицу, тенге", 16),
+    ("Сумма, планируемая для закупки ТРУ без НДС, тенге", 20),
+    ("Способ закупки", 24),
+    ("Срок поставки", 14),
+    ("Место поставки (КАТО)", 16),
+    ("Признак", 10),
+]
+
+METHODS = ["Открытый тендер", "Запрос ценовых предложений", "Из одного источника", "Электронный магазин"]
+UNITS = ["шт", "услуга", "комплект", "месяц", "усл. ед."]
+NAMES = [
+    "Услуги по обеспечению информационной безопасности",
+    "Услуги по техническому обслуживанию оборудования",
+    "Поставка серверного оборудования",
+    "Услуги связи",
+    "Канцелярские товары",
+    "Услуги по уборке помещений",
+    "Лицензии на программное обеспечение",
+]
+
+
+def _styled(ws, value, font=None, fill=None, border=None, alignment=None):
+    cell = WriteOnlyCell(ws, value=value)
+    if font:
+        cell.font = font
+    if fill:
+        cell.fill = fill
+    if border:
+        cell.border = border
+    if alignment:
+        cell.alignment = alignment
+    return cell
+
+
+def _random_code(rng: random.Random) -> str:
+    return f"{rng.randint(100000, 999999)}.{rng.randint(100, 999):03d}.{rng.randint(0, 999999):06d}"
+
+
+def generate_plan_workbook(path: str, rows: int, hit_rate: float = 0.01, seed: int = 0,
+                           tru_code: str = TARGET_CODE) -> int:
+    """Пишет книгу плана в path; возвращает число строк с кодом tru_code"""
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("План")
+
+    last_column = len(COLUMNS)
+    for idx, (_, width) in enumerate(COLUMNS):
+        ws.column_dimensions[chr(ord("A") + idx)].width = width
+
+    title_font = Font(bold=True, size=14)
+    bold = Font(bold=True)
+    thin = Side(style="thin")
+    box = Border(left=thin, right=thin, top=thin, bottom=thin)
+    fill = PatternFill("solid", fgColor="DDEBF7")
+    center = Alignment(horizontal="center", vertical="center", wrap_text=True)
+
+    # Шапка: название, реквизиты заказчика, номера колонок и заголовки таблицы
+    header = [
+        [_styled(ws, "План закупок товаров, работ и услуг", font=title_font, alignment=center)],
+        [_styled(ws, "на 2025 финансовый год", alignment=center)],
+        ["Наименование заказчика:", "АО «Синтетический заказчик»"],
+        ["БИН заказчика:", "123456789012"],
+        ["Вид плана:", "Годовой план"],
+        ["Тип плана:", "Основной"],
+        ["Дата утверждения:", "2025-01-15"],
+        [],
+        [_styled(ws, "Сведения о закупаемых ТРУ", font=bold, fill=fill, border=box, alignment=center)],
+        [_styled(ws, name, font=bold, fill=fill, border=box, alignment=center) for name, _ in COLUMNS],
+    ]
+    ws.merged_cells.add(f"A1:{chr(ord('A') + last_column - 1)}1")
+    ws.merged_cells.add(f"A2:{chr(ord('A') + last_column - 1)}2")
+    ws.merged_cells.add("B3:F3")
+    ws.merged_cells.add(f"A9:{chr(ord('A') + last_column - 1)}9")
+    for row in header:
+        ws.append(row)
+
+    hits = 0
+    for number in range(1, rows + 1):
+        if rng.random() < hit_rate:
+            code = tru_code
+            hits += 1
+        else:
+            code = _random_code(rng)
+        quantity = rng.randint(1, 500)
+        price = round(rng.uniform(100, 5_000_000), 2)
+        ws.append([
+            number,
+            code,
+            rng.choice(NAMES),
+            f"Позиция {number}, характеристика {rng.randint(1, 10_000)}",
+            rng.choice(UNITS),
+            quantity,
+            price,
+            round(price * quantity, 2),
+            rng.choice(METHODS),
+            f"{rng.randint(1, 12):02d}.2025",
+            str(rng.randint(100000000, 999999999)),
+            rng.choice(["", "ОВПЗ", "КСД"]),
+        ])
+
+    wb.save(path)
+    return hits
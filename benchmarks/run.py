@@ -0,0 +1,229 @@
+# run.py
+#
+# Замеры горячих путей бота на синтетических планах разного размера:
+# разбор Excel (filter_excel_by_tru, extract_tru_rows), сравнение строк
+# с историей ТРУ, поиск подписок и адресов почты. Для каждого замера —
+# лучшее время из нескольких прогонов и пик памяти по tracemalloc.
+# Результаты сравниваются с сохранённой базой, регрессии выводятся списком.
+#
+#   python -m benchmarks.run                        # замер и сравнение с базой
+#   python -m benchmarks.run --scales 1000,200000   # свои размеры планов
+#   python -m benchmarks.run --save-baseline        # перезаписать базу
+#
+# Абсолютные времена зависят от машины, поэтому база в репозиторий не входит:
+# каждый снимает её у себя (--save-baseline). В базе записан отпечаток машины,
+# и с базой с другой машины прогон не сравнивается.
+
+import argparse
+import atexit
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Бот читает настройки и путь к базе при импорте — всё во временный каталог,
+# чтобы не трогать рабочую базу и storage/
+WORK_DIR = tempfile.mkdtemp(prefix="zakupbot-bench-")
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+os.environ["ZAKUPBOT_DB"] = os.path.join(WORK_DIR, "bench.db")
+os.environ.setdefault("ALLOWED_USERS", "1")
+os.chdir(WORK_DIR)
+
+from benchmarks.plan_workbook import TARGET_CODE, generate_plan_workbook  # noqa: E402
+from bot.email import get_email, load_emails, save_email  # noqa: E402
+from bot.notifier import extract_tru_rows, filter_excel_by_tru  # noqa: E402
+from bot.storage import get_connection  # noqa: E402
+from bot.subscription import add_subscription, is_subscribed, load_subscriptions  # noqa: E402
+from bot.tru_tracker import find_new_rows, record_rows  # noqa: E402
+
+DEFAULT_SCALES = [1_000, 10_000, 50_000]
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, "benchmarks", "baselines.json")
+LOOKUPS = 1_000             # обращений к подпискам и почте за замер
+HISTORY_BIN = "123456789012"
+
+
+def measure(func, repeat: int, setup=None) -> dict:
+    """
+    Лучшее время из repeat прогонов и отдельный прогон под tracemalloc;
+    setup вызывается перед каждым прогоном и в замер не входит
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+
+    # tracemalloc замедляет код в разы, поэтому память меряем отдельно
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": round(best, 4), "peak_mb": round(peak / 2**20, 2)}
+
+
+def seed_history(rows: int):
+    """История БИН из rows прошлых строк, чтобы индекс рос вместе с масштабом"""
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM tru_history")
+    record_rows(HISTORY_BIN, [f"прошлая строка плана {idx}" for idx in range(rows)])
+
+
+def seed_users(count: int):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM subscriptions")
+        conn.execute("DELETE FROM emails")
+    for user_id in range(1, count + 1):
+        add_subscription(user_id)
+        save_email(user_id, f"user{user_id}@example.kz")
+
+
+def bench_scale(rows: int, hit_rate: float, repeat: int) -> dict:
+    path = os.path.join(WORK_DIR, f"plan_{rows}.xlsx")
+    started = time.perf_counter()
+    hits = generate_plan_workbook(path, rows, hit_rate=hit_rate)
+    print(f"📄 План на {rows} строк ({hits} с нужным ТРУ) за {time.perf_counter() - started:.1f} с")
+
+    results = {}
+    results["filter_excel_by_tru"] = measure(lambda: filter_excel_by_tru(path, [TARGET_CODE]), repeat)
+    results["filter_excel_by_tru.probe"] = measure(
+        lambda: filter_excel_by_tru(path, [TARGET_CODE], save_file=False), repeat)
+    results["extract_tru_rows"] = measure(lambda: extract_tru_rows(path), repeat)
+
+    row_texts = extract_tru_rows(path)
+    # Сравнение с историей: все строки плана новые, затем все уже известны
+    seed_history(rows)
+    results["tru_history.find_new.cold"] = measure(lambda: find_new_rows(HISTORY_BIN, row_texts), repeat)
+    results["tru_history.record"] = measure(
+        lambda: record_rows(HISTORY_BIN, row_texts), repeat, setup=lambda: seed_history(rows))
+    results["tru_history.find_new.warm"] = measure(lambda: find_new_rows(HISTORY_BIN, row_texts), repeat)
+
+    # Подписчиков столько же, сколько строк в плане — масштаб растёт вместе
+    seed_users(rows)
+
+    def lookups():
+        for user_id in range(1, LOOKUPS + 1):
+            is_subscribed(user_id)
+            get_email(user_id)
+
+    results["subscriptions.load"] = measure(load_subscriptions, repeat)
+    results["emails.load"] = measure(load_emails, repeat)
+    results["lookups.point"] = measure(lookups, repeat)
+
+    os.remove(path)
+    return results
+
+
+def host_fingerprint() -> dict:
+    """Что влияет на абсолютные времена: машина, процессор, интерпретатор"""
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "system": platform.platform(),
+        "python": platform.python_version(),
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Замеры, которые стали медленнее или прожорливее базы больше чем на tolerance"""
+    regressions = []
+    for scale, results in current.items():
+        for name, stats in results.items():
+            base = baseline.get(scale, {}).get(name)
+            if not base:
+                continue
+            for metric in ("seconds", "peak_mb"):
+                # Совсем мелкие значения шумят — их не сравниваем
+                floor = 0.005 if metric == "seconds" else 0.5
+                if base[metric] < floor and stats[metric] < floor:
+                    continue
+                if stats[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{name} @ {scale}: {metric} {base[metric]} → {stats[metric]} "
+                        f"(+{(stats[metric] / max(base[metric], 1e-9) - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+
+def print_table(current: dict, baseline: dict):
+    for scale, results in current.items():
+        print(f"\n=== {scale} строк ===")
+        for name, stats in results.items():
+            base = baseline.get(scale, {}).get(name)
+            delta = ""
+            if base and base["seconds"]:
+                delta = f"  ({(stats['seconds'] / base['seconds'] - 1) * 100:+.0f}% к базе)"
+            print(f"{name:<30} {stats['seconds']:>9.4f} с {stats['peak_mb']:>9.2f} МБ{delta}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки разбора планов и хранилища zakupbot")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)),
+                        help="размеры планов в строках через запятую (до 200000)")
+    parser.add_argument("--hit-rate", type=float, default=0.01, help="доля строк с нужным кодом ТРУ")
+    parser.add_argument("--repeat", type=int, default=3, help="прогонов на замер, берётся лучший")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="файл с базовыми результатами")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результаты как новую базу")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="допустимое ухудшение относительно базы, 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("host") == host_fingerprint():
+            baseline = saved.get("results", {})
+        else:
+            print(f"⚠️ База {args.baseline} снята на другой машине ({saved.get('host', {}).get('node', '?')}) — "
+                  f"не сравниваем, пересоберите её через --save-baseline")
+
+    current = {}
+    for rows in scales:
+        current[str(rows)] = bench_scale(rows, args.hit_rate, args.repeat)
+
+    print_table(current, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "host": host_fingerprint(),
+                "hit_rate": args.hit_rate,
+                "repeat": args.repeat,
+                "results": current,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 База сохранена: {args.baseline}")
+        return 0
+
+    regressions = compare(current, baseline, args.tolerance)
+    if regressions:
+        print("\n❌ Регрессии относительно базы:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\n✅ Регрессий нет" if baseline else "\nℹ️ Базы для этой машины нет — сохраните её через --save-baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
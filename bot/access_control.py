@@ -14,3 +14,12 @@ def access_required(func):
         else:
             await update.message.reply_text("⛔ У вас нет доступа к этому боту.")
     return wrapper
+
+def admin_required(func):
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        if user and user.id in settings.ADMIN_USERS:
+            return await func(update, context)
+        else:
+            await update.message.reply_text("⛔ Команда доступна только администраторам.")
+    return wrapper
@@ -0,0 +1,210 @@
+# archive.py
+#
+# Колоночный архив всех строк разобранных планов: Parquet (zstd) с разбиением
+# по году и месяцу утверждения плана, по файлу на план:
+#   storage/archive/year=2025/month=03/<uid>.parquet
+# Строки пишутся прямо во время разбора, тем же проходом по листу, поэтому
+# для новых фильтров и вопросов по прошлым планам не нужно заново качать Excel.
+
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from bot.excel_scan import row_to_text
+from bot.plan_parser import parse_plan
+from bot.search_index import SearchIndexWriter
+from bot.tru_matcher import CODE_VALUE_RE
+from filters.filter_engine import CODE_TOKEN_RE, detect_amount_column, parse_amount
+
+ARCHIVE_DIR = "storage/archive"
+BATCH_ROWS = 10_000
+
+SCHEMA = pa.schema([
+    ("uid", pa.string()),
+    ("customer_bin", pa.string()),
+    ("customer_name", pa.string()),
+    ("approve_date", pa.timestamp("ms", tz="UTC")),
+    ("plan_type", pa.string()),
+    ("plan_duration", pa.string()),
+    ("plan_year", pa.int32()),
+    ("row_number", pa.int32()),
+    ("tru_code", pa.string()),
+    ("amount", pa.float64()),
+    ("matched", pa.bool_()),
+    ("row_text", pa.string()),
+])
+
+
+def _partition_dir(approve_date: datetime | None) -> str:
+    if approve_date is None:
+        return os.path.join(ARCHIVE_DIR, "year=0000", "month=00")
+    return os.path.join(ARCHIVE_DIR, f"year={approve_date.year:04d}", f"month={approve_date.month:02d}")
+
+
+class ArchiveWriter:
+    """
+    Приёмник строк для parse_plan: копит строки пачками по BATCH_ROWS
+    и дописывает их в Parquet-файл плана.
+    """
+
+    def __init__(self, plan: dict):
+        raw_date = plan.get("approveDate")
+        self.approve_date = datetime.fromtimestamp(raw_date / 1000, tz=timezone.utc) if raw_date else None
+        self.uid = plan["excelFileUid"]
+        self.plan_fields = {
+            "uid": self.uid,
+            "customer_bin": plan.get("customerIdentifier"),
+            "customer_name": plan.get("customerName"),
+            "approve_date": self.approve_date,
+            "plan_type": plan.get("planType"),
+            "plan_duration": plan.get("planDurationType"),
+            "plan_year": int(plan["year"]) if str(plan.get("year", "")).isdigit() else None,
+        }
+        self.path = os.path.join(_partition_dir(self.approve_date), f"{self.uid}.parquet")
+        # Точка в начале: pyarrow.dataset пропускает такие файлы при чтении архива
+        self.tmp_path = os.path.join(os.path.dirname(self.path), f".{self.uid}.{os.getpid()}.tmp")
+        self.code_column = None
+        self.amount_column = None
+        self.columns = {name: [] for name in ("row_number", "tru_code", "amount", "matched", "row_text")}
+        self.row_number = 0
+        self.rows_written = 0
+        self._writer: pq.ParquetWriter | None = None
+
+    def begin(self, header_rows: list[tuple], code_column: int | None):
+        self.code_column = code_column
+        self.amount_column = detect_amount_column(header_rows)
+
+    def add(self, values: tuple, matched: bool):
+        self.row_number += 1
+        if all(value is None for value in values):
+            return
+        row_text = row_to_text(values)
+
+        code = None
+        if self.code_column is not None and self.code_column < len(values) and values[self.code_column] is not None:
+            match = CODE_VALUE_RE.match(str(values[self.code_column]).strip())
+            code = match.group(0) if match else None
+        if code is None:
+            match = CODE_TOKEN_RE.search(row_text)
+            code = match.group(0) if match else None
+        amount = None
+        if self.amount_column is not None and self.amount_column < len(values):
+            amount = parse_amount(values[self.amount_column])
+
+        self.columns["row_number"].append(self.row_number)
+        self.columns["tru_code"].append(code)
+        self.columns["amount"].append(amount)
+        self.columns["matched"].append(matched)
+        self.columns["row_text"].append(row_text)
+        if len(self.columns["row_text"]) >= BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        size = len(self.columns["row_text"])
+        if not size:
+            return
+        arrays = {name: [value] * size for name, value in self.plan_fields.items()}
+        arrays.update(self.columns)
+        table = pa.Table.from_pydict(arrays, schema=SCHEMA)
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._writer = pq.ParquetWriter(self.tmp_path, SCHEMA, compression="zstd")
+        self._writer.write_table(table)
+        self.rows_written += size
+        self.columns = {name: [] for name in self.columns}
+
+    def finish(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+            # План перевыпустили — новый файл заменяет старый целиком
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            os.remove(self.tmp_path)
+
+
+class _RowFanOut:
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def begin(self, header_rows: list[tuple], code_column: int | None):
+        for sink in self.sinks:
+            sink.begin(header_rows, code_column)
+
+    def add(self, values: tuple, matched: bool):
+        for sink in self.sinks:
+            sink.add(values, matched)
+
+    def finish(self):
+        for sink in self.sinks:
+            sink.finish()
+
+    def abort(self):
+        for sink in self.sinks:
+            sink.abort()
+
+
+def parse_and_archive(filepath: str, tru_codes, plan: dict):
+    """
+    parse_plan с записью всех строк листа в архив и в поисковый индекс /search;
+    запускается в пуле разбора
+    """
+    sink = _RowFanOut(ArchiveWriter(plan), SearchIndexWriter(plan))
+    parsed = parse_plan(filepath, tru_codes, row_sink=sink)
+    if parsed is None:
+        sink.abort()
+    else:
+        sink.finish()
+    return parsed
+
+
+def query_archive(tru_code: str | None = None, tru_prefix: str | None = None,
+                  customer_bin: str | None = None, customer: str | None = None,
+                  date_from: datetime | None = None, date_to: datetime | None = None,
+                  matched_only: bool = False, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Выборка строк архива. Точные условия и даты уходят в pyarrow (с отсечением
+    партиций по году и месяцу), префикс кода и подстрока заказчика —
+    векторно в pandas.
+    """
+    if not os.path.isdir(ARCHIVE_DIR):
+        return pd.DataFrame(columns=columns or SCHEMA.names)
+
+    dataset = ds.dataset(ARCHIVE_DIR, format="parquet", partitioning="hive", schema=SCHEMA.append(
+        pa.field("year", pa.int32())).append(pa.field("month", pa.int32())))
+
+    conditions = []
+    if tru_code:
+        conditions.append(ds.field("tru_code") == tru_code)
+    if customer_bin:
+        conditions.append(ds.field("customer_bin") == customer_bin)
+    if matched_only:
+        conditions.append(ds.field("matched"))
+    if date_from:
+        date_from = date_from if date_from.tzinfo else date_from.replace(tzinfo=timezone.utc)
+        conditions.append(ds.field("year") * 100 + ds.field("month") >= date_from.year * 100 + date_from.month)
+        conditions.append(ds.field("approve_date") >= pa.scalar(date_from, pa.timestamp("ms", tz="UTC")))
+    if date_to:
+        date_to = date_to if date_to.tzinfo else date_to.replace(tzinfo=timezone.utc)
+        conditions.append(ds.field("year") * 100 + ds.field("month") <= date_to.year * 100 + date_to.month)
+        conditions.append(ds.field("approve_date") <= pa.scalar(date_to, pa.timestamp("ms", tz="UTC")))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    frame = dataset.to_table(filter=expression, columns=SCHEMA.names).to_pandas()
+    if tru_prefix:
+        frame = frame[frame["tru_code"].str.startswith(tru_prefix, na=False)]
+    if customer:
+        frame = frame[frame["customer_name"].str.contains(customer, case=False, regex=False, na=False)]
+    if columns:
+        frame = frame[columns]
+    return frame.reset_index(drop=True)
@@ -0,0 +1,88 @@
+# artifacts.py
+#
+# Отфильтрованная книга плана собирается один раз и хранится по хешу содержимого
+# в storage/artifacts. Рассылка, письма и повторные нажатия кнопок берут готовые
+# байты отсюда, без повторного скачивания, разбора и копий под каждого получателя.
+
+import hashlib
+import os
+import time
+
+from bot.storage import get_connection
+
+ARTIFACTS_DIR = "storage/artifacts"
+ARTIFACT_RETENTION = 30 * 24 * 60 * 60  # сек
+# Файл без записи в базе моложе этого не трогаем: запись могут ещё не
+# закоммитить (рассылка, кнопка /email, другой воркер)
+ORPHAN_GRACE = 60 * 60  # сек
+os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+
+
+def _artifact_path(content_hash: str) -> str:
+    return os.path.join(ARTIFACTS_DIR, f"{content_hash}.xlsx")
+
+
+def plan_variant(indices) -> str:
+    """Вариант книги плана по набору строк: книга хранится под ключом <uid>:<вариант>"""
+    return hashlib.sha1(",".join(map(str, indices)).encode()).hexdigest()[:8]
+
+
+def put_artifact(uid: str, file_name: str, data: bytes) -> str:
+    content_hash = hashlib.sha256(data).hexdigest()
+    path = _artifact_path(content_hash)
+
+    # Одинаковые книги (например, перевыпуск плана) лежат на диске один раз.
+    # У уже лежащей обновляем mtime, чтобы prune_artifacts не удалил её, пока
+    # запись о ней ещё не в базе
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO plan_artifacts (uid, content_hash, file_name, created_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(uid) DO UPDATE SET content_hash = excluded.content_hash, "
+            "file_name = excluded.file_name, created_at = excluded.created_at",
+            (uid, content_hash, file_name, time.time()),
+        )
+    return content_hash
+
+
+def get_artifact(uid: str) -> tuple[str, bytes] | None:
+    """(имя файла, байты книги) или None, если книга плана ещё не собиралась"""
+    row = get_connection().execute(
+        "SELECT content_hash, file_name FROM plan_artifacts WHERE uid = ?", (uid,)
+    ).fetchone()
+    if not row:
+        return None
+    content_hash, file_name = row
+    try:
+        with open(_artifact_path(content_hash), "rb") as f:
+            return file_name, f.read()
+    except FileNotFoundError:
+        return None
+
+
+def prune_artifacts(max_age: float = ARTIFACT_RETENTION):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM plan_artifacts WHERE created_at < ?", (time.time() - max_age,))
+        live = {content_hash for (content_hash,) in conn.execute("SELECT content_hash FROM plan_artifacts")}
+
+    orphan_before = time.time() - ORPHAN_GRACE
+    for name in os.listdir(ARTIFACTS_DIR):
+        # .tmp моложе ORPHAN_GRACE ещё пишется, старше — остался от упавшего процесса
+        content_hash = name.split(".", 1)[0]
+        if content_hash in live and not name.endswith(".tmp"):
+            continue
+        path = os.path.join(ARTIFACTS_DIR, name)
+        try:
+            if os.path.getmtime(path) < orphan_before:
+                os.remove(path)
+        except FileNotFoundError:
+            pass  # удалил другой воркер
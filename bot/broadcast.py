@@ -0,0 +1,192 @@
+# broadcast.py
+#
+# Рассылка подписчикам: все чаты параллельно, но в пределах лимитов Telegram —
+# ~30 сообщений в секунду на бота и не чаще 1 сообщения в секунду в один чат.
+# RetryAfter и сетевые ошибки переживаем с ожиданием, чаты, которые
+# заблокировали бота или исчезли, убираем из подписок. Любая другая ошибка
+# одного чата — неудача этого чата, остальная рассылка идёт дальше.
+
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
+
+from bot.metrics import TELEGRAM_ERRORS, TELEGRAM_MESSAGES, TELEGRAM_SEND_SECONDS
+from bot.subscription import remove_subscription
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = 25            # сообщений в секунду на весь бот, с запасом от 30
+PER_CHAT_INTERVAL = 1.0     # секунд между сообщениями в один чат
+MAX_CONCURRENCY = 50        # одновременных запросов к Bot API
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+SKIPPED = "skipped"         # исход чата, которому слать не понадобилось
+
+# BadRequest с таким текстом означает, что чата больше нет
+PERMANENT_BAD_REQUESTS = ("chat not found", "user is deactivated", "bot was kicked", "peer_id_invalid")
+
+
+def _seconds(value) -> float:
+    # В разных версиях python-telegram-bot retry_after — int или timedelta
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class RateLimiter:
+    """Token bucket: не больше rate запросов в секунду с пачкой до burst"""
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        # После RetryAfter глобально притормаживаем всех отправителей
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+@dataclass
+class BroadcastResult:
+    sent: list[int] = field(default_factory=list)
+    failed: list[int] = field(default_factory=list)
+    removed: list[int] = field(default_factory=list)
+    skipped: list[int] = field(default_factory=list)   # claim отказал: уже доставлено или доставляется
+
+
+class Broadcaster:
+    def __init__(self, rate: float = GLOBAL_RATE, concurrency: int = MAX_CONCURRENCY,
+                 per_chat_interval: float = PER_CHAT_INTERVAL):
+        self.limiter = RateLimiter(rate)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.per_chat_interval = per_chat_interval
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_last_sent: dict[int, float] = {}
+
+    async def _wait_for_chat(self, chat_id: int):
+        last = self._chat_last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.per_chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def send(self, chat_id: int, call) -> bool | None:
+        """
+        call — функция без аргументов, возвращающая корутину запроса к Bot API.
+        True — отправлено, False — не удалось, None — чат удалён из подписок.
+        """
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock, self.semaphore:
+            for attempt in range(MAX_ATTEMPTS):
+                await self._wait_for_chat(chat_id)
+                await self.limiter.acquire()
+                try:
+                    with TELEGRAM_SEND_SECONDS.time():
+                        await call()
+                    self._chat_last_sent[chat_id] = time.monotonic()
+                    return True
+                except RetryAfter as e:
+                    TELEGRAM_ERRORS.inc(error="RetryAfter")
+                    retry_after = _seconds(e.retry_after)
+                    logger.warning(f"⏳ Flood control, ждём {retry_after} с (чат {chat_id})")
+                    self.limiter.pause(retry_after)
+                    await asyncio.sleep(retry_after)
+                except Forbidden as e:
+                    TELEGRAM_ERRORS.inc(error="Forbidden")
+                    return self._drop_chat(chat_id, e)
+                except BadRequest as e:
+                    TELEGRAM_ERRORS.inc(error="BadRequest")
+                    if any(reason in str(e).lower() for reason in PERMANENT_BAD_REQUESTS):
+                        return self._drop_chat(chat_id, e)
+                    print(f"❌ Ошибка отправки пользователю {chat_id}: {e}")
+                    logger.error(f"❌ Ошибка отправки пользователю {chat_id}: {e}")
+                    return False
+                except (TimedOut, NetworkError) as e:
+                    TELEGRAM_ERRORS.inc(error=type(e).__name__)
+                    delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+                    delay += random.uniform(0, delay / 2)
+                    logger.warning(f"🔁 Сетевая ошибка для {chat_id}: {e}, повтор через {delay:.1f} с")
+                    await asyncio.sleep(delay)
+                except TelegramError as e:
+                    # ChatMigrated, InvalidToken и прочее — повтор не поможет
+                    TELEGRAM_ERRORS.inc(error=type(e).__name__)
+                    print(f"❌ Ошибка отправки пользователю {chat_id}: {e}")
+                    logger.error(f"❌ Ошибка отправки пользователю {chat_id}: {e}")
+                    return False
+
+        print(f"❌ Не удалось отправить пользователю {chat_id} после {MAX_ATTEMPTS} попыток")
+        logger.error(f"❌ Не удалось отправить пользователю {chat_id} после {MAX_ATTEMPTS} попыток")
+        return False
+
+    def _drop_chat(self, chat_id: int, error: Exception) -> None:
+        remove_subscription(chat_id)
+        print(f"🚫 Чат {chat_id} недоступен ({error}), подписка удалена")
+        logger.warning(f"🚫 Чат {chat_id} недоступен ({error}), подписка удалена")
+        return None
+
+    async def _claim_and_send(self, chat_id: int, make_call, claim) -> bool | str | None:
+        # Отказ claim — не отправка и не ошибка: лимиты на такой чат не тратим
+        if claim is not None and not await claim(chat_id):
+            return SKIPPED
+        return await self.send(chat_id, lambda: make_call(chat_id))
+
+    async def broadcast(self, chat_ids, make_call, claim=None) -> BroadcastResult:
+        """
+        make_call(chat_id) возвращает корутину отправки в этот чат.
+        claim(chat_id) — необязательная корутина: False, если чату слать уже не нужно.
+        """
+        chat_ids = list(chat_ids)
+        # Исключение одного чата (например, из make_call) не должно обрывать остальные
+        outcomes = await asyncio.gather(
+            *(self._claim_and_send(chat_id, make_call, claim) for chat_id in chat_ids),
+            return_exceptions=True,
+        )
+
+        result = BroadcastResult()
+        for chat_id, outcome in zip(chat_ids, outcomes):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            if isinstance(outcome, BaseException):
+                logger.error(f"❌ Ошибка отправки пользователю {chat_id}: {outcome!r}")
+                result.failed.append(chat_id)
+            elif outcome is True:
+                result.sent.append(chat_id)
+            elif outcome == SKIPPED:
+                result.skipped.append(chat_id)
+            elif outcome is None:
+                result.removed.append(chat_id)
+            else:
+                result.failed.append(chat_id)
+        TELEGRAM_MESSAGES.inc(len(result.sent), outcome="sent")
+        TELEGRAM_MESSAGES.inc(len(result.failed), outcome="failed")
+        TELEGRAM_MESSAGES.inc(len(result.removed), outcome="removed")
+        TELEGRAM_MESSAGES.inc(len(result.skipped), outcome="skipped")
+        return result
+
+
+_broadcaster: Broadcaster | None = None
+
+
+def get_broadcaster() -> Broadcaster:
+    # Один диспетчер на процесс — лимиты Telegram общие для всего бота
+    global _broadcaster
+    if _broadcaster is None:
+        _broadcaster = Broadcaster(rate=get_settings().TELEGRAM_RATE)
+    return _broadcaster
@@ -0,0 +1,102 @@
+# check_cache.py
+#
+# Ответ на /check из готовой таблицы: фоновый цикл проверки записывает сюда
+# каждый план с подходящими ТРУ, а команда только читает. Пересчёт, если он
+# нужен, выполняется один на всех — одновременные вызовы ждут общий результат.
+
+import asyncio
+import time
+
+from bot.storage import get_connection
+
+# Старше этого кэш считается устаревшим и /check запускает обновление в фоне
+CHECK_MAX_AGE = 45 * 60  # сек
+# В /check и в таблице — только планы, утверждённые за это время
+CHECK_RETENTION = 90 * 24 * 60 * 60  # сек
+
+_inflight: dict[str, asyncio.Task] = {}
+
+
+async def single_flight(key: str, factory):
+    """
+    Выполняет factory() один раз на ключ: пока задача идёт, остальные
+    вызовы ждут её же результат, а не запускают свою.
+    """
+    task = _inflight.get(key)
+    if task is None or task.done():
+        task = asyncio.create_task(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _inflight.pop(key, None) if _inflight.get(key) is t else None)
+    # shield: отмена одного ожидающего не отменяет общий расчёт
+    return await asyncio.shield(task)
+
+
+def is_in_flight(key: str) -> bool:
+    task = _inflight.get(key)
+    return task is not None and not task.done()
+
+
+def record_check_result(uid: str, text: str, approve_date: int | None):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO check_results (uid, text, approve_date, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(uid) DO UPDATE SET text = excluded.text, "
+            "approve_date = excluded.approve_date, updated_at = excluded.updated_at",
+            (uid, text, approve_date, time.time()),
+        )
+
+
+def _cutoff(max_age: float) -> tuple[int, float]:
+    # approve_date — миллисекунды от источника; без даты смотрим, когда план записан
+    now = time.time()
+    return int((now - max_age) * 1000), now - max_age
+
+
+def load_check_results(max_age: float = CHECK_RETENTION) -> list[dict]:
+    rows = get_connection().execute(
+        "SELECT uid, text FROM check_results "
+        "WHERE COALESCE(approve_date >= ?, updated_at >= ?) "
+        "ORDER BY approve_date DESC, uid",
+        _cutoff(max_age),
+    ).fetchall()
+    return [{"uid": uid, "text": text} for uid, text in rows]
+
+
+def prune_check_results(max_age: float = CHECK_RETENTION):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM check_results WHERE NOT COALESCE(approve_date >= ?, updated_at >= ?)",
+                     _cutoff(max_age))
+
+
+def mark_refreshed():
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('check_refreshed_at', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (str(time.time()),),
+        )
+
+
+def last_refreshed() -> float | None:
+    row = get_connection().execute("SELECT value FROM meta WHERE key = 'check_refreshed_at'").fetchone()
+    return float(row[0]) if row else None
+
+
+def is_seeded() -> bool:
+    # Цикл проверки видит только новые планы; уже разосланные попадают
+    # в кэш одной полной проверкой при первом /check
+    row = get_connection().execute("SELECT 1 FROM meta WHERE key = 'check_seeded'").fetchone()
+    return row is not None
+
+
+def mark_seeded():
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('check_seeded', strftime('%s', 'now'))")
+
+
+def is_stale(refreshed_at: float | None, max_age: float = CHECK_MAX_AGE) -> bool:
+    return refreshed_at is None or time.time() - refreshed_at > max_age
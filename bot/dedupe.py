@@ -0,0 +1,67 @@
+# dedupe.py
+#
+# Заказчики часто перевыпускают по сути тот же план (PREBASIC → BASIC →
+# REVIEWED) под новым excelFileUid. Два уровня проверки:
+#   - sha256 файла, посчитанный при скачивании: точная копия не разбирается вовсе;
+#   - хеш набора найденных строк ТРУ по БИН: те же строки — без отрисовки и рассылки.
+# Для каждого UID записываем, чем закончилась обработка и почему.
+
+import hashlib
+import time
+
+from bot.storage import get_connection
+
+OUTCOME_NOTIFIED = "notified"
+OUTCOME_SKIPPED = "skipped"
+
+REASON_SAME_FILE = "same_file"
+REASON_SAME_ROWS = "same_rows"
+REASON_NO_TRU = "no_tru"
+REASON_NO_NEW_ROWS = "no_new_rows"
+REASON_NO_SUBSCRIBERS = "no_subscribers"
+
+
+def rows_hash(fingerprints: list[int]) -> str:
+    """Хеш набора строк без учёта порядка и повторов"""
+    digest = hashlib.sha256()
+    for fingerprint in sorted(set(fingerprints)):
+        digest.update(fingerprint.to_bytes(8, "big", signed=True))
+    return digest.hexdigest()
+
+
+def find_same_file(content_hash: str, customer_bin: str, uid: str) -> str | None:
+    """UID другого плана того же заказчика, уже обработанного с тем же содержимым файла"""
+    row = get_connection().execute(
+        "SELECT uid FROM plan_dedupe WHERE content_hash = ? AND customer_bin = ? AND uid != ? LIMIT 1",
+        (content_hash, customer_bin, uid),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def find_same_rows(customer_bin: str, hash_of_rows: str, uid: str) -> str | None:
+    row = get_connection().execute(
+        "SELECT uid FROM plan_dedupe WHERE customer_bin = ? AND rows_hash = ? AND uid != ? LIMIT 1",
+        (customer_bin, hash_of_rows, uid),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def record_outcome(uid: str, content_hash: str, outcome: str, reason: str | None = None,
+                   customer_bin: str | None = None, hash_of_rows: str | None = None):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO plan_dedupe "
+            "(uid, content_hash, rows_hash, customer_bin, outcome, reason, processed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (uid, content_hash, hash_of_rows, customer_bin, outcome, reason, time.time()),
+        )
+
+
+def skip_reasons(since: float | None = None) -> dict[str, int]:
+    """Сколько планов пропущено по каждой причине — для логов и статистики"""
+    rows = get_connection().execute(
+        "SELECT reason, COUNT(*) FROM plan_dedupe WHERE outcome = ? AND processed_at >= ? GROUP BY reason",
+        (OUTCOME_SKIPPED, since or 0),
+    ).fetchall()
+    return dict(rows)
@@ -1,64 +1,79 @@
-import json
 import os
 import smtplib
 from email.message import EmailMessage
-
-NOTIFIED_FILE = "storage/notified_uids.json"
+from bot.metrics import EMAIL_BYTES, EMAILS, SMTP_SEND_SECONDS
+from bot.storage import get_connection
+from config.settings import get_settings
 
 def load_notified_uids():
-    if os.path.exists(NOTIFIED_FILE):
-        with open(NOTIFIED_FILE, "r") as f:
-            return set(json.load(f))
-    return set()
+    rows = get_connection().execute("SELECT uid FROM notified_uids").fetchall()
+    return {uid for (uid,) in rows}
 
 def save_notified_uids(uids):
-    with open(NOTIFIED_FILE, "w") as f:
-        json.dump(list(uids), f)
+    conn = get_connection()
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO notified_uids (uid) VALUES (?)", [(uid,) for uid in uids])
 
-def send_email_with_attachment(to_email: str, file_path: str, message_text: str):
-    # Настройки отправителя
-    smtp_server = "mx1.qazcloud.kz"
-    smtp_port = 587
-    sender_email = os.getenv("sender_email")
-    sender_password = os.getenv("sender_password")  # пароль приложения Gmail
+def open_smtp_connection() -> smtplib.SMTP:
+    """Подключение к SMTP с STARTTLS и логином; хост и порт берутся из настроек"""
+    settings = get_settings()
+    server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+    try:
+        if settings.SMTP_STARTTLS:
+            server.starttls()
+        # Локальной заглушке SMTP логин не нужен
+        if settings.SENDER_PASSWORD:
+            server.login(settings.SENDER_EMAIL, settings.SENDER_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    return server
 
+def build_email_message(to_email: str, message_text: str, file_name: str, file_data: bytes) -> EmailMessage:
     msg = EmailMessage()
     msg["Subject"] = "План закупок"
-    msg["From"] = sender_email
+    msg["From"] = get_settings().SENDER_EMAIL
     msg["To"] = to_email
 
     # Используем текст с описанием компании
     msg.set_content(
         message_text + "\n\nВо вложении находится отфильтрованный план закупок"
     )
+    msg.add_attachment(file_data, maintype="application", subtype="octet-stream", filename=file_name)
+    return msg
 
+def send_email_with_attachment(to_email: str, file_path: str, message_text: str):
     # Присоединить файл
     with open(file_path, "rb") as f:
         file_data = f.read()
-        file_name = os.path.basename(file_path)
-        msg.add_attachment(file_data, maintype="application", subtype="octet-stream", filename=file_name)
+    send_email_with_data(to_email, os.path.basename(file_path), file_data, message_text)
 
-    # Отправка письма
-    with smtplib.SMTP(smtp_server, smtp_port) as server:
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
+def send_email_with_data(to_email: str, file_name: str, file_data: bytes, message_text: str):
+    msg = build_email_message(to_email, message_text, file_name, file_data)
+    EMAIL_BYTES.observe(len(file_data))
 
-STORAGE_FILE = "storage/emails.json"
-os.makedirs("storage", exist_ok=True)
+    # Разовая отправка; массовая рассылка идёт через очередь bot.mailer
+    try:
+        with SMTP_SEND_SECONDS.time(mode="direct"), open_smtp_connection() as server:
+            server.send_message(msg)
+    except Exception:
+        EMAILS.inc(outcome="failed")
+        raise
+    EMAILS.inc(outcome="sent")
 
 def load_emails():
-    if not os.path.exists(STORAGE_FILE):
-        return {}
-    with open(STORAGE_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    rows = get_connection().execute("SELECT user_id, email FROM emails").fetchall()
+    return {str(user_id): email for user_id, email in rows}
 
 def save_email(user_id: int, email: str):
-    data = load_emails()
-    data[str(user_id)] = email
-    with open(STORAGE_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO emails (user_id, email) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET email = excluded.email",
+            (user_id, email),
+        )
 
 def get_email(user_id: int) -> str | None:
-    data = load_emails()
-    return data.get(str(user_id))
+    row = get_connection().execute("SELECT email FROM emails WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else None
@@ -0,0 +1,101 @@
+# excel_scan.py
+#
+# Потоковое чтение планов закупок: openpyxl в режиме read_only строит ячейки
+# по одной строке за раз, поэтому память не растёт вместе с размером листа.
+
+import posixpath
+import re
+import zipfile
+from xml.etree import ElementTree
+
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter, range_boundaries
+
+from bot.tru_matcher import compile_tru_matcher
+
+HEADER_ROWS = 10
+LAYOUT_CHUNK_SIZE = 1024 * 1024
+
+COL_RE = re.compile(rb"<(?:\w+:)?col\s([^>]*)>")
+MERGE_RE = re.compile(rb"<(?:\w+:)?mergeCell\s[^>]*\bref=\"([^\"]+)\"")
+ATTR_RE = re.compile(rb"(\w+)=\"([^\"]*)\"")
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def open_plan_sheet(filepath: str):
+    """Открывает книгу только для чтения; книгу нужно закрыть через wb.close()"""
+    wb = load_workbook(filepath, read_only=True)
+    return wb, wb.active
+
+
+def iter_row_values(ws, min_row: int = HEADER_ROWS + 1):
+    for row in ws.iter_rows(min_row=min_row, values_only=True):
+        yield row
+
+
+def row_to_text(row) -> str:
+    row_values = [str(cell) if cell is not None else "" for cell in row]
+    return " | ".join(row_values).strip()
+
+
+def has_tru_rows(filepath: str, tru_codes) -> bool:
+    """Есть ли в файле хотя бы одна строка с ТРУ — останавливается на первом совпадении"""
+    matcher = compile_tru_matcher(tru_codes)
+    wb, ws = open_plan_sheet(filepath)
+    try:
+        header_rows = list(ws.iter_rows(min_row=1, max_row=HEADER_ROWS, values_only=True))
+        code_column = matcher.detect_code_column(header_rows)
+        return any(matcher.row_matches(row, code_column) for row in iter_row_values(ws))
+    finally:
+        wb.close()
+
+
+def sheet_part_path(archive: zipfile.ZipFile, title: str) -> str:
+    """Путь XML листа внутри xlsx: имя листа → r:id в workbook.xml → Target в связях книги"""
+    workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    rel_id = next(sheet.get(f"{REL_NS}id") for sheet in workbook.iter(f"{MAIN_NS}sheet")
+                  if sheet.get("name") == title)
+    rels = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    target = next(rel.get("Target") for rel in rels.iter(f"{PACKAGE_REL_NS}Relationship")
+                  if rel.get("Id") == rel_id)
+    # Target бывает и от корня пакета, и относительно xl/
+    return target.lstrip("/") if target.startswith("/") else posixpath.normpath(f"xl/{target}")
+
+
+def read_sheet_layout(filepath: str, ws, max_row: int = HEADER_ROWS) -> tuple[dict[str, float], list[str]]:
+    """
+    Ширины колонок и объединённые ячейки шапки. В read_only режиме openpyxl
+    их не отдаёт, поэтому пробегаем сырой XML листа кусками, не разбирая строки данных.
+    """
+    widths = {}
+    merged = []
+    max_column = ws.max_column or 16384
+    tail = b""
+
+    with zipfile.ZipFile(filepath) as archive, archive.open(sheet_part_path(archive, ws.title)) as source:
+        while True:
+            chunk = source.read(LAYOUT_CHUNK_SIZE)
+            buf = tail + chunk
+            # Тег может разрезаться на границе куска — хвост разбираем со следующим
+            cut = len(buf) if not chunk else max(buf.rfind(b"<"), 0)
+
+            for match in COL_RE.finditer(buf, 0, cut):
+                attrs = dict(ATTR_RE.findall(match.group(1)))
+                if b"width" not in attrs:
+                    continue
+                for col_idx in range(int(attrs[b"min"]), min(int(attrs[b"max"]), max_column) + 1):
+                    widths[get_column_letter(col_idx)] = float(attrs[b"width"])
+
+            for match in MERGE_RE.finditer(buf, 0, cut):
+                ref = match.group(1).decode()
+                if range_boundaries(ref)[3] <= max_row:
+                    merged.append(ref)
+
+            if not chunk:
+                break
+            tail = buf[cut:]
+
+    return widths, merged
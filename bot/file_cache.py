@@ -0,0 +1,45 @@
+# file_cache.py
+#
+# Telegram file_id для уже загруженных файлов планов: повторная отправка того
+# же плана идёт по file_id, без скачивания с zakup.sk.kz и новой загрузки в Telegram.
+
+import hashlib
+import time
+
+from bot.storage import get_connection
+
+
+def get_cached_file_id(uid: str) -> str | None:
+    row = get_connection().execute("SELECT file_id FROM document_cache WHERE uid = ?", (uid,)).fetchone()
+    return row[0] if row else None
+
+def save_file_id(uid: str, file_id: str, content_hash: str | None = None):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO document_cache (uid, file_id, content_hash, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(uid) DO UPDATE SET file_id = excluded.file_id, "
+            "content_hash = excluded.content_hash, updated_at = excluded.updated_at",
+            (uid, file_id, content_hash, time.time()),
+        )
+
+def invalidate_file_id(uid: str):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM document_cache WHERE uid = ?", (uid,))
+
+def note_file_content(uid: str, content_hash: str):
+    """Вызывается при каждом скачивании: если файл плана изменился, старый file_id больше не годится"""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "DELETE FROM document_cache WHERE uid = ? AND content_hash IS NOT NULL AND content_hash != ?",
+            (uid, content_hash),
+        )
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,10 +1,15 @@
 import os
 import re
 import asyncio
-from bot.access_control import access_required
-import shutil
-from bot.notifier import filter_excel_by_tru, TRU_CODES
-from telegram import Update, ReplyKeyboardMarkup
+import hashlib
+import logging
+import time
+from datetime import datetime
+from bot.access_control import access_required, admin_required
+from bot.notifier import parse_plan, TRU_CODES
+from bot.plan_parser import render_plan_bytes
+from bot.artifacts import get_artifact, plan_variant, put_artifact
+from telegram import Update, ReplyKeyboardMarkup, InputFile
 from telegram.ext import (
     ContextTypes,
     CommandHandler,
@@ -12,11 +17,23 @@ from telegram.ext import (
     Application,
     filters
 )
-from bot.notifier import get_procurement_summary, download_excel_file
+from bot.notifier import download_excel_file
+from bot.check_cache import load_check_results, last_refreshed, is_stale, is_seeded, is_in_flight
+from bot.pipeline import refresh_check_results
+from bot.search_index import search_rows
+from bot.dedupe import skip_reasons
+from bot.metrics import summary_lines
+from scheduler.jobs import get_scheduler
+from config.settings import get_settings
+from filters.filter_engine import build_filter_engine, load_rules, add_rule, remove_rule, clear_rules
 from bot.users import log_user_id
+from bot.file_cache import get_cached_file_id, save_file_id, invalidate_file_id
+from telegram.error import BadRequest
 from bot.email import save_email
 from telegram.ext import ConversationHandler
 
+logger = logging.getLogger(__name__)
+
 WAITING_FOR_EMAIL = 1
 @access_required
 async def set_email_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -37,7 +54,7 @@ async def handle_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 from bot.email import get_email as get_email_for_user
-from bot.email import send_email_with_attachment
+from bot.email import send_email_with_data
 
 
 @access_required
@@ -45,7 +62,9 @@ async def handle_email_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
 
-    uid = query.data.replace("email_", "")
+    # email_<uid>:<вариант книги> — у подписчиков с разными правилами разные книги
+    artifact_key = query.data.replace("email_", "")
+    uid = artifact_key.split(":", 1)[0]
     user_id = query.from_user.id
     email = get_email_for_user(user_id)
 
@@ -53,25 +72,52 @@ async def handle_email_callback(update: Update, context: ContextTypes.DEFAULT_TY
         await query.message.reply_text("❌ Вы ещё не указали почту. Используйте команду /setemail.")
         return
 
-    raw_file = await asyncio.to_thread(download_excel_file, uid)
-    if not raw_file:
-        await query.message.reply_text("❌ Не удалось скачать файл.")
-        return
+    # Книга этого плана уже собрана при рассылке — берём готовую. Кнопка из
+    # /check варианта не знает: книгу под правила пользователя собираем заново
+    artifact = await asyncio.to_thread(get_artifact, artifact_key) if ":" in artifact_key else None
+    if artifact:
+        new_filename, file_data = artifact
+    else:
+        raw_file = await asyncio.to_thread(download_excel_file, uid)
+        if not raw_file:
+            await query.message.reply_text("❌ Не удалось скачать файл.")
+            return
+
+        # Книгу собираем по правилам этого пользователя
+        engine = build_filter_engine({user_id}, TRU_CODES, get_settings().KEYWORDS)
+        try:
+            parsed = await asyncio.to_thread(parse_plan, raw_file, engine.row_selector())
+        finally:
+            os.remove(raw_file)
+        rows = engine.match(None, parsed).get(user_id) if parsed else None
+        if not rows:
+            await query.message.reply_text("❌ В файле не найдено подходящих позиций.")
+            return
+
+        # Ключ — по набору строк, как у рассылки: у другого пользователя с
+        # другими правилами будет своя книга
+        artifact_key = f"{uid}:{plan_variant(rows)}"
+        artifact = await asyncio.to_thread(get_artifact, artifact_key)
+        if artifact:
+            new_filename, file_data = artifact
+        else:
+            new_filename = _filename_from_message(query.message.text)
+            file_data = await asyncio.to_thread(render_plan_bytes, parsed.subset(rows))
+            await asyncio.to_thread(put_artifact, artifact_key, new_filename, file_data)
 
-    filtered_file = await asyncio.to_thread(filter_excel_by_tru, raw_file, TRU_CODES, save_file=True)
-    if not filtered_file:
-        await query.message.reply_text("❌ В файле не найдено подходящих позиций.")
-        os.remove(raw_file)
-        return
+    try:
+        await asyncio.to_thread(send_email_with_data, email, new_filename, file_data, query.message.text)
+        await query.message.reply_text(f"✅ Обработанный ПЗ отправлен на {email}")
+    except Exception as e:
+        await query.message.reply_text(f"❌ Ошибка при отправке на почту: {e}")
 
-    # --- New code for renaming ---
-    # Extract customer and BIN from the message text
-    import re
 
-    match_customer = re.search(r"🏢\s+(.*)", query.message.text)
-    match_bin = re.search(r"БИН:\s*([^\n]+)", query.message.text)
-    match_type = re.search(r"\|\s*(.*?)\s*\|", query.message.text)
-    match_duration = re.search(r"📋\s*(.*?)\s*\|", query.message.text)
+def _filename_from_message(text: str) -> str:
+    # Имя файла собираем из текста уведомления: заказчик, БИН, срок и тип плана
+    match_customer = re.search(r"🏢\s+(.*)", text)
+    match_bin = re.search(r"БИН:\s*([^\n]+)", text)
+    match_type = re.search(r"\|\s*(.*?)\s*\|", text)
+    match_duration = re.search(r"📋\s*(.*?)\s*\|", text)
 
     customer = match_customer.group(1).strip() if match_customer else "Customer"
     customer_bin = match_bin.group(1).strip() if match_bin else "BIN"
@@ -81,24 +127,8 @@ async def handle_email_callback(update: Update, context: ContextTypes.DEFAULT_TY
     safe_customer = "".join(c for c in customer if c.isalnum() or c in " _-").strip().replace(" ", "_")
     safe_bin = "".join(c for c in customer_bin if c.isalnum())
 
-    new_filename = f"{safe_customer}_{safe_bin}_{duration_type}_{plan_type}.xlsx"
-    new_filepath = os.path.join(os.path.dirname(filtered_file), new_filename)
+    return f"{safe_customer}_{safe_bin}_{duration_type}_{plan_type}.xlsx"
 
-    shutil.copy(filtered_file, new_filepath)
-    # --- End new code ---
-
-    try:
-        await asyncio.to_thread(send_email_with_attachment, email, new_filepath, query.message.text)
-        await query.message.reply_text(f"✅ Обработанный ПЗ отправлен на {email}")
-    except Exception as e:
-        await query.message.reply_text(f"❌ Ошибка при отправке на почту: {e}")
-    finally:
-        if raw_file and os.path.exists(raw_file):
-            os.remove(raw_file)
-        if filtered_file and os.path.exists(filtered_file):
-            os.remove(filtered_file)
-        if new_filepath and os.path.exists(new_filepath):
-            os.remove(new_filepath)
 @access_required
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -119,8 +149,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 @access_required
 async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("🔍 Проверяю планы закупок, подождите...")
-    summaries = await asyncio.to_thread(get_procurement_summary, TRU_CODES)
+    # Отвечаем из кэша, который держит в актуальном состоянии фоновый цикл
+    if not is_seeded():
+        await update.message.reply_text("🔍 Проверяю планы закупок, подождите...")
+        await refresh_check_results(context.application)
+    elif is_stale(last_refreshed()):
+        context.application.create_task(_refresh_in_background(context.application))
+
+    summaries = load_check_results()
+    await update.message.reply_text(_freshness_text(last_refreshed()))
 
     if not summaries:
         await update.message.reply_text("🚫 Подходящих планов не найдено.")
@@ -139,6 +176,23 @@ async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=keyboard
         )
 
+async def _refresh_in_background(app):
+    try:
+        await refresh_check_results(app)
+    except Exception as e:
+        print(f"❌ Ошибка обновления /check: {e}")
+        logger.exception(f"❌ Ошибка обновления /check: {e}")
+
+def _freshness_text(refreshed_at: float | None) -> str:
+    if refreshed_at is None:
+        return "🕒 Данные ещё не обновлялись."
+    minutes = int((time.time() - refreshed_at) // 60)
+    updated = datetime.fromtimestamp(refreshed_at).strftime("%Y-%m-%d %H:%M")
+    text = f"🕒 Данные на {updated} ({minutes} мин назад)."
+    if is_in_flight("check_cycle") or is_in_flight("check_seed"):
+        text += " Идёт обновление..."
+    return text
+
 from telegram.ext import CallbackQueryHandler
 @access_required
 async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -157,39 +211,132 @@ async def handle_download_callback(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
 
     uid = query.data.replace("download_", "")
+
+    # Файл этого плана уже загружали в Telegram — отправляем по file_id
+    file_id = get_cached_file_id(uid)
+    if file_id:
+        try:
+            await context.bot.send_document(chat_id=query.message.chat_id, document=file_id)
+            return
+        except BadRequest as e:
+            print(f"⚠️ file_id для {uid} больше не действителен: {e}")
+            invalidate_file_id(uid)
+
     file_path = await asyncio.to_thread(download_excel_file, uid)
 
     if not file_path:
         await query.message.reply_text("❌ Не удалось скачать файл.")
         return
 
-    # --- New code for renaming ---
-    match_customer = re.search(r"🏢\s+(.*)", query.message.text)
-    match_bin = re.search(r"БИН:\s*([^\n]+)", query.message.text)
-    match_type = re.search(r"\|\s*(.*?)\s*\|", query.message.text)
-    match_duration = re.search(r"📋\s*(.*?)\s*\|", query.message.text)
+    new_filename = _filename_from_message(query.message.text)
 
-    customer = match_customer.group(1).strip() if match_customer else "Customer"
-    customer_bin = match_bin.group(1).strip() if match_bin else "BIN"
-    plan_type = match_type.group(1).strip().replace(" ", "_") if match_type else "UnknownType"
-    duration_type = match_duration.group(1).strip().replace(" ", "_") if match_duration else "UnknownDuration"
+    try:
+        # Отдаём файл под итоговым именем прямо из памяти, без копии на диске
+        with open(file_path, "rb") as f:
+            file_data = f.read()
+        sent = await context.bot.send_document(
+            chat_id=query.message.chat_id,
+            document=InputFile(file_data, filename=new_filename),
+        )
+        if sent.document:
+            save_file_id(uid, sent.document.file_id, hashlib.sha256(file_data).hexdigest())
+    finally:
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
 
-    safe_customer = "".join(c for c in customer if c.isalnum() or c in " _-").strip().replace(" ", "_")
-    safe_bin = "".join(c for c in customer_bin if c.isalnum())
+@access_required
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = " ".join(context.args).strip()
+    if not text:
+        await update.message.reply_text("Использование: /search <текст>, например /search видеонаблюдение")
+        return
 
-    new_filename = f"{safe_customer}_{safe_bin}_{duration_type}_{plan_type}.xlsx"
-    new_filepath = os.path.join(os.path.dirname(file_path), new_filename)
+    results = await asyncio.to_thread(search_rows, text)
+    if not results:
+        await update.message.reply_text("🔍 Ничего не найдено.")
+        return
 
-    shutil.copy(file_path, new_filepath)
-    # --- End new code ---
+    lines = [f"🔍 Найдено по запросу «{text}»:"]
+    for item in results:
+        lines.append(
+            f"\n🏢 {item['customer'] or '—'} (БИН {item['bin'] or '—'})\n"
+            f"📄 UID {item['uid']}, строка {item['row_number']}\n"
+            f"{item['snippet']}"
+        )
+    await update.message.reply_text("\n".join(lines))
+
+@admin_required
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    lines = ["📈 Метрики бота:"]
+    for name, stats in get_scheduler().stats().items():
+        lines.append(
+            f"⏰ {name}: запусков {stats.runs}, ошибок {stats.failures}, "
+            f"последний {stats.last_duration:.1f} с, средний {stats.avg_duration:.1f} с, макс {stats.max_duration:.1f} с"
+        )
+    skipped = skip_reasons(time.time() - 24 * 60 * 60)
+    if skipped:
+        lines.append("⏭ Пропуски за сутки: " + ", ".join(f"{reason} {count}" for reason, count in skipped.items()))
+    lines.extend(summary_lines() or ["Пока нет данных."])
+
+    # У Telegram лимит 4096 символов на сообщение
+    text = ""
+    for line in lines:
+        if len(text) + len(line) + 1 > 4000:
+            await update.message.reply_text(text)
+            text = ""
+        text += line + "\n"
+    if text:
+        await update.message.reply_text(text)
+
+FILTERS_HELP = (
+    "Правила: tru, bin, keyword, type, duration, amount\n"
+    "Примеры:\n"
+    "/filter_add tru 801019.000.000010\n"
+    "/filter_add tru 620*\n"
+    "/filter_add keyword информационной безопасности\n"
+    "/filter_add bin 123456789012\n"
+    "/filter_add type BASIC\n"
+    "/filter_add duration ANNUAL\n"
+    "/filter_add amount 1000000-5000000"
+)
+
+@access_required
+async def filters_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    rules = load_rules(update.effective_user.id)
+    if not rules:
+        text = f"🔎 Своих правил нет — действует фильтр по умолчанию: {', '.join(TRU_CODES)}\n\n{FILTERS_HELP}"
+    else:
+        text = "🔎 Ваши правила:\n" + "\n".join(f"• {rule.kind} {rule.value}" for rule in rules)
+    await update.message.reply_text(text)
 
+@access_required
+async def filter_add_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args) < 2:
+        await update.message.reply_text(FILTERS_HELP)
+        return
     try:
-        await context.bot.send_document(chat_id=query.message.chat_id, document=open(new_filepath, "rb"))
-    finally:
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-        if new_filepath and os.path.exists(new_filepath):
-            os.remove(new_filepath)
+        rule = add_rule(update.effective_user.id, context.args[0], " ".join(context.args[1:]))
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    await update.message.reply_text(f"✅ Правило добавлено: {rule.kind} {rule.value}")
+
+@access_required
+async def filter_del_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args) < 2:
+        await update.message.reply_text("Использование: /filter_del <тип> <значение>")
+        return
+    try:
+        removed = remove_rule(update.effective_user.id, context.args[0], " ".join(context.args[1:]))
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    await update.message.reply_text("✅ Правило удалено." if removed else "🤷 Такого правила нет.")
+
+@access_required
+async def filter_clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    clear_rules(update.effective_user.id)
+    await update.message.reply_text("✅ Правила очищены, действует фильтр по умолчанию.")
 
 from telegram.ext import ConversationHandler
 from bot.subscription import add_subscription, remove_subscription
@@ -198,6 +345,12 @@ def register_handlers(app: Application):
     app.add_handler(CommandHandler("check", check))
     app.add_handler(CommandHandler("subscribe", subscribe))       # ✅ Добавил сюда
     app.add_handler(CommandHandler("unsubscribe", unsubscribe))   # ✅ И сюда
+    app.add_handler(CommandHandler("search", search_command))
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CommandHandler("filters", filters_command))
+    app.add_handler(CommandHandler("filter_add", filter_add_command))
+    app.add_handler(CommandHandler("filter_del", filter_del_command))
+    app.add_handler(CommandHandler("filter_clear", filter_clear_command))
     app.add_handler(CallbackQueryHandler(handle_download_callback, pattern=r"^download_"))
     app.add_handler(CallbackQueryHandler(handle_email_callback, pattern=r"^email_"))
 
@@ -0,0 +1,240 @@
+# mailer.py
+#
+# Исходящая почта через очередь в SQLite. Письма ставятся в очередь и
+# отправляются фоновыми воркерами, у каждого своё постоянное SMTP-соединение:
+# один STARTTLS и логин на всю пачку писем, а не на каждое письмо.
+# Временные ошибки (обрыв, 4xx) повторяются с паузой, 5xx — окончательный отказ.
+# Письмо в отправке принадлежит воркеру до SENDING_LEASE: очередь общая для
+# всех процессов, и чужие письма в полёте не возвращаются в очередь, пока
+# аренда не истекла (процесс упал).
+
+import asyncio
+import hashlib
+import logging
+import random
+import smtplib
+import time
+
+from bot.email import build_email_message, open_smtp_connection
+from bot.metrics import EMAIL_BYTES, EMAIL_QUEUE_DEPTH, EMAILS, SMTP_SEND_SECONDS
+from bot.storage import get_connection
+from bot.work_queue import WORKER_ID
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 30.0        # сек, удваивается с каждой попыткой
+RETRY_BACKOFF_MAX = 30 * 60
+POLL_INTERVAL = 5.0         # как часто воркеры заглядывают в очередь без сигнала
+SENT_RETENTION = 7 * 24 * 60 * 60
+SENDING_LEASE = 15 * 60     # с запасом на таймауты SMTP и переподключение
+
+
+def enqueue_email(to_email: str, body: str, attachment_name: str | None = None,
+                  attachment: bytes | None = None) -> int:
+    """Ставит письмо в очередь. Одинаковые вложения хранятся в базе один раз."""
+    attachment_hash = None
+    conn = get_connection()
+    with conn:
+        if attachment is not None:
+            attachment_hash = hashlib.sha256(attachment).hexdigest()
+            conn.execute(
+                "INSERT OR IGNORE INTO email_attachments (content_hash, data) VALUES (?, ?)",
+                (attachment_hash, attachment),
+            )
+        cursor = conn.execute(
+            "INSERT INTO email_queue (to_email, body, attachment_name, attachment_hash, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (to_email, body, attachment_name, attachment_hash, time.time()),
+        )
+    _wake_workers()
+    return cursor.lastrowid
+
+
+def _claim_next() -> tuple | None:
+    # Берём готовое к отправке письмо или письмо упавшего процесса (аренда истекла)
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT q.id, q.to_email, q.body, q.attachment_name, a.data, q.attempts "
+            "FROM email_queue q LEFT JOIN email_attachments a ON a.content_hash = q.attachment_hash "
+            "WHERE (q.status = 'pending' AND q.next_attempt_at <= ?) "
+            "OR (q.status = 'sending' AND COALESCE(q.lease_expires_at, 0) < ?) "
+            "ORDER BY q.next_attempt_at, q.id LIMIT 1",
+            (now, now),
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE email_queue SET status = 'sending', worker = ?, lease_expires_at = ? WHERE id = ?",
+                (WORKER_ID, now + SENDING_LEASE, row[0]),
+            )
+    return row
+
+
+def _finish(job_id: int, status: str, attempts: int, error: str | None = None, next_attempt_at: float = 0):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE email_queue SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, "
+            "worker = NULL, lease_expires_at = NULL WHERE id = ? AND worker = ?",
+            (status, attempts, error, next_attempt_at, job_id, WORKER_ID),
+        )
+        if status == "sent":
+            # Вложение больше никому не нужно — чистим
+            conn.execute(
+                "DELETE FROM email_attachments WHERE content_hash NOT IN "
+                "(SELECT attachment_hash FROM email_queue WHERE status IN ('pending', 'sending') "
+                "AND attachment_hash IS NOT NULL)"
+            )
+
+
+def queue_depth() -> dict[str, int]:
+    rows = get_connection().execute(
+        "SELECT status, COUNT(*) FROM email_queue WHERE status != 'sent' GROUP BY status"
+    ).fetchall()
+    return dict(rows)
+
+
+EMAIL_QUEUE_DEPTH.set_function(queue_depth, label="status")
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+class SmtpConnection:
+    """Постоянное соединение одного воркера; переподключается после простоя или обрыва"""
+
+    def __init__(self, idle_timeout: float):
+        self.idle_timeout = idle_timeout
+        self.server: smtplib.SMTP | None = None
+        self.last_used = 0.0
+
+    def _alive(self) -> bool:
+        if self.server is None:
+            return False
+        if time.monotonic() - self.last_used < self.idle_timeout:
+            return True
+        # Долго молчали — сервер мог закрыть соединение, проверяем NOOP
+        try:
+            return self.server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                self.server.close()
+            self.server = None
+
+    def send(self, msg):
+        if not self._alive():
+            self.close()
+            self.server = open_smtp_connection()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Соединение оборвалось между письмами — одна попытка с новым
+            self.close()
+            self.server = open_smtp_connection()
+            self.server.send_message(msg)
+        self.last_used = time.monotonic()
+
+
+class MailService:
+    def __init__(self, workers: int | None = None):
+        settings = get_settings()
+        self.workers = workers or settings.EMAIL_WORKERS
+        self.idle_timeout = settings.SMTP_IDLE_TIMEOUT
+        self.wakeup = asyncio.Event()
+        self.tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        # Письма, которые отправлялись в момент падения, воркеры заберут сами,
+        # когда истечёт аренда: их могут отправлять другие процессы
+        conn = get_connection()
+        with conn:
+            conn.execute("DELETE FROM email_queue WHERE status = 'sent' AND created_at < ?",
+                         (time.time() - SENT_RETENTION,))
+        self.tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"📮 Почтовая очередь запущена, воркеров: {self.workers}")
+        logger.info(f"📮 Почтовая очередь запущена, воркеров: {self.workers}")
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def _worker(self, index: int):
+        connection = SmtpConnection(self.idle_timeout)
+        try:
+            while True:
+                job = await asyncio.to_thread(_claim_next)
+                if job is None:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._send(connection, job)
+        finally:
+            await asyncio.to_thread(connection.close)
+
+    async def _send(self, connection: SmtpConnection, job: tuple):
+        job_id, to_email, body, attachment_name, attachment, attempts = job
+        attempts += 1
+        try:
+            msg = build_email_message(to_email, body, attachment_name or "plan.xlsx", attachment or b"")
+            EMAIL_BYTES.observe(len(attachment or b""))
+            with SMTP_SEND_SECONDS.time(mode="queue"):
+                await asyncio.to_thread(connection.send, msg)
+        except Exception as e:
+            await asyncio.to_thread(connection.close)
+            if _is_transient(e) and attempts < MAX_ATTEMPTS:
+                EMAILS.inc(outcome="retry")
+                delay = min(RETRY_BACKOFF * 2 ** (attempts - 1), RETRY_BACKOFF_MAX)
+                delay += random.uniform(0, delay / 4)
+                logger.warning(f"🔁 Email {to_email}: {e}, повтор через {delay:.0f} с")
+                await asyncio.to_thread(_finish, job_id, "pending", attempts, str(e), time.time() + delay)
+            else:
+                EMAILS.inc(outcome="failed")
+                print(f"❌ Ошибка при отправке email {to_email}: {e}")
+                logger.error(f"❌ Ошибка при отправке email {to_email}: {e}")
+                await asyncio.to_thread(_finish, job_id, "failed", attempts, str(e))
+            return
+
+        EMAILS.inc(outcome="sent")
+        await asyncio.to_thread(_finish, job_id, "sent", attempts)
+        print(f"📧 Email отправлен на {to_email}")
+        logger.info(f"📧 Email отправлен на {to_email}")
+
+
+_service: MailService | None = None
+
+
+def get_mail_service() -> MailService:
+    global _service
+    if _service is None:
+        _service = MailService()
+    return _service
+
+
+def _wake_workers():
+    if _service is None:
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return  # вызвали из потока — воркеры подхватят письмо по таймеру
+    _service.wakeup.set()
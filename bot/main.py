@@ -1,31 +1,17 @@
 import asyncio
-import nest_asyncio
-from bot.email import get_email as get_email_for_user, send_email_with_attachment
-from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-from datetime import datetime
-from telegram.ext import ApplicationBuilder, MessageHandler, filters
+import signal
+from telegram import Update
+from telegram.ext import ApplicationBuilder
 from bot.handlers import register_handlers
+from bot.pipeline import run_check_cycle, shutdown_parse_pool
+from bot.mailer import get_mail_service
+from bot.metrics import start_metrics_server
+from bot.webhook import WebhookServer
 from config.settings import get_settings
-from bot.subscription import load_subscriptions
-from bot.notifier import (
-    download_excel_file,
-    filter_excel_by_tru,
-    TRU_CODES,
-    DURATION_TYPE_MAP,
-    TYPE_MAP,
-    load_notified_uids,
-    save_notified_uids,
-    extract_tru_rows,
-    load_tru_history,
-    save_tru_history
-)
-from data_sources.test_api_fetch import fetch_procurement_plans
-import os
-import shutil
+from data_sources.registry import close_sources
+from scheduler.jobs import AdaptiveInterval, get_scheduler
 import logging
 
-nest_asyncio.apply()
-
 # Настройка логирования
 LOG_FILE = "logs/bot.log"
 logging.basicConfig(
@@ -42,131 +28,66 @@ logger = logging.getLogger(__name__)
 logger.info("Бот запущен!")
 
 
-async def periodic_check(app):
-    while True:
-        await asyncio.sleep(1800) 
-        print("⏰ Автоматическая проверка закупок...")
-        logger.info("⏰ Автоматическая проверка закупок...")
-
-        plans = await asyncio.to_thread(fetch_procurement_plans)
-        notified_uids = load_notified_uids()
-        tru_history = load_tru_history()  # 👈 Загружаем историю ТРУ
-        new_uids = set()
-
-        for plan in plans:
-            uid = plan.get("excelFileUid")
-            if not uid or uid in notified_uids:
-                continue
-
-            print(f"🆕 Проверка UID: {uid}")
-            logger.info(f"🆕 Проверка UID: {uid}")
-            
-            file_path = await asyncio.to_thread(download_excel_file, uid)
-            if not file_path:
-                continue
-
-            filtered_path = await asyncio.to_thread(filter_excel_by_tru, file_path, TRU_CODES)
-            os.remove(file_path)
-
-            if not filtered_path:
-                new_uids.add(uid)
-                continue
-
-            # 👇 Новая логика: сравниваем строки ТРУ
-            customer_bin = plan.get("customerIdentifier", "UNKNOWN")
-            tru_rows = await asyncio.to_thread(extract_tru_rows, filtered_path)
-
-            if not tru_rows:
-                new_uids.add(uid)
-                os.remove(filtered_path)
-                continue
-
-            previous_rows = set(tru_history.get(customer_bin, []))
-            new_rows = [row for row in tru_rows if row not in previous_rows]
-
-            if not new_rows:
-                print(f"🔁 Нет новых ТРУ строк для БИН {customer_bin}")
-                logger.info(f"🔁 Нет подходящих данных для UID: {uid}")
-                new_uids.add(uid)
-                os.remove(filtered_path)
-                continue
-
-            # Обновляем историю
-            tru_history[customer_bin] = list(previous_rows.union(tru_rows))
-            save_tru_history(tru_history)
-
-            # 📩 Сообщение
-            raw_date = plan.get("approveDate")
-            date_time = datetime.fromtimestamp(raw_date / 1000).strftime("%Y-%m-%d %H:%M") if raw_date else "—"
-            customer = plan.get("customerName", "—")
-            year = plan.get("year", "—")
-            duration_type = DURATION_TYPE_MAP.get(plan.get("planDurationType", "—"), "—")
-            plan_type = TYPE_MAP.get(plan.get("planType", "—"), "—")
-
-            message = (
-                f"🏢  {customer}\n"
-                f"🆔  БИН: {customer_bin}\n"
-                f"📅  {date_time}\n"
-                f"📋  {duration_type} | {plan_type} | {year}\n"
-                f"🛡️  ТРУ: Услуги по обеспечению информационной безопасности.\n"
-                f"🌐  Источник: zakup.sk.kz\n"
-            )
-
-            for user_id in load_subscriptions():
-                try:
-                    user = await app.bot.get_chat(user_id)
-                    if not user:
-                        continue
-
-                    keyboard = InlineKeyboardMarkup([
-                        [
-                            InlineKeyboardButton("📥 Скачать ПЗ", callback_data=f"download_{uid}"),
-                            InlineKeyboardButton("✉️ Отправить на почту", callback_data=f"email_{uid}")
-                        ]
-                    ])
-
-                    await app.bot.send_message(
-                        chat_id=user_id,
-                        text=message,
-                        reply_markup=keyboard,
-                        parse_mode="Markdown"
-                    )
-                    print(f"✅ Уведомление отправлено пользователю {user_id}")
-                    logger.info(f"✅ Уведомление отправлено пользователю {user_id}")
-
-                    email = get_email_for_user(user_id)
-                    if email:
-                        safe_customer = "".join(c for c in customer if c.isalnum() or c in " _-").strip().replace(" ", "_")
-                        safe_bin = "".join(c for c in customer_bin if c.isalnum())
-                        safe_duration = duration_type.replace(" ", "_") if duration_type else "Unknown"
-                        safe_type = plan_type.replace(" ", "_") if plan_type else "Unknown"
-
-                        new_filename = f"{safe_customer}_{safe_bin}_{safe_duration}_{safe_type}.xlsx"
-                        new_filepath = os.path.join(os.path.dirname(filtered_path), new_filename)
-        
-
-                        shutil.copy(filtered_path, new_filepath)
-
-                        try:
-                            await asyncio.to_thread(send_email_with_attachment, email, new_filepath, message)
-                            print(f"📧 Email отправлен на {email}")
-                            logger.info(f"📧 Email отправлен на {email}")
-                        except Exception as e:
-                            print(f"❌ Ошибка при отправке email {email}: {e}")
-                            logger.error(f"❌ Ошибка при отправке email {email}: {e}")
-                        finally:
-                            if os.path.exists(new_filepath):
-                                os.remove(new_filepath)
-                except Exception as e:
-                    print(f"❌ Ошибка отправки пользователю {user_id}: {e}")
-                    logger.error(f"❌ Ошибка отправки пользователю {user_id}: {e}")
-
-            new_uids.add(uid)
-            os.remove(filtered_path)
-
-        if new_uids:
-            notified_uids.update(new_uids)
-            save_notified_uids(notified_uids)
+def schedule_jobs(app):
+    settings = get_settings()
+    scheduler = get_scheduler()
+    scheduler.add_job(
+        "check_cycle",
+        lambda: run_check_cycle(app),
+        AdaptiveInterval(settings.CHECK_INTERVAL, settings.CHECK_INTERVAL_MIN, settings.CHECK_INTERVAL_MAX),
+        jitter=settings.CHECK_JITTER,
+        run_on_start=settings.CHECK_RUN_ON_START,
+        found_new=lambda notified: notified > 0,
+    )
+    return scheduler
+
+
+def _stop_event() -> asyncio.Event:
+    # SIGINT/SIGTERM → штатная остановка; на Windows сигналов в loop нет, там Ctrl+C
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    return stop
+
+
+async def start_updates(app, settings) -> WebhookServer | None:
+    """Приём обновлений: long polling или вебхук (BOT_MODE)"""
+    if settings.BOT_MODE == "polling":
+        await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        return None
+    if settings.BOT_MODE == "worker":
+        # Обновления принимает основной бот, здесь только проверка планов
+        return None
+    if settings.BOT_MODE != "webhook":
+        raise ValueError(f"❌ Неизвестный BOT_MODE: {settings.BOT_MODE} (polling, webhook или worker)")
+
+    webhook = WebhookServer(app, settings.WEBHOOK_PATH, settings.WEBHOOK_SECRET)
+    await webhook.start(settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+    if settings.WEBHOOK_URL:
+        await app.bot.set_webhook(
+            settings.WEBHOOK_URL,
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=max(1, min(settings.UPDATE_CONCURRENCY, 100)),
+        )
+        print(f"🪝 Вебхук зарегистрирован: {settings.WEBHOOK_URL}")
+        logger.info(f"🪝 Вебхук зарегистрирован: {settings.WEBHOOK_URL}")
+    return webhook
+
+
+async def _start_metrics(settings):
+    # Несколько воркеров на одной машине — каждому свой METRICS_PORT; без метрик бот работает
+    try:
+        return await start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT)
+    except OSError as e:
+        print(f"⚠️ Метрики не запущены ({settings.METRICS_HOST}:{settings.METRICS_PORT}): {e}")
+        logger.warning(f"⚠️ Метрики не запущены ({settings.METRICS_HOST}:{settings.METRICS_PORT}): {e}")
+        return None
+
 
 async def run_bot():
     print("✅ Бот запущен.")
@@ -177,18 +98,54 @@ async def run_bot():
         raise ValueError("❌ BOT_TOKEN не задан в .env или окружении.")
     
 
-    app = ApplicationBuilder().token(settings.BOT_TOKEN).build()
+    builder = ApplicationBuilder().token(settings.BOT_TOKEN).concurrent_updates(settings.UPDATE_CONCURRENCY)
+    if settings.BOT_MODE in ("webhook", "worker"):
+        # Без getUpdates: обновления приходят в наш сервер или не нужны вовсе
+        builder = builder.updater(None)
+    if settings.TELEGRAM_API_URL:
+        builder = (builder.base_url(f"{settings.TELEGRAM_API_URL}/bot")
+                   .base_file_url(f"{settings.TELEGRAM_API_URL}/file/bot"))
+    app = builder.build()
     register_handlers(app)
 
-    # 🔁 Запускаем фоновую проверку
-    asyncio.create_task(periodic_check(app))
+    # Application живёт в нашем event loop: без run_polling и nest_asyncio
+    await app.initialize()
+    await app.start()
+    stop = _stop_event()
 
-    await app.run_polling(close_loop=False)
+    mail_service = get_mail_service()
+    scheduler = schedule_jobs(app)
+    metrics_server = None
+    webhook = None
+    try:
+        # 📮 Почтовая очередь и 🔁 фоновая проверка
+        await mail_service.start()
+        scheduler.start()
+        if settings.METRICS_PORT:
+            metrics_server = await _start_metrics(settings)
+        webhook = await start_updates(app, settings)
+        print(f"📡 Приём обновлений: {settings.BOT_MODE}")
+        logger.info(f"📡 Приём обновлений: {settings.BOT_MODE}")
+        await stop.wait()
+    finally:
+        # Вебхук в Telegram не снимаем: его могут обслуживать другие реплики
+        if webhook is not None:
+            await webhook.stop()
+        if app.updater is not None and app.updater.running:
+            await app.updater.stop()
+        if metrics_server is not None:
+            metrics_server.close()
+        # Цикл проверки и почта ещё пользуются app.bot — сначала они
+        await scheduler.stop()
+        await mail_service.stop()
+        await app.stop()
+        await app.shutdown()
+        await close_sources()
+        shutdown_parse_pool()
 
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
     try:
-        loop.run_until_complete(run_bot())
+        asyncio.run(run_bot())
     except KeyboardInterrupt:
         print("⛔ Бот остановлен пользователем.")
         logger.info("⛔ Бот остановлен пользователем.")
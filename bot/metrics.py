@@ -0,0 +1,302 @@
+# metrics.py
+#
+# Метрики процесса бота: счётчики, gauge и гистограммы задержек с метками.
+# Отдаются в текстовом формате Prometheus (start_metrics_server) и сводкой
+# в /stats. Реестр общий на процесс и потокобезопасный — метрики пишут и
+# event loop, и потоки asyncio.to_thread.
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7)
+ROWS_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 50_000, 100_000)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self.values.items()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self.values: dict[tuple, float] = {}
+        self.function = None
+        self.function_label = None
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def set_function(self, function, label: str | None = None):
+        """
+        Значение считается при каждом чтении: function() → число,
+        или {значение метки label: число}, если label задан
+        """
+        self.function = function
+        self.function_label = label
+
+    def current(self) -> dict[tuple, float]:
+        if self.function is None:
+            with self.lock:
+                return dict(self.values)
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось посчитать {self.name}: {e}")
+            return {}
+        if self.function_label is None:
+            return {(): value}
+        return {_label_key({self.function_label: label_value}): v for label_value, v in value.items()}
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self.current().items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # метки → [счётчики по корзинам, сумма, количество, максимум]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0, 0.0]
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][idx] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+            series[3] = max(series[3], value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def summary(self) -> dict[tuple, dict]:
+        """Для /stats: количество, среднее, p95 (по корзинам) и максимум"""
+        result = {}
+        with self.lock:
+            for key, (counts, total, count, maximum) in self.series.items():
+                p95 = maximum
+                running = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    running += bucket_count
+                    if running >= 0.95 * count:
+                        p95 = min(bound, maximum)
+                        break
+                result[key] = {"count": count, "avg": total / count if count else 0.0, "p95": p95, "max": maximum}
+        return result
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self.lock:
+            for key, (counts, total, count, _) in self.series.items():
+                running = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    running += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {running}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Метрики по стадиям ---
+
+API_REQUEST_SECONDS = REGISTRY.histogram("zakup_api_request_seconds", "Latency of zakup.sk.kz API page requests")
+API_BYTES = REGISTRY.counter("zakup_api_bytes_total", "Bytes received from zakup.sk.kz API")
+API_ERRORS = REGISTRY.counter("zakup_api_errors_total", "Failed zakup.sk.kz API attempts by status")
+FETCH_SECONDS = REGISTRY.histogram("fetch_plans_seconds", "Time to fetch all plan pages of a cycle")
+FETCH_PLANS = REGISTRY.counter("fetch_plans_total", "Plans returned by the API")
+
+DOWNLOAD_SECONDS = REGISTRY.histogram("plan_download_seconds", "Latency of plan workbook downloads")
+DOWNLOAD_BYTES = REGISTRY.histogram("plan_download_bytes", "Size of downloaded plan workbooks", BYTES_BUCKETS)
+DOWNLOAD_ERRORS = REGISTRY.counter("plan_download_errors_total", "Failed plan workbook downloads")
+
+PARSE_SECONDS = REGISTRY.histogram("plan_parse_seconds", "Time to parse a plan workbook")
+PARSE_ROWS = REGISTRY.histogram("plan_rows", "Rows per parsed plan workbook", ROWS_BUCKETS)
+PARSE_MATCHED_ROWS = REGISTRY.histogram("plan_matched_rows", "Matched TRU rows per plan", ROWS_BUCKETS)
+PARSE_ERRORS = REGISTRY.counter("plan_parse_errors_total", "Plan workbooks that failed to parse")
+
+STAGE_SECONDS = REGISTRY.histogram("pipeline_stage_seconds", "Time spent per item in each pipeline stage")
+STAGE_ERRORS = REGISTRY.counter("pipeline_stage_errors_total", "Unhandled errors per pipeline stage")
+QUEUE_DEPTH = REGISTRY.gauge("pipeline_queue_depth", "Items waiting in each pipeline stage queue")
+CYCLE_SECONDS = REGISTRY.histogram("check_cycle_seconds", "Duration of a full check cycle")
+PLANS_NOTIFIED = REGISTRY.counter("plans_notified_total", "Plans that were broadcast to subscribers")
+PLANS_SKIPPED = REGISTRY.counter("plans_skipped_total", "Plans skipped by reason")
+
+TELEGRAM_SEND_SECONDS = REGISTRY.histogram("telegram_send_seconds", "Latency of Bot API send calls")
+TELEGRAM_MESSAGES = REGISTRY.counter("telegram_messages_total", "Broadcast outcomes per chat")
+TELEGRAM_ERRORS = REGISTRY.counter("telegram_errors_total", "Bot API errors by type")
+BROADCAST_SECONDS = REGISTRY.histogram("broadcast_seconds", "Time to fan out one plan to all recipients")
+
+SMTP_SEND_SECONDS = REGISTRY.histogram("smtp_send_seconds", "Latency of SMTP sends")
+EMAIL_BYTES = REGISTRY.histogram("email_attachment_bytes", "Size of email attachments", BYTES_BUCKETS)
+EMAILS = REGISTRY.counter("emails_total", "Email send outcomes")
+EMAIL_QUEUE_DEPTH = REGISTRY.gauge("email_queue_depth", "Emails by status in the outgoing queue")
+
+WEBHOOK_REQUESTS = REGISTRY.counter("webhook_requests_total", "Webhook requests by outcome")
+
+WORK_ITEMS = REGISTRY.gauge("work_items", "Plans in the shared work queue by status")
+WORK_LEASES_EXPIRED = REGISTRY.counter("work_leases_expired_total", "Plan leases taken over from a stalled worker")
+
+
+def observe_parse(seconds: float, parsed, mode: str = "full"):
+    """Время разбора и размеры плана; parsed=None — файл не разобрался"""
+    PARSE_SECONDS.observe(seconds, mode=mode)
+    if parsed is None:
+        PARSE_ERRORS.inc()
+        return
+    PARSE_ROWS.observe(parsed.row_count)
+    PARSE_MATCHED_ROWS.observe(len(parsed.matched_rows))
+
+
+def _format_number(value: float) -> str:
+    return f"{value:.3g}" if isinstance(value, float) else str(value)
+
+
+def summary_lines() -> list[str]:
+    """Короткая сводка всех метрик для /stats"""
+    lines = []
+    with REGISTRY.lock:
+        metrics = list(REGISTRY.metrics.values())
+    for metric in metrics:
+        if isinstance(metric, Histogram):
+            for key, stats in metric.summary().items():
+                lines.append(
+                    f"{metric.name}{_format_labels(key)}: n={stats['count']} "
+                    f"avg={_format_number(stats['avg'])} p95≈{_format_number(stats['p95'])} "
+                    f"max={_format_number(stats['max'])}"
+                )
+        else:
+            values = metric.current() if isinstance(metric, Gauge) else dict(metric.values)
+            for key, value in values.items():
+                lines.append(f"{metric.name}{_format_labels(key)}: {_format_number(value)}")
+    return lines
+
+
+# --- HTTP-эндпоинт для Prometheus ---
+
+async def _handle_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 10)
+        # Заголовки запроса не нужны, но их надо дочитать
+        while (await asyncio.wait_for(reader.readline(), 10)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            body = REGISTRY.render().encode("utf-8")
+            status = "200 OK"
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, status, content_type = b"not found\n", "404 Not Found", "text/plain"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.AbstractServer:
+    server = await asyncio.start_server(_handle_metrics, host, port)
+    print(f"📈 Метрики: http://{host}:{port}/metrics")
+    logger.info(f"📈 Метрики: http://{host}:{port}/metrics")
+    return server
@@ -2,14 +2,15 @@
 
 import os
 import re
-import json
-import requests
+import time
 from datetime import datetime
-from data_sources.test_api_fetch import fetch_procurement_plans
-from openpyxl import load_workbook, Workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.worksheet.worksheet import Worksheet
-from copy import copy
+from data_sources.registry import source_for_uid
+from data_sources.zakupsk import fetch_procurement_plans
+from bot.excel_scan import has_tru_rows
+from bot.plan_parser import ParsedPlan, parse_plan, render_plan_workbook
+from bot.storage import get_connection
+from bot.tru_tracker import find_new_rows, record_rows
+from bot.metrics import PARSE_SECONDS, observe_parse
 
 # Маппинг
 DURATION_TYPE_MAP = {
@@ -25,79 +26,80 @@ TYPE_MAP = {
 
 TRU_CODES = ["801019.000.000010"]
 
-DOWNLOAD_DIR = "storage/downloads"
-NOTIFIED_FILE = "storage/notified_uids.json"
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-os.makedirs("storage", exist_ok=True)
+def download_plan_file(uid: str) -> tuple[str, str] | None:
+    """Файл плана любого источника на диске и его sha256: (путь, хеш) или None"""
+    return source_for_uid(uid).download({"excelFileUid": uid})
 
 def download_excel_file(uid: str) -> str | None:
-    url = f"https://zakup.sk.kz/eprocfilestorage/open-api/files/download/{uid}"
-    local_path = os.path.join(DOWNLOAD_DIR, f"{uid}.xlsx")
-
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        with open(local_path, "wb") as f:
-            f.write(response.content)
-        return local_path
-    except Exception as e:
-        print(f"❌ Ошибка при скачивании Excel-файла {uid}: {e}")
-        return None
+    downloaded = download_plan_file(uid)
+    return downloaded[0] if downloaded else None
 
 def filter_excel_by_tru(filepath: str, tru_codes: list[str], save_file: bool = True) -> str | bool | None:
     try:
-        wb = load_workbook(filepath)
-        ws = wb.active
-
-        output_path = filepath.replace(".xlsx", "_filtered.xlsx")
-        new_wb = Workbook()
-        new_ws = new_wb.active
-        new_ws.title = "Filtered"
-
-        for row_idx in range(1, 11):
-            for col_idx, cell in enumerate(ws[row_idx], 1):
-                new_cell = new_ws.cell(row=row_idx, column=col_idx, value=cell.value)
-                new_cell.font = copy(cell.font)
-                new_cell.alignment = copy(cell.alignment)
-                new_cell.border = copy(cell.border)
-                new_cell.fill = copy(cell.fill)
-                new_cell.number_format = copy(cell.number_format)
-
-        for merged_range in ws.merged_cells.ranges:
-            if merged_range.max_row <= 10:
-                new_ws.merge_cells(str(merged_range))
-
-        for col_idx in range(1, ws.max_column + 1):
-            letter = get_column_letter(col_idx)
-            if ws.column_dimensions[letter].width:
-                new_ws.column_dimensions[letter].width = ws.column_dimensions[letter].width
-
-        insert_row = 11
-        for row in ws.iter_rows(min_row=11):
-            row_values = [str(cell.value) for cell in row]
-            if any(tru in val for tru in tru_codes for val in row_values):
-                for col_idx, cell in enumerate(row, 1):
-                    new_cell = new_ws.cell(row=insert_row, column=col_idx, value=cell.value)
-                    new_cell.font = copy(cell.font)
-                    new_cell.alignment = copy(cell.alignment)
-                    new_cell.border = copy(cell.border)
-                    new_cell.fill = copy(cell.fill)
-                    new_cell.number_format = copy(cell.number_format)
-                insert_row += 1
-
-        if insert_row == 11:
+        # Нужен только ответ да/нет — читаем до первого совпадения
+        if not save_file:
+            with PARSE_SECONDS.time(mode="probe"):
+                return True if has_tru_rows(filepath, tru_codes) else None
+
+        started = time.perf_counter()
+        parsed = parse_plan(filepath, tru_codes)
+        observe_parse(time.perf_counter() - started, parsed)
+        if not parsed or not parsed.matched_rows:
             return None
 
-        if save_file:
-            new_wb.save(output_path)
-            return output_path
-
-        return True
+        return render_plan_workbook(parsed, filepath.replace(".xlsx", "_filtered.xlsx"))
 
     except Exception as e:
         print(f"❌ Ошибка при фильтрации: {e}")
         return None
 
+MESSAGE_MAX_CODES = 5
+
+
+def _tru_line(parsed: ParsedPlan) -> str:
+    # Строка про ТРУ — по строкам, которые нашлись именно для этого получателя
+    codes = parsed.tru_codes()
+    rows = f"позиций: {len(parsed.matched_rows)}"
+    if not codes:
+        return f"🛡️  ТРУ: {rows}\n"
+    shown = ", ".join(codes[:MESSAGE_MAX_CODES])
+    if len(codes) > MESSAGE_MAX_CODES:
+        shown += f" и ещё {len(codes) - MESSAGE_MAX_CODES}"
+    return f"🛡️  ТРУ: {shown} ({rows})\n"
+
+
+def build_plan_message(plan: dict, parsed: ParsedPlan | None = None) -> str:
+    """parsed — найденные строки для получателя; без него строка про ТРУ не пишется"""
+    raw_date = plan.get("approveDate")
+    date_time = datetime.fromtimestamp(raw_date / 1000).strftime("%Y-%m-%d %H:%M") if raw_date else "—"
+    customer = plan.get("customerName", "—")
+    customer_bin = plan.get("customerIdentifier", "—")
+    year = plan.get("year", "—")
+    duration_type = DURATION_TYPE_MAP.get(plan.get("planDurationType", "—"), "—")
+    plan_type = TYPE_MAP.get(plan.get("planType", "—"), "—")
+
+    return (
+        f"🏢  {customer}\n"
+        f"🆔  БИН: {customer_bin}\n"
+        f"📅  {date_time}\n"
+        f"📋  {duration_type} | {plan_type} | {year}\n"
+        f"{_tru_line(parsed) if parsed else ''}"
+        f"🌐  Источник: {plan.get('source', 'zakup.sk.kz')}\n"
+    )
+
+def build_plan_filename(plan: dict) -> str:
+    customer = plan.get("customerName", "—")
+    customer_bin = plan.get("customerIdentifier", "UNKNOWN")
+    duration_type = DURATION_TYPE_MAP.get(plan.get("planDurationType", "—"), "—")
+    plan_type = TYPE_MAP.get(plan.get("planType", "—"), "—")
+
+    safe_customer = "".join(c for c in customer if c.isalnum() or c in " _-").strip().replace(" ", "_")
+    safe_bin = "".join(c for c in customer_bin if c.isalnum())
+    safe_duration = duration_type.replace(" ", "_") if duration_type else "Unknown"
+    safe_type = plan_type.replace(" ", "_") if plan_type else "Unknown"
+
+    return f"{safe_customer}_{safe_bin}_{safe_duration}_{safe_type}.xlsx"
+
 def get_procurement_summary(tru_codes: list[str]) -> list[dict]:
     plans = fetch_procurement_plans()
     messages = []
@@ -108,72 +110,69 @@ def get_procurement_summary(tru_codes: list[str]) -> list[dict]:
             continue
 
         file_path = download_excel_file(uid)
-        filtered_path = filter_excel_by_tru(file_path, tru_codes)
+        if not file_path:
+            continue
+
+        # Для сводки достаточно знать, есть ли ТРУ — файл не сохраняем
+        has_tru = filter_excel_by_tru(file_path, tru_codes, save_file=False)
 
         # Если не найдено нужного ТРУ — пропускаем
-        if not filtered_path:
+        if not has_tru:
             os.remove(file_path)
             continue
 
-        # Данные для сообщения
-        raw_date = plan.get("approveDate")
-        date_time = datetime.fromtimestamp(raw_date / 1000).strftime("%Y-%m-%d %H:%M") if raw_date else "—"
-        customer = plan.get("customerName", "—")
-        customer_bin = plan.get("customerIdentifier", "—")
-        year = plan.get("year", "—")
-        duration_type = DURATION_TYPE_MAP.get(plan.get("planDurationType", "—"), "—")
-        plan_type = TYPE_MAP.get(plan.get("planType", "—"), "—")
-
-        message = (
-            f"🏢  {customer}\n"
-            f"🆔  БИН: {customer_bin}\n"
-            f"📅  {date_time}\n"
-            f"📋  {duration_type} | {plan_type} | {year}\n"
-            f"🛡️  ТРУ: Услуги по обеспечению информационной безопасности.\n"
-            f"🌐  Источник: zakup.sk.kz\n"
-        )
-
-        messages.append({"text": message, "uid": uid})
+        message = build_plan_message(plan)
+
+        messages.append({"text": message, "uid": uid, "approveDate": plan.get("approveDate")})
 
         os.remove(file_path)
-        if filtered_path and os.path.exists(filtered_path):
-            os.remove(filtered_path)
 
     return messages
 
 def load_notified_uids() -> set:
-    if not os.path.exists(NOTIFIED_FILE):
-        return set()
-    with open(NOTIFIED_FILE, "r", encoding="utf-8") as f:
-        return set(json.load(f))
+    rows = get_connection().execute("SELECT uid FROM notified_uids").fetchall()
+    return {uid for (uid,) in rows}
 
 def save_notified_uids(uids: set):
-    with open(NOTIFIED_FILE, "w", encoding="utf-8") as f:
-        json.dump(list(uids), f, indent=2)
+    add_notified_uids(uids)
+
+def add_notified_uids(uids):
+    conn = get_connection()
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO notified_uids (uid) VALUES (?)", [(uid,) for uid in uids])
+
+def is_notified(uid: str) -> bool:
+    row = get_connection().execute("SELECT 1 FROM notified_uids WHERE uid = ?", (uid,)).fetchone()
+    return row is not None
+
+def notified_among(uids) -> set:
+    """Какие из uids уже обработаны — одним запросом на пачку"""
+    uids = list(uids)
+    notified = set()
+    conn = get_connection()
+    for start in range(0, len(uids), 500):
+        chunk = uids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        notified.update(uid for (uid,) in conn.execute(
+            f"SELECT uid FROM notified_uids WHERE uid IN ({placeholders})", chunk))
+    return notified
 
 
 def extract_tru_rows(filepath: str) -> list[str]:
-    try:
-        wb = load_workbook(filepath)
-        ws = wb.active
-        rows = []
-        for row in ws.iter_rows(min_row=11, values_only=True):
-            row_values = [str(cell) if cell is not None else "" for cell in row]
-            row_text = " | ".join(row_values).strip()
-            if any(tru in row_text for tru in TRU_CODES):
-                rows.append(row_text)
-        return rows
-    except Exception as e:
-        print(f"❌ Error extracting TРУ rows: {e}")
-        return []
-TRU_STORAGE_FILE = "storage/tru_rows.json"
-
-def load_tru_history() -> dict[str, list[str]]:
-    if not os.path.exists(TRU_STORAGE_FILE):
-        return {}
-    with open(TRU_STORAGE_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    # Если файл уже разобран через parse_plan — берите parsed.row_texts
+    started = time.perf_counter()
+    parsed = parse_plan(filepath, TRU_CODES)
+    observe_parse(time.perf_counter() - started, parsed)
+    return parsed.row_texts if parsed else []
+
+def load_tru_history(rows_by_bin: dict[str, list[str]]) -> dict[str, list[str]]:
+    """Какие из строк уже есть в истории БИН — точечными запросами, без загрузки всей истории"""
+    known = {}
+    for customer_bin, rows in rows_by_bin.items():
+        new_rows = set(find_new_rows(customer_bin, rows))
+        known[customer_bin] = [row for row in rows if row not in new_rows]
+    return known
 
 def save_tru_history(data: dict[str, list[str]]):
-    with open(TRU_STORAGE_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    for customer_bin, rows in data.items():
+        record_rows(customer_bin, rows)
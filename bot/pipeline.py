@@ -0,0 +1,534 @@
+# pipeline.py
+#
+# Цикл проверки как конвейер: fetch → download → parse → diff → notify.
+# Все источники планов (data_sources.registry) опрашиваются одновременно,
+# найденные планы ложатся в общую очередь в базе (bot.work_queue), а конвейер
+# берёт их оттуда в аренду — так несколько воркеров делят одну очередь.
+# Стадии связаны ограниченными asyncio.Queue, у каждой своя степень
+# параллельности. Разбор Excel (чистый CPU) уходит в ProcessPoolExecutor,
+# чтобы не упираться в GIL.
+
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+
+from bot.email import get_email as get_email_for_user
+from bot.mailer import enqueue_email, get_mail_service
+from bot.metrics import (
+    BROADCAST_SECONDS,
+    CYCLE_SECONDS,
+    PLANS_NOTIFIED,
+    PLANS_SKIPPED,
+    QUEUE_DEPTH,
+    STAGE_ERRORS,
+    STAGE_SECONDS,
+    observe_parse,
+)
+from bot import work_queue
+from bot.archive import parse_and_archive
+from bot.artifacts import get_artifact, put_artifact, plan_variant, prune_artifacts
+from bot.broadcast import get_broadcaster
+from bot.check_cache import (single_flight, record_check_result, mark_refreshed, mark_seeded, is_seeded,
+                             prune_check_results)
+from bot.subscription import load_subscriptions
+from bot.dedupe import (
+    rows_hash,
+    find_same_file,
+    find_same_rows,
+    record_outcome,
+    OUTCOME_NOTIFIED,
+    OUTCOME_SKIPPED,
+    REASON_SAME_FILE,
+    REASON_SAME_ROWS,
+    REASON_NO_TRU,
+    REASON_NO_NEW_ROWS,
+    REASON_NO_SUBSCRIBERS,
+)
+from bot.notifier import (
+    get_procurement_summary,
+    build_plan_message,
+    build_plan_filename,
+    TRU_CODES,
+    notified_among,
+)
+from bot.plan_parser import render_plan_bytes, row_fingerprint
+from bot.search_index import prune_search_index
+from bot.storage import compact
+from bot.tru_tracker import find_new_rows, record_rows
+from config.settings import get_settings
+from filters.filter_engine import build_filter_engine
+from scheduler.jobs import get_scheduler
+from data_sources.registry import get_sources, source_for_plan
+
+logger = logging.getLogger(__name__)
+
+PLAN_YEAR = 2025
+
+_STOP = object()  # маркер конца потока для стадий
+FETCH_LEASE = "fetch"
+CLAIM_POLL_INTERVAL = 0.5   # сек: как часто заглядывать в очередь, пока идёт опрос источников
+_parse_pool: ProcessPoolExecutor | None = None
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        # spawn: дочерние процессы не наследуют потоки и event loop бота
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=get_settings().PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(cancel_futures=True)
+        _parse_pool = None
+
+
+async def _run_stage(name: str, in_queue: asyncio.Queue, out_queue: asyncio.Queue | None,
+                     handler, concurrency: int):
+    async def worker():
+        while True:
+            item = await in_queue.get()
+            QUEUE_DEPTH.set(in_queue.qsize(), stage=name)
+            if item is _STOP:
+                # Возвращаем маркер, чтобы его увидели соседние воркеры
+                await in_queue.put(_STOP)
+                return
+            try:
+                with STAGE_SECONDS.time(stage=name):
+                    result = await handler(item)
+            except Exception as e:
+                STAGE_ERRORS.inc(stage=name)
+                print(f"❌ Ошибка на стадии {name}: {e}")
+                logger.exception(f"❌ Ошибка на стадии {name}: {e}")
+                continue
+            if result is not None and out_queue is not None:
+                await out_queue.put(result)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    if out_queue is not None:
+        await out_queue.put(_STOP)
+
+
+class CheckCycle:
+    """Один проход проверки закупок с общим состоянием для всех стадий"""
+
+    def __init__(self, app):
+        self.app = app
+        self.settings = get_settings()
+        self.notified_plans = 0
+        self.engine = None
+        self.selector = None
+        self.content_hashes: dict[str, str] = {}   # uid → sha256 файла
+        self.files_in_cycle: dict[tuple, str] = {}  # (sha256, БИН) → uid, что уже идёт по конвейеру
+        self.rows_hashes: dict[str, str] = {}      # uid → хеш найденных строк
+        self.skipped: dict[str, int] = {}
+        self.held: set[str] = set()                # UID, взятые этим воркером в аренду
+        self.fetching = False
+
+    # Всё, что пишет в общую базу, — через asyncio.to_thread: запись может ждать
+    # блокировку до таймаута SQLite, а event loop в это время продлевает аренду
+    # и принимает обновления Telegram
+
+    async def _done(self, uid: str):
+        await asyncio.to_thread(work_queue.complete, uid)
+        self.held.discard(uid)
+
+    async def _retry(self, uid: str, error: str):
+        await asyncio.to_thread(work_queue.retry, uid, error)
+        self.held.discard(uid)
+
+    async def skip(self, plan: dict, reason: str, detail: str = "", hash_of_rows: str | None = None):
+        uid = plan["excelFileUid"]
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+        PLANS_SKIPPED.inc(reason=reason)
+        await asyncio.to_thread(record_outcome, uid, self.content_hashes.get(uid, ""), OUTCOME_SKIPPED, reason,
+                                customer_bin=plan.get("customerIdentifier", "UNKNOWN"), hash_of_rows=hash_of_rows)
+        await self._done(uid)
+        logger.info(f"⏭ UID {uid} пропущен: {reason} {detail}".rstrip())
+
+    async def download(self, plan: dict):
+        uid = plan["excelFileUid"]
+        print(f"🆕 Проверка UID: {uid}")
+        logger.info(f"🆕 Проверка UID: {uid}")
+
+        downloaded = await asyncio.to_thread(source_for_plan(plan).download, plan)
+        if not downloaded:
+            # Не скачался — вернём в очередь, его возьмёт следующий цикл или другой воркер
+            await self._retry(uid, "download failed")
+            return None
+        file_path, content_hash = downloaded
+        self.content_hashes[uid] = content_hash
+
+        # Байт в байт тот же файл, что уже разбирали, — разбор не нужен
+        customer_bin = plan.get("customerIdentifier", "UNKNOWN")
+        # Место в files_in_cycle занимаем до запроса к базе: параллельная загрузка
+        # того же файла увидит его, пока мы ждём ответа
+        same_as = self.files_in_cycle.setdefault((content_hash, customer_bin), uid)
+        if same_as == uid:
+            same_as = await asyncio.to_thread(find_same_file, content_hash, customer_bin, uid)
+        if same_as:
+            os.remove(file_path)
+            await self.skip(plan, REASON_SAME_FILE, f"(как {same_as})")
+            return None
+        await asyncio.to_thread(work_queue.save_checkpoint, uid, work_queue.STAGE_DOWNLOADED,
+                                {"file_path": file_path, "content_hash": content_hash})
+        return plan, file_path
+
+    async def parse(self, item):
+        plan, file_path = item
+        loop = asyncio.get_running_loop()
+        try:
+            # Файл разбираем один раз — дальше работаем только с ParsedPlan
+            # Тем же проходом все строки листа уходят в колоночный архив
+            started = time.perf_counter()
+            parsed = await loop.run_in_executor(get_parse_pool(), parse_and_archive,
+                                                file_path, self.selector, plan)
+            observe_parse(time.perf_counter() - started, parsed)
+        finally:
+            os.remove(file_path)
+
+        if not parsed:
+            await self._done(plan["excelFileUid"])
+            return None
+        if not parsed.matched_rows:
+            await self.skip(plan, REASON_NO_TRU)
+            return None
+
+        # Для /check важен сам факт подходящих ТРУ, а не новизна строк
+        await asyncio.to_thread(record_check_result, plan["excelFileUid"],
+                                build_plan_message(plan, parsed), plan.get("approveDate"))
+        uid = plan["excelFileUid"]
+        await asyncio.to_thread(work_queue.save_checkpoint, uid, work_queue.STAGE_PARSED,
+                                {"parsed": parsed, "content_hash": self.content_hashes.get(uid, "")})
+        return plan, parsed
+
+    async def diff(self, item):
+        plan, parsed = item
+        uid = plan["excelFileUid"]
+
+        # 👇 Сравниваем строки ТРУ с историей по БИН заказчика
+        customer_bin = plan.get("customerIdentifier", "UNKNOWN")
+        tru_rows = parsed.row_texts
+
+        # Тот же набор строк ТРУ, что у уже обработанного плана заказчика, — дальше не идём
+        hash_of_rows = rows_hash(parsed.fingerprints)
+        same_as = await asyncio.to_thread(find_same_rows, customer_bin, hash_of_rows, uid)
+        if same_as:
+            await self.skip(plan, REASON_SAME_ROWS, f"(как {same_as})", hash_of_rows=hash_of_rows)
+            return None
+
+        new_rows = await asyncio.to_thread(find_new_rows, customer_bin, tru_rows)
+
+        if not new_rows:
+            print(f"🔁 Нет новых ТРУ строк для БИН {customer_bin}")
+            await self.skip(plan, REASON_NO_NEW_ROWS, hash_of_rows=hash_of_rows)
+            return None
+
+        # Один проход по индексам правил: кому из подписчиков какие новые строки
+        new_fingerprints = {row_fingerprint(row_text) for row_text in new_rows}
+        new_indices = [idx for idx, fp in enumerate(parsed.fingerprints) if fp in new_fingerprints]
+        matches = self.engine.match(plan, parsed, new_indices)
+        if not matches:
+            await asyncio.to_thread(record_rows, customer_bin, new_rows)
+            await self.skip(plan, REASON_NO_SUBSCRIBERS, hash_of_rows=hash_of_rows)
+            return None
+
+        # Подписчики с одинаковым набором строк получают одну и ту же книгу
+        groups: dict[tuple, list[int]] = {}
+        for user_id, indices in matches.items():
+            groups.setdefault(tuple(indices), []).append(user_id)
+
+        loop = asyncio.get_running_loop()
+        file_name = build_plan_filename(plan)
+        variants = []
+        variant_rows = []
+        for indices, user_ids in groups.items():
+            # Книга собирается один раз в памяти и дальше идёт всем получателям как есть
+            rows = parsed.subset(list(indices))
+            data = await loop.run_in_executor(get_parse_pool(), render_plan_bytes, rows)
+            variant = plan_variant(indices)
+            await asyncio.to_thread(put_artifact, f"{uid}:{variant}", file_name, data)
+            variants.append((variant, user_ids, data, rows))
+            variant_rows.append((variant, user_ids, list(indices)))
+        self.rows_hashes[uid] = hash_of_rows
+
+        # Сначала контрольная точка, потом история: после сбоя между ними план
+        # продолжится с рассылки и допишет историю, а не потеряет новые строки
+        await asyncio.to_thread(work_queue.save_checkpoint, uid, work_queue.STAGE_DIFFED, {
+            "content_hash": self.content_hashes.get(uid, ""),
+            "rows_hash": hash_of_rows,
+            "new_rows": new_rows,
+            "file_name": file_name,
+            # Разобранный план и строки вариантов — чтобы пересобрать книгу, если её уже нет
+            "parsed": parsed,
+            "variants": variant_rows,
+        })
+        # Обновляем историю — дописываем только отпечатки новых строк
+        await asyncio.to_thread(record_rows, customer_bin, new_rows)
+        return plan, file_name, variants
+
+    async def notify(self, item):
+        plan, file_name, variants = item
+        uid = plan["excelFileUid"]
+
+        for variant, user_ids, data, rows in variants:
+            # В тексте — коды ТРУ из строк этого варианта, а не всего плана
+            message = build_plan_message(plan, rows)
+            await self._notify_variant(uid, message, file_name, variant, user_ids, data)
+
+        await asyncio.to_thread(record_outcome, uid, self.content_hashes.get(uid, ""), OUTCOME_NOTIFIED,
+                                customer_bin=plan.get("customerIdentifier", "UNKNOWN"),
+                                hash_of_rows=self.rows_hashes.get(uid))
+        await self._done(uid)
+        self.notified_plans += 1
+        PLANS_NOTIFIED.inc()
+
+    async def _notify_variant(self, uid: str, message: str, file_name: str, variant: str,
+                              user_ids: list[int], data: bytes):
+        keyboard = InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton("📥 Скачать ПЗ", callback_data=f"download_{uid}"),
+                InlineKeyboardButton("✉️ Отправить на почту", callback_data=f"email_{uid}:{variant}")
+            ]
+        ])
+
+        # Кому план уже ушёл (в том числе до перезапуска или с другого воркера), не шлём
+        user_ids = await asyncio.to_thread(work_queue.undelivered, uid, user_ids)
+        emails = []
+
+        # Запросы к базе — в потоках: на общей базе они ждут блокировку записи,
+        # а event loop тем временем продлевает аренду и принимает обновления
+        async def claim(user_id: int) -> bool:
+            # Отметка «отправляю» до запроса; отказ — уже отправлено или шлёт другой воркер
+            return await asyncio.to_thread(work_queue.claim_delivery, uid, user_id)
+
+        async def send(user_id: int):
+            await self.app.bot.send_message(
+                chat_id=user_id,
+                text=message,
+                reply_markup=keyboard,
+                parse_mode="Markdown"
+            )
+            await asyncio.to_thread(work_queue.finish_delivery, uid, user_id, True)
+            # Письма уходят через очередь и не держат рассылку в Telegram
+            email = await asyncio.to_thread(get_email_for_user, user_id)
+            if email:
+                await asyncio.to_thread(enqueue_email, email, message, file_name, data)
+                emails.append(email)
+
+        with BROADCAST_SECONDS.time():
+            result = await get_broadcaster().broadcast(user_ids, send, claim)
+        # Неудачу отмечаем по итогу, а не на каждой попытке: пока идут повторы,
+        # отметка «отправляю» не даёт другому воркеру взять того же получателя
+        for user_id in result.failed + result.removed:
+            await asyncio.to_thread(work_queue.finish_delivery, uid, user_id, False)
+        print(f"✅ UID {uid}: уведомлений {len(result.sent)}, ошибок {len(result.failed)}, "
+              f"удалено подписок {len(result.removed)}, уже доставлено {len(result.skipped)}")
+        logger.info(f"✅ UID {uid}: уведомлений {len(result.sent)}, ошибок {len(result.failed)}, "
+                    f"удалено подписок {len(result.removed)}, уже доставлено {len(result.skipped)}")
+        if emails:
+            # Письма ставились из потоков — будим почтовые воркеры, не дожидаясь их таймера
+            get_mail_service().wakeup.set()
+            print(f"📮 UID {uid}: писем в очереди {len(emails)}")
+            logger.info(f"📮 UID {uid}: писем в очереди {len(emails)}")
+
+    async def _resume(self, plan: dict, parse_queue: asyncio.Queue, diff_queue: asyncio.Queue,
+                      notify_queue: asyncio.Queue) -> bool:
+        """План с контрольной точкой (воркер упал или перезапустился) продолжаем с неё"""
+        uid = plan["excelFileUid"]
+        checkpoint = await asyncio.to_thread(work_queue.load_checkpoint, uid)
+        if checkpoint is None:
+            return False
+        stage, state = checkpoint
+        self.content_hashes[uid] = state.get("content_hash", "")
+
+        if stage == work_queue.STAGE_DIFFED:
+            variants = []
+            for variant, user_ids, indices in state["variants"]:
+                rows = state["parsed"].subset(indices)
+                artifact = await asyncio.to_thread(get_artifact, f"{uid}:{variant}")
+                if artifact is not None:
+                    data = artifact[1]
+                else:
+                    # Книги уже нет на диске — собираем заново из разобранного плана
+                    loop = asyncio.get_running_loop()
+                    data = await loop.run_in_executor(get_parse_pool(), render_plan_bytes, rows)
+                    await asyncio.to_thread(put_artifact, f"{uid}:{variant}", state["file_name"], data)
+                variants.append((variant, user_ids, data, rows))
+            # Повторная запись истории безвредна: INSERT OR IGNORE
+            await asyncio.to_thread(record_rows, plan.get("customerIdentifier", "UNKNOWN"), state["new_rows"])
+            self.rows_hashes[uid] = state["rows_hash"]
+            await notify_queue.put((plan, state["file_name"], variants))
+        elif stage == work_queue.STAGE_PARSED:
+            await diff_queue.put((plan, state["parsed"]))
+        elif stage == work_queue.STAGE_DOWNLOADED and os.path.exists(state["file_path"]):
+            await parse_queue.put((plan, state["file_path"]))
+        else:
+            return False
+
+        print(f"▶️ UID {uid}: продолжаем с контрольной точки «{stage}»")
+        logger.info(f"▶️ UID {uid}: продолжаем с контрольной точки «{stage}»")
+        return True
+
+    async def run(self):
+        with CYCLE_SECONDS.time():
+            return await self._run()
+
+    async def _fetch_source(self, source, seen: set):
+        try:
+            plans, next_cursor = await source.fetch_new(PLAN_YEAR)
+        except Exception as e:
+            # Упавший источник не останавливает остальные; его курсор не сдвигается
+            print(f"❌ Источник {source.name} недоступен: {e}")
+            logger.exception(f"❌ Источник {source.name} недоступен: {e}")
+            return
+        notified = await asyncio.to_thread(notified_among, [plan.get("excelFileUid") for plan in plans])
+        fresh = []
+        for plan in plans:
+            uid = plan.get("excelFileUid")
+            if not uid or uid in seen or uid in notified:
+                continue
+            seen.add(uid)
+            fresh.append(plan)
+        added = await asyncio.to_thread(work_queue.enqueue, fresh)
+        # Планы уже в очереди в базе — курсор можно сдвигать, не дожидаясь конца цикла
+        await asyncio.to_thread(source.save_cursor, PLAN_YEAR, next_cursor)
+        if added:
+            print(f"📥 {source.name}: в очередь {added} планов")
+            logger.info(f"📥 {source.name}: в очередь {added} планов")
+
+    async def _fetch_all(self):
+        # Источники опрашивает один воркер за раз, остальные тем временем разбирают очередь
+        if not await asyncio.to_thread(work_queue.acquire_lease, FETCH_LEASE):
+            logger.info("📡 Источники опрашивает другой воркер")
+            return
+        self.fetching = True
+        try:
+            seen = set()
+            await asyncio.gather(*(self._fetch_source(source, seen) for source in get_sources()))
+        finally:
+            self.fetching = False
+            await asyncio.to_thread(work_queue.release_lease, FETCH_LEASE)
+
+    async def _heartbeat(self):
+        # Продлеваем аренду всего, что держим, пока цикл жив
+        while True:
+            await asyncio.sleep(work_queue.lease_seconds() / 3)
+            await asyncio.to_thread(work_queue.renew, list(self.held))
+            if self.fetching:
+                await asyncio.to_thread(work_queue.acquire_lease, FETCH_LEASE)
+
+    async def _run(self):
+        # Правила подписчиков компилируются один раз на цикл
+        self.engine = await asyncio.to_thread(
+            lambda: build_filter_engine(load_subscriptions(), TRU_CODES, self.settings.KEYWORDS))
+        self.selector = self.engine.row_selector()
+
+        queue_size = self.settings.PIPELINE_QUEUE_SIZE
+        download_queue = asyncio.Queue(maxsize=queue_size)
+        parse_queue = asyncio.Queue(maxsize=queue_size)
+        diff_queue = asyncio.Queue(maxsize=queue_size)
+        notify_queue = asyncio.Queue(maxsize=queue_size)
+        fetched = asyncio.Event()
+
+        async def fetch():
+            try:
+                await self._fetch_all()
+            finally:
+                fetched.set()
+
+        async def produce():
+            # Планы берутся в аренду по одному, когда в конвейере есть место, —
+            # остаток очереди достаётся другим воркерам
+            while True:
+                # Пока источники опрашивает другой воркер, очередь ещё пополняется
+                fetch_finished = fetched.is_set() and not await asyncio.to_thread(
+                    work_queue.lease_active, FETCH_LEASE)
+                plans = await asyncio.to_thread(work_queue.claim, 1)
+                for plan in plans:
+                    self.held.add(plan["excelFileUid"])
+                    if not await self._resume(plan, parse_queue, diff_queue, notify_queue):
+                        await download_queue.put(plan)
+                if plans:
+                    continue
+                if fetch_finished:
+                    break
+                if fetched.is_set():
+                    await asyncio.sleep(CLAIM_POLL_INTERVAL)
+                    continue
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(fetched.wait(), CLAIM_POLL_INTERVAL)
+            await download_queue.put(_STOP)
+
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            await asyncio.gather(
+                fetch(),
+                produce(),
+                _run_stage("download", download_queue, parse_queue, self.download,
+                           self.settings.DOWNLOAD_CONCURRENCY),
+                _run_stage("parse", parse_queue, diff_queue, self.parse,
+                           self.settings.PARSE_WORKERS),
+                # История ТРУ общая — сравнение строго в одну очередь
+                _run_stage("diff", diff_queue, notify_queue, self.diff, 1),
+                _run_stage("notify", notify_queue, None, self.notify,
+                           self.settings.NOTIFY_CONCURRENCY),
+            )
+        finally:
+            heartbeat.cancel()
+            # Что не дошло до конца (ошибка на стадии) — обратно в очередь, а не ждать истечения аренды
+            for uid in list(self.held):
+                await self._retry(uid, "cycle ended before the plan was finished")
+
+        if self.skipped:
+            logger.info(f"⏭ Пропущено планов по причинам: {self.skipped}")
+        await asyncio.to_thread(prune_artifacts)
+        await asyncio.to_thread(work_queue.prune)
+        await asyncio.to_thread(prune_check_results)
+        await asyncio.to_thread(prune_search_index)
+        await asyncio.to_thread(compact)
+        await asyncio.to_thread(mark_refreshed)
+        return self.notified_plans
+
+
+async def run_check_cycle(app) -> int:
+    """
+    Запускает один цикл проверки; возвращает число разосланных планов.
+    Если цикл уже идёт (по таймеру или из /check), ждём его, а не запускаем второй.
+    """
+    return await single_flight("check_cycle", lambda: CheckCycle(app).run())
+
+
+def _store_seed(summaries: list[dict]):
+    for item in summaries:
+        record_check_result(item["uid"], item["text"], item.get("approveDate"))
+    mark_seeded()
+    mark_refreshed()
+
+
+async def _seed_check_results() -> int:
+    summaries = await asyncio.to_thread(get_procurement_summary, TRU_CODES)
+    await asyncio.to_thread(_store_seed, summaries)
+    return len(summaries)
+
+
+async def refresh_check_results(app):
+    """Обновляет кэш /check: первый раз полной проверкой, дальше обычным циклом"""
+    if not is_seeded():
+        await single_flight("check_seed", _seed_check_results)
+    elif "check_cycle" in get_scheduler().jobs:
+        # Через планировщик: внеплановый запуск заодно сдвигает расписание
+        await get_scheduler().run_now("check_cycle")
+    else:
+        await run_check_cycle(app)
@@ -0,0 +1,181 @@
+# plan_parser.py
+#
+# Один проход по файлу плана: всё, что нужно для сравнения с историей,
+# сообщения и отфильтрованной книги, собирается в ParsedPlan.
+
+import hashlib
+import io
+from copy import copy
+from dataclasses import dataclass, field, replace
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from bot.excel_scan import (
+    HEADER_ROWS,
+    open_plan_sheet,
+    row_to_text,
+    read_sheet_layout,
+)
+from bot.tru_matcher import CODE_VALUE_RE, TruMatcher, compile_tru_matcher
+
+DEFAULT_COLUMN_WIDTH = 13
+
+# Стиль ячейки: (font, alignment, border, fill, number_format) или None
+CellStyle = tuple | None
+
+
+@dataclass
+class ParsedPlan:
+    header_rows: list[tuple] = field(default_factory=list)
+    header_styles: list[list[CellStyle]] = field(default_factory=list)
+    matched_rows: list[tuple] = field(default_factory=list)
+    matched_styles: list[list[CellStyle]] = field(default_factory=list)
+    row_texts: list[str] = field(default_factory=list)
+    column_widths: dict[str, float] = field(default_factory=dict)
+    merged_ranges: list[str] = field(default_factory=list)
+    max_column: int = 0
+    code_column: int | None = None  # колонка с кодом ТРУ (с нуля), если нашлась в шапке
+    row_count: int = 0              # сколько строк данных просмотрено
+
+    @property
+    def fingerprints(self) -> list[int]:
+        return [row_fingerprint(text) for text in self.row_texts]
+
+    def tru_codes(self) -> list[str]:
+        """Коды ТРУ найденных строк по колонке кода, без повторов и в порядке строк"""
+        if self.code_column is None:
+            return []
+        codes = {}
+        for row in self.matched_rows:
+            value = row[self.code_column] if self.code_column < len(row) else None
+            match = CODE_VALUE_RE.match(str(value).strip()) if value is not None else None
+            if match:
+                codes.setdefault(match.group(0), None)
+        return list(codes)
+
+    def subset(self, row_indices: list[int]) -> "ParsedPlan":
+        """Тот же план только с указанными найденными строками — для книги конкретного подписчика"""
+        return replace(
+            self,
+            matched_rows=[self.matched_rows[idx] for idx in row_indices],
+            matched_styles=[self.matched_styles[idx] for idx in row_indices],
+            row_texts=[self.row_texts[idx] for idx in row_indices],
+        )
+
+
+def normalize_row_text(row_text: str) -> str:
+    return " ".join(row_text.split())
+
+
+def row_fingerprint(row_text: str) -> int:
+    """
+    Стабильный отпечаток строки ТРУ: первые 8 байт sha1 от нормализованного
+    текста как знаковое 64-битное число — ложится в INTEGER-колонку SQLite.
+    """
+    digest = hashlib.sha1(normalize_row_text(row_text).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def _cell_style(cell) -> CellStyle:
+    if not getattr(cell, "has_style", False):
+        return None  # пустые ячейки read_only листа стилей не имеют
+    return (cell.font, cell.alignment, cell.border, cell.fill, cell.number_format)
+
+
+def _read_row(row) -> tuple[tuple, list[CellStyle]]:
+    return tuple(cell.value for cell in row), [_cell_style(cell) for cell in row]
+
+
+def parse_plan(filepath: str, tru_codes: list[str] | TruMatcher, row_sink=None) -> ParsedPlan | None:
+    """
+    Разбирает файл плана за один проход. None — если файл не читается.
+    row_sink (например, bot.archive.ArchiveWriter) получает все строки листа тем же проходом.
+    """
+    matcher = compile_tru_matcher(tru_codes)
+    try:
+        wb, ws = open_plan_sheet(filepath)
+    except Exception as e:
+        print(f"❌ Ошибка при разборе плана {filepath}: {e}")
+        return None
+
+    try:
+        parsed = ParsedPlan()
+
+        for row in ws.iter_rows(min_row=1, max_row=HEADER_ROWS):
+            values, styles = _read_row(row)
+            parsed.header_rows.append(values)
+            parsed.header_styles.append(styles)
+
+        parsed.code_column = matcher.detect_code_column(parsed.header_rows)
+        if row_sink is not None:
+            row_sink.begin(parsed.header_rows, parsed.code_column)
+
+        for row in ws.iter_rows(min_row=HEADER_ROWS + 1):
+            values = tuple(cell.value for cell in row)
+            parsed.row_count += 1
+            matched = matcher.row_matches(values, parsed.code_column)
+            if row_sink is not None:
+                row_sink.add(values, matched)
+            if not matched:
+                continue
+            # Стили собираем только для найденных строк
+            parsed.matched_rows.append(values)
+            parsed.matched_styles.append([_cell_style(cell) for cell in row])
+            parsed.row_texts.append(row_to_text(values))
+
+        # Раскладка листа нужна только для отрисовки найденных строк
+        if parsed.matched_rows:
+            parsed.column_widths, parsed.merged_ranges = read_sheet_layout(filepath, ws)
+
+        parsed.max_column = max((len(row) for row in parsed.header_rows + parsed.matched_rows), default=0)
+        return parsed
+    except Exception as e:
+        print(f"❌ Ошибка при разборе плана {filepath}: {e}")
+        return None
+    finally:
+        wb.close()
+
+
+def _write_row(new_ws, row_idx: int, values: tuple, styles: list[CellStyle]):
+    for col_idx, (value, style) in enumerate(zip(values, styles), 1):
+        new_cell = new_ws.cell(row=row_idx, column=col_idx, value=value)
+        if style is None:
+            continue
+        font, alignment, border, fill, number_format = style
+        new_cell.font = copy(font)
+        new_cell.alignment = copy(alignment)
+        new_cell.border = copy(border)
+        new_cell.fill = copy(fill)
+        new_cell.number_format = number_format
+
+
+def render_plan_bytes(parsed: ParsedPlan) -> bytes:
+    """То же, что render_plan_workbook, но книга собирается в памяти"""
+    buffer = io.BytesIO()
+    render_plan_workbook(parsed, buffer)
+    return buffer.getvalue()
+
+
+def render_plan_workbook(parsed: ParsedPlan, output_path):
+    """Собирает отфильтрованную книгу: шапка из 10 строк + найденные строки ТРУ"""
+    new_wb = Workbook()
+    new_ws = new_wb.active
+    new_ws.title = "Filtered"
+
+    for row_idx, (values, styles) in enumerate(zip(parsed.header_rows, parsed.header_styles), 1):
+        _write_row(new_ws, row_idx, values, styles)
+
+    for row_idx, (values, styles) in enumerate(zip(parsed.matched_rows, parsed.matched_styles), HEADER_ROWS + 1):
+        _write_row(new_ws, row_idx, values, styles)
+
+    for merged_range in parsed.merged_ranges:
+        new_ws.merge_cells(merged_range)
+
+    # Колонки без явной ширины получают дефолтную ширину openpyxl, как и раньше
+    for col_idx in range(1, new_ws.max_column + 1):
+        letter = get_column_letter(col_idx)
+        new_ws.column_dimensions[letter].width = parsed.column_widths.get(letter, DEFAULT_COLUMN_WIDTH)
+
+    new_wb.save(output_path)
+    return output_path
@@ -0,0 +1,158 @@
+# search_index.py
+#
+# Полнотекстовый поиск по строкам планов для /search — SQLite FTS5.
+# Строки попадают в индекс тем же проходом разбора, что и в архив
+# (см. bot.archive.parse_and_archive). rowid строки в индексе — это
+# id плана << 20 | номер строки, поэтому перевыпущенный план заменяется
+# удалением по диапазону rowid, без полного просмотра индекса.
+#
+# Индекс живёт в отдельном файле рядом с основной базой: строк в нём на порядки
+# больше, а пишут его процессы разбора — блокировка записи основной базы
+# (аренды, доставки) им не нужна. Планы старше SEARCH_RETENTION удаляются
+# в конце цикла, как кэш /check и книги.
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from bot.excel_scan import HEADER_ROWS, row_to_text
+from bot.storage import DB_PATH
+
+SEARCH_DB_PATH = os.getenv("ZAKUPBOT_SEARCH_DB") or os.path.join(os.path.dirname(DB_PATH) or ".", "search.db")
+
+ROW_BITS = 20                 # до миллиона строк на план
+BATCH_ROWS = 5_000
+MAX_RESULTS = 10
+SEARCH_RETENTION = 90 * 24 * 60 * 60  # сек, как у кэша /check
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_plans (
+    id INTEGER PRIMARY KEY,
+    uid TEXT NOT NULL UNIQUE,
+    customer_name TEXT,
+    customer_bin TEXT,
+    approve_date INTEGER,
+    indexed_at REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS plan_rows_fts USING fts5(
+    row_text,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """Соединение с базой индекса на поток, как bot.storage.get_connection"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(SEARCH_DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def _plan_rowid_range(plan_id: int) -> tuple[int, int]:
+    return plan_id << ROW_BITS, ((plan_id + 1) << ROW_BITS) - 1
+
+
+class SearchIndexWriter:
+    """Приёмник строк для parse_plan: пишет строки плана в FTS-индекс пачками"""
+
+    def __init__(self, plan: dict):
+        self.plan = plan
+        self.uid = plan["excelFileUid"]
+        self.plan_id = None
+        self.row_number = 0
+        self.batch = []
+
+    def begin(self, header_rows: list[tuple], code_column: int | None):
+        conn = get_connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO search_plans (uid, customer_name, customer_bin, approve_date, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(uid) DO UPDATE SET "
+                "customer_name = excluded.customer_name, customer_bin = excluded.customer_bin, "
+                "approve_date = excluded.approve_date, indexed_at = excluded.indexed_at",
+                (self.uid, self.plan.get("customerName"), self.plan.get("customerIdentifier"),
+                 self.plan.get("approveDate"), time.time()),
+            )
+            self.plan_id = conn.execute("SELECT id FROM search_plans WHERE uid = ?", (self.uid,)).fetchone()[0]
+            # План перевыпустили — старые строки убираем
+            conn.execute("DELETE FROM plan_rows_fts WHERE rowid BETWEEN ? AND ?", _plan_rowid_range(self.plan_id))
+
+    def add(self, values: tuple, matched: bool):
+        self.row_number += 1
+        if self.row_number >= 1 << ROW_BITS or all(value is None for value in values):
+            return
+        self.batch.append(((self.plan_id << ROW_BITS) | self.row_number, row_to_text(values)))
+        if len(self.batch) >= BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if not self.batch:
+            return
+        conn = get_connection()
+        with conn:
+            conn.executemany("INSERT INTO plan_rows_fts (rowid, row_text) VALUES (?, ?)", self.batch)
+        self.batch = []
+
+    def finish(self):
+        self._flush()
+
+    def abort(self):
+        self.batch = []
+        if self.plan_id is None:
+            return
+        conn = get_connection()
+        with conn:
+            conn.execute("DELETE FROM plan_rows_fts WHERE rowid BETWEEN ? AND ?", _plan_rowid_range(self.plan_id))
+            conn.execute("DELETE FROM search_plans WHERE id = ?", (self.plan_id,))
+
+
+def build_match_query(text: str) -> str | None:
+    """Каждое слово — префиксный поиск: 'безопасн' найдёт 'безопасности'"""
+    tokens = TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search_rows(text: str, limit: int = MAX_RESULTS) -> list[dict]:
+    """Лучшие по bm25 строки с UID плана, заказчиком и фрагментом текста"""
+    query = build_match_query(text)
+    if not query:
+        return []
+    rows = get_connection().execute(
+        "SELECT p.uid, p.customer_name, p.customer_bin, p.approve_date, f.rowid & ?, "
+        "snippet(plan_rows_fts, 0, '«', '»', '…', 16) "
+        "FROM plan_rows_fts f JOIN search_plans p ON p.id = (f.rowid >> ?) "
+        "WHERE plan_rows_fts MATCH ? ORDER BY bm25(plan_rows_fts) LIMIT ?",
+        ((1 << ROW_BITS) - 1, ROW_BITS, query, limit),
+    ).fetchall()
+    return [
+        {"uid": uid, "customer": customer, "bin": customer_bin, "approveDate": approve_date,
+         "row_number": row_number + HEADER_ROWS, "snippet": snippet}
+        for uid, customer, customer_bin, approve_date, row_number, snippet in rows
+    ]
+
+
+def prune_search_index(max_age: float = SEARCH_RETENTION) -> int:
+    """Удаляет из индекса планы, утверждённые раньше max_age; возвращает их число"""
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        plan_ids = [plan_id for (plan_id,) in conn.execute(
+            "SELECT id FROM search_plans WHERE NOT COALESCE(approve_date >= ?, indexed_at >= ?)",
+            (int((now - max_age) * 1000), now - max_age),
+        )]
+        for plan_id in plan_ids:
+            conn.execute("DELETE FROM plan_rows_fts WHERE rowid BETWEEN ? AND ?", _plan_rowid_range(plan_id))
+        conn.executemany("DELETE FROM search_plans WHERE id = ?", [(plan_id,) for plan_id in plan_ids])
+    return len(plan_ids)
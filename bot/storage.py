@@ -0,0 +1,235 @@
+# storage.py
+#
+# Единое хранилище состояния бота — SQLite в режиме WAL.
+# Раньше каждая сущность жила в своём JSON в storage/ и перечитывалась
+# целиком на каждый вызов; при первом подключении эти файлы переносятся в базу.
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from bot.plan_parser import row_fingerprint
+
+DB_PATH = os.getenv("ZAKUPBOT_DB", "storage/zakupbot.db")
+os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+
+# Старые JSON-файлы, которые переносим в базу один раз
+LEGACY_SUBS_FILE = "storage/subscribed.json"
+LEGACY_EMAILS_FILE = "storage/emails.json"
+LEGACY_NOTIFIED_FILE = "storage/notified_uids.json"
+LEGACY_TRU_FILE = "storage/tru_rows.json"
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS emails (
+    user_id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notified_uids (
+    uid TEXT PRIMARY KEY,
+    notified_at REAL DEFAULT (strftime('%s', 'now'))
+);
+CREATE TABLE IF NOT EXISTS document_cache (
+    uid TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    content_hash TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS filter_rules (
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (user_id, kind, value)
+);
+CREATE TABLE IF NOT EXISTS check_results (
+    uid TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    approve_date INTEGER,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS plan_artifacts (
+    uid TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    created_at REAL
+);
+CREATE TABLE IF NOT EXISTS email_attachments (
+    content_hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS email_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    to_email TEXT NOT NULL,
+    body TEXT NOT NULL,
+    attachment_name TEXT,
+    attachment_hash TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    worker TEXT,
+    lease_expires_at REAL,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS email_queue_due ON email_queue (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS plan_dedupe (
+    uid TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    rows_hash TEXT,
+    customer_bin TEXT,
+    outcome TEXT NOT NULL,
+    reason TEXT,
+    processed_at REAL
+);
+CREATE INDEX IF NOT EXISTS plan_dedupe_content ON plan_dedupe (content_hash, customer_bin);
+CREATE INDEX IF NOT EXISTS plan_dedupe_rows ON plan_dedupe (customer_bin, rows_hash);
+CREATE TABLE IF NOT EXISTS tru_history (
+    customer_bin TEXT NOT NULL,
+    tru_code TEXT NOT NULL DEFAULT '',
+    fingerprint INTEGER NOT NULL,
+    PRIMARY KEY (customer_bin, tru_code, fingerprint)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS work_items (
+    uid TEXT PRIMARY KEY,
+    source TEXT,
+    customer_bin TEXT,
+    plan TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS work_items_due ON work_items (status, lease_expires_at);
+CREATE INDEX IF NOT EXISTS work_items_customer ON work_items (customer_bin, status);
+CREATE TABLE IF NOT EXISTS plan_checkpoints (
+    uid TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    state BLOB NOT NULL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    uid TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    updated_at REAL,
+    PRIMARY KEY (uid, user_id)
+) WITHOUT ROWID;
+"""
+
+# Если WAL разросся больше этого, после цикла делаем checkpoint
+WAL_COMPACT_BYTES = 4 * 1024 * 1024
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def get_connection() -> sqlite3.Connection:
+    """Соединение на поток: sqlite3 не любит делить одно соединение между потоками"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        _local.conn = conn
+        _ensure_schema(conn)
+    return conn
+
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+def _ensure_schema(conn: sqlite3.Connection):
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        conn.executescript(SCHEMA)
+        _migrate_json(conn)
+        _initialized = True
+
+
+def _load_json(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _migrate_json(conn: sqlite3.Connection):
+    with conn:
+        # IMMEDIATE: второй процесс подождёт и увидит, что перенос уже сделан
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if row:
+            return
+
+        subs = _load_json(LEGACY_SUBS_FILE) or []
+        conn.executemany("INSERT OR IGNORE INTO subscriptions (user_id) VALUES (?)",
+                         [(int(user_id),) for user_id in subs])
+
+        emails = _load_json(LEGACY_EMAILS_FILE) or {}
+        conn.executemany("INSERT OR REPLACE INTO emails (user_id, email) VALUES (?, ?)",
+                         [(int(user_id), email) for user_id, email in emails.items()])
+
+        uids = _load_json(LEGACY_NOTIFIED_FILE) or []
+        conn.executemany("INSERT OR IGNORE INTO notified_uids (uid) VALUES (?)",
+                         [(uid,) for uid in uids])
+
+        # tru_rows.json писали два модуля: notifier — {БИН: [строки]},
+        # tru_tracker — {БИН: {код ТРУ: [строки]}}
+        tru_data = _load_json(LEGACY_TRU_FILE) or {}
+        tru_rows = []
+        for customer_bin, rows in tru_data.items():
+            if isinstance(rows, dict):
+                for tru_code, code_rows in rows.items():
+                    tru_rows.extend((customer_bin, tru_code, text) for text in code_rows)
+            else:
+                tru_rows.extend((customer_bin, "", text) for text in rows)
+        conn.executemany("INSERT OR IGNORE INTO tru_history (customer_bin, tru_code, fingerprint) VALUES (?, ?, ?)",
+                         [(customer_bin, tru_code, row_fingerprint(text)) for customer_bin, tru_code, text in tru_rows])
+
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', strftime('%s', 'now'))")
+
+    if subs or emails or uids or tru_rows:
+        print("📦 Данные из JSON-файлов перенесены в SQLite")
+        logger.info(f"📦 Перенесено в SQLite: подписок {len(subs)}, почт {len(emails)}, "
+                    f"UID {len(uids)}, строк ТРУ {len(tru_rows)}")
+
+
+def compact(force: bool = False):
+    """
+    WAL — это и есть журнал дописываемых изменений; checkpoint сворачивает
+    его в основной файл базы и обрезает журнал до нуля.
+    """
+    wal_path = DB_PATH + "-wal"
+    if not force and (not os.path.exists(wal_path) or os.path.getsize(wal_path) < WAL_COMPACT_BYTES):
+        return
+    conn = get_connection()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA optimize")
+    logger.info("🧹 Журнал SQLite свёрнут (wal_checkpoint)")
@@ -1,28 +1,25 @@
-import json
-import os
-
-SUBS_FILE = "storage/subscribed.json"
-os.makedirs("storage", exist_ok=True)
+from bot.storage import get_connection
 
 def load_subscriptions() -> set:
-    if not os.path.exists(SUBS_FILE):
-        return set()
-    with open(SUBS_FILE, "r", encoding="utf-8") as f:
-        return set(json.load(f))
+    rows = get_connection().execute("SELECT user_id FROM subscriptions").fetchall()
+    return {user_id for (user_id,) in rows}
 
 def save_subscriptions(subs: set):
-    with open(SUBS_FILE, "w", encoding="utf-8") as f:
-        json.dump(list(subs), f, indent=2)
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM subscriptions")
+        conn.executemany("INSERT INTO subscriptions (user_id) VALUES (?)", [(user_id,) for user_id in subs])
 
 def add_subscription(user_id: int):
-    subs = load_subscriptions()
-    subs.add(user_id)
-    save_subscriptions(subs)
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO subscriptions (user_id) VALUES (?)", (user_id,))
 
 def remove_subscription(user_id: int):
-    subs = load_subscriptions()
-    subs.discard(user_id)
-    save_subscriptions(subs)
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM subscriptions WHERE user_id = ?", (user_id,))
 
 def is_subscribed(user_id: int) -> bool:
-    return user_id in load_subscriptions()
+    row = get_connection().execute("SELECT 1 FROM subscriptions WHERE user_id = ?", (user_id,)).fetchone()
+    return row is not None
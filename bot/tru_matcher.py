@@ -0,0 +1,83 @@
+# tru_matcher.py
+#
+# Скомпилированный фильтр по кодам ТРУ. Колонку с кодом находим по шапке
+# (строки 1–10) и дальше смотрим только в неё: точные коды и их префиксы
+# по сегментам ("801019" ловит "801019.000.000010") — поиском в set,
+# маски вида "801019.*.000010" — одним регулярным выражением.
+# Если колонку найти не удалось, проверяем всю строку, как раньше.
+
+import fnmatch
+import re
+from functools import lru_cache
+
+# "Код ТРУ", "Код КТРУ", "Код ЕНС ТРУ" и т.п.
+CODE_HEADER_RE = re.compile(r"код.*\b(?:к?тру|енс)\b", re.IGNORECASE | re.DOTALL)
+# Значение похоже на код справочника: 801019.000.000010
+CODE_VALUE_RE = re.compile(r"^\d{2,}(?:\.\d+)+")
+WILDCARD_CHARS = set("*?[")
+
+
+class TruMatcher:
+    def __init__(self, tru_codes: list[str]):
+        codes = [code.strip() for code in tru_codes if code and code.strip()]
+        self.exact_codes = frozenset(code for code in codes if not WILDCARD_CHARS & set(code))
+        self.patterns = [code for code in codes if WILDCARD_CHARS & set(code)]
+
+        self._pattern_re = re.compile(
+            "|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in self.patterns)
+        ) if self.patterns else None
+        # Для полного сканирования: точные коды ищем подстрокой, как и раньше
+        self._substring_re = re.compile(
+            "|".join(re.escape(code) for code in sorted(self.exact_codes, key=len, reverse=True))
+        ) if self.exact_codes else None
+
+    def detect_code_column(self, header_rows: list[tuple]) -> int | None:
+        """Индекс (с нуля) колонки с кодом ТРУ по шапке листа или None"""
+        # Нижние строки шапки — это заголовки таблицы, начинаем с них
+        for row in reversed(header_rows):
+            for col_idx, value in enumerate(row):
+                if isinstance(value, str) and CODE_HEADER_RE.search(value):
+                    return col_idx
+        return None
+
+    def code_matches(self, code: str) -> bool:
+        if code in self.exact_codes:
+            return True
+        # Префиксы по сегментам: 801019.000.000010 → 801019, 801019.000, ...
+        dot = code.find(".")
+        while dot != -1:
+            if code[:dot] in self.exact_codes:
+                return True
+            dot = code.find(".", dot + 1)
+        return bool(self._pattern_re and self._pattern_re.match(code))
+
+    def row_matches(self, row: tuple, code_column: int | None = None) -> bool:
+        if code_column is not None and code_column < len(row):
+            value = row[code_column]
+            match = CODE_VALUE_RE.match(str(value).strip()) if value is not None else None
+            if match:
+                return self.code_matches(match.group(0))
+        # Нестандартная строка или лист без колонки кода — смотрим всю строку
+        return self.scan_row(row)
+
+    def scan_row(self, row: tuple) -> bool:
+        for value in row:
+            if value is None:
+                continue
+            text = str(value)
+            if self._substring_re and self._substring_re.search(text):
+                return True
+            if self._pattern_re and any(self._pattern_re.match(token) for token in text.split()):
+                return True
+        return False
+
+
+@lru_cache(maxsize=32)
+def _compile(tru_codes: tuple[str, ...]) -> TruMatcher:
+    return TruMatcher(list(tru_codes))
+
+
+def compile_tru_matcher(tru_codes) -> TruMatcher:
+    if isinstance(tru_codes, TruMatcher):
+        return tru_codes
+    return _compile(tuple(tru_codes))
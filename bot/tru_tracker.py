@@ -1,28 +1,36 @@
-import os
-import json
+from bot.plan_parser import row_fingerprint
+from bot.storage import get_connection
 
-TRU_TRACK_FILE = "storage/tru_rows.json"
-os.makedirs("storage", exist_ok=True)
+# SQLite ограничивает число параметров в одном запросе
+QUERY_CHUNK = 500
 
-def load_tru_data() -> dict:
-    if not os.path.exists(TRU_TRACK_FILE):
-        return {}
-    with open(TRU_TRACK_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
 
-def save_tru_data(data: dict):
-    with open(TRU_TRACK_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def find_new_rows(bin_number: str, row_texts: list[str], tru_code: str = "") -> list[str]:
+    """Строки, которых ещё нет в истории БИН; точечные запросы по индексу, без загрузки истории"""
+    by_fingerprint = {}
+    for row_text in row_texts:
+        by_fingerprint.setdefault(row_fingerprint(row_text), row_text)
 
-def is_new_tru_row(bin_number: str, tru_code: str, row_text: str, data: dict) -> bool:
-    bin_data = data.get(bin_number, {})
-    known_rows = bin_data.get(tru_code, [])
-    return row_text not in known_rows
+    fingerprints = list(by_fingerprint)
+    known = set()
+    conn = get_connection()
+    for start in range(0, len(fingerprints), QUERY_CHUNK):
+        chunk = fingerprints[start:start + QUERY_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        known.update(fp for (fp,) in conn.execute(
+            f"SELECT fingerprint FROM tru_history "
+            f"WHERE customer_bin = ? AND tru_code = ? AND fingerprint IN ({placeholders})",
+            [bin_number, tru_code, *chunk],
+        ))
 
-def add_tru_row(bin_number: str, tru_code: str, row_text: str, data: dict):
-    if bin_number not in data:
-        data[bin_number] = {}
-    if tru_code not in data[bin_number]:
-        data[bin_number][tru_code] = []
-    if row_text not in data[bin_number][tru_code]:
-        data[bin_number][tru_code].append(row_text)
+    return [row_text for fp, row_text in by_fingerprint.items() if fp not in known]
+
+def record_rows(bin_number: str, row_texts: list[str], tru_code: str = "") -> int:
+    """Дописывает отпечатки строк в историю; возвращает число действительно новых"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.executemany(
+            "INSERT OR IGNORE INTO tru_history (customer_bin, tru_code, fingerprint) VALUES (?, ?, ?)",
+            [(bin_number, tru_code, row_fingerprint(row_text)) for row_text in row_texts],
+        )
+    return cursor.rowcount
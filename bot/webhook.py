@@ -0,0 +1,128 @@
+# webhook.py
+#
+# Приём обновлений Telegram по вебхуку (BOT_MODE=webhook) вместо long polling.
+# Сервер на asyncio.start_server, как у метрик: POST на WEBHOOK_PATH с JSON
+# обновления кладётся в app.update_queue, ответ 200 уходит сразу, а разбором
+# занимается Application — одновременно до UPDATE_CONCURRENCY обновлений.
+# Заголовок X-Telegram-Bot-Api-Secret-Token сверяется с WEBHOOK_SECRET.
+#
+# Локально можно прислать записанное обновление:
+#   curl -X POST http://127.0.0.1:8080/telegram -H "Content-Type: application/json" \
+#        -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" -d @update.json
+# или целый набор — python -m loadtest.replay_updates updates.json
+
+import asyncio
+import hmac
+import json
+import logging
+
+from telegram import Update
+from telegram.ext import Application
+
+from bot.metrics import WEBHOOK_REQUESTS
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_BODY_SIZE = 1024 * 1024     # обновления Telegram — единицы килобайт
+READ_TIMEOUT = 30               # секунд на запрос; соединения Telegram держит открытыми
+
+logger = logging.getLogger(__name__)
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+async def _read_request(reader: asyncio.StreamReader) -> tuple[str, str, dict, bytes] | None:
+    request_line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+    if not request_line:
+        return None
+    parts = request_line.decode("latin-1").split()
+    if len(parts) < 2:
+        raise ValueError("bad request line")
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_SIZE:
+        raise OverflowError(length)
+    body = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT) if length else b""
+    return parts[0], parts[1].split("?")[0], headers, body
+
+
+class WebhookServer:
+    def __init__(self, app: Application, path: str, secret: str | None = None):
+        self.app = app
+        self.path = path
+        self.secret = secret
+        self.server: asyncio.AbstractServer | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    async def _accept(self, method: str, path: str, headers: dict, body: bytes) -> tuple[int, str]:
+        if path == "/healthz" and method == "GET":
+            return 200, "ok"
+        if path != self.path:
+            return 404, "not found"
+        if method != "POST":
+            return 405, "method not allowed"
+        if self.secret and not hmac.compare_digest(headers.get(SECRET_HEADER, ""), self.secret):
+            return 403, "forbidden"
+        try:
+            update = Update.de_json(json.loads(body), self.app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"⚠️ Вебхук: не разобрать обновление: {e}")
+            return 400, "bad update"
+        if update is None:
+            return 400, "bad update"
+        await self.app.update_queue.put(update)
+        return 200, "ok"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            # Keep-alive: Telegram шлёт обновления по нескольким постоянным соединениям
+            while True:
+                keep_alive = True
+                try:
+                    request = await _read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, text = await self._accept(method, path, headers, body)
+                except OverflowError:
+                    status, text, keep_alive = 413, "too large", False
+                except ValueError:
+                    status, text, keep_alive = 400, "bad request", False
+                WEBHOOK_REQUESTS.inc(status=status)
+
+                payload = f"{text}\n".encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Type: text/plain\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def start(self, host: str, port: int):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        print(f"🪝 Вебхук: http://{host}:{port}{self.path}")
+        logger.info(f"🪝 Вебхук: http://{host}:{port}{self.path}")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            # Постоянные соединения сами не закроются, а wait_closed их ждёт
+            for writer in list(self._writers):
+                writer.close()
+            await self.server.wait_closed()
+            self.server = None
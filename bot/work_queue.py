@@ -0,0 +1,254 @@
+# work_queue.py
+#
+# Общая очередь планов для нескольких воркеров (процессов на одной машине
+# с общей базой SQLite). Каждый UID плана — запись в work_items. Воркер берёт
+# её в аренду (lease) атомарно, через BEGIN IMMEDIATE, как письма в mailer.
+# Аренда продлевается, пока воркер жив. Аренду упавшего воркера по истечении
+# срока забирает другой. Планы одного заказчика в один момент обрабатывает
+# только один воркер, иначе сравнение с историей ТРУ разошлось бы.
+#
+# Опрос API источников — тоже аренда ("fetch"): его делает один воркер за раз,
+# остальные разбирают очередь.
+#
+# plan_checkpoints — докуда дошёл план: скачан, разобран, сравнён с историей.
+# Контрольная точка пишется после каждой стадии, и план, взятый после
+# перезапуска, продолжается с неё, а не скачивается и разбирается заново.
+# complete() одной транзакцией закрывает план, отмечает UID обработанным и
+# удаляет контрольную точку.
+#
+# deliveries — кому из подписчиков план уже отправлен. Отметка ставится до
+# отправки и подтверждается после неё, поэтому никому не приходит дважды.
+# Сообщения, которые были в полёте, когда воркер упал, не повторяются.
+
+import json
+import logging
+import os
+import pickle
+import secrets
+import socket
+import time
+
+from bot.metrics import WORK_ITEMS, WORK_LEASES_EXPIRED
+from bot.storage import get_connection
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3            # столько раз план берут в работу, дальше — failed
+DONE_RETENTION = 30 * 24 * 60 * 60
+
+# Стадии контрольных точек плана
+STAGE_DOWNLOADED = "downloaded"   # файл плана на диске
+STAGE_PARSED = "parsed"           # ParsedPlan с найденными строками
+STAGE_DIFFED = "diffed"           # новые строки и книги для получателей готовы, осталась рассылка
+
+# Хвост из случайных символов: после перезапуска в контейнере pid часто тот же,
+# а воркер должен отличаться от своего прошлого экземпляра
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+
+
+def lease_seconds() -> float:
+    return get_settings().WORK_LEASE_SECONDS
+
+
+# --- Планы ---
+
+def enqueue(plans: list[dict]) -> int:
+    """Ставит планы в очередь; уже известные UID пропускаются. Возвращает число новых."""
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        cursor = conn.executemany(
+            "INSERT OR IGNORE INTO work_items (uid, source, customer_bin, plan, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(plan["excelFileUid"], plan.get("source"), plan.get("customerIdentifier", "UNKNOWN"),
+              json.dumps(plan, ensure_ascii=False), now, now) for plan in plans],
+        )
+    return cursor.rowcount
+
+
+def claim(limit: int = 1) -> list[dict]:
+    """
+    Берёт в аренду до limit планов: новые и те, чья аренда истекла. Заказчики,
+    чьи планы сейчас у других воркеров, пропускаются.
+    """
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT uid, plan, status, lease_owner FROM work_items "
+            "WHERE (status = 'pending' OR (status = 'leased' AND lease_expires_at < ?)) "
+            "AND customer_bin NOT IN (SELECT customer_bin FROM work_items "
+            "    WHERE status = 'leased' AND lease_expires_at >= ? AND lease_owner != ?) "
+            "ORDER BY created_at, uid LIMIT ?",
+            (now, now, WORKER_ID, limit),
+        ).fetchall()
+        plans = []
+        for uid, plan, status, owner in rows:
+            if status == "leased":
+                WORK_LEASES_EXPIRED.inc()
+                logger.warning(f"⏰ Аренда UID {uid} у {owner} истекла, забирает {WORKER_ID}")
+            conn.execute(
+                "UPDATE work_items SET status = 'leased', lease_owner = ?, lease_expires_at = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE uid = ?",
+                (WORKER_ID, now + lease_seconds(), now, uid),
+            )
+            plans.append(json.loads(plan))
+    return plans
+
+
+def renew(uids) -> int:
+    """Продлевает аренду своих планов; возвращает, сколько ещё за нами"""
+    uids = list(uids)
+    if not uids:
+        return 0
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        cursor = conn.executemany(
+            "UPDATE work_items SET lease_expires_at = ?, updated_at = ? "
+            "WHERE uid = ? AND status = 'leased' AND lease_owner = ?",
+            [(now + lease_seconds(), now, uid, WORKER_ID) for uid in uids],
+        )
+    return cursor.rowcount
+
+
+def complete(uid: str):
+    """План обработан: закрываем запись, отмечаем UID и убираем контрольную точку — всё разом"""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE work_items SET status = 'done', lease_owner = NULL, lease_expires_at = NULL, "
+            "last_error = NULL, updated_at = ? WHERE uid = ? AND lease_owner = ?",
+            (time.time(), uid, WORKER_ID),
+        )
+        conn.execute("INSERT OR IGNORE INTO notified_uids (uid) VALUES (?)", (uid,))
+        conn.execute("DELETE FROM plan_checkpoints WHERE uid = ?", (uid,))
+
+
+def save_checkpoint(uid: str, stage: str, state: dict):
+    # state — из своего же процесса (ParsedPlan и т.п.), поэтому pickle
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO plan_checkpoints (uid, stage, state, updated_at) VALUES (?, ?, ?, ?)",
+            (uid, stage, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), time.time()),
+        )
+
+
+def load_checkpoint(uid: str) -> tuple[str, dict] | None:
+    row = get_connection().execute(
+        "SELECT stage, state FROM plan_checkpoints WHERE uid = ?", (uid,)
+    ).fetchone()
+    if row is None:
+        return None
+    try:
+        return row[0], pickle.loads(row[1])
+    except Exception as e:
+        # Например, после смены формата ParsedPlan — просто начнём план сначала
+        logger.warning(f"⚠️ Контрольная точка UID {uid} не читается: {e}")
+        return None
+
+
+def retry(uid: str, error: str):
+    """Возвращает план в очередь; после MAX_ATTEMPTS попыток — failed"""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE work_items SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "lease_owner = NULL, lease_expires_at = NULL, last_error = ?, updated_at = ? "
+            "WHERE uid = ? AND lease_owner = ?",
+            (MAX_ATTEMPTS, error, time.time(), uid, WORKER_ID),
+        )
+
+
+def prune():
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM work_items WHERE status = 'done' AND updated_at < ?",
+                     (time.time() - DONE_RETENTION,))
+        # Контрольные точки планов, которые больше никто не возьмёт
+        conn.execute("DELETE FROM plan_checkpoints WHERE uid NOT IN "
+                     "(SELECT uid FROM work_items WHERE status IN ('pending', 'leased'))")
+
+
+def backlog() -> dict[str, int]:
+    rows = get_connection().execute(
+        "SELECT status, COUNT(*) FROM work_items WHERE status != 'done' GROUP BY status"
+    ).fetchall()
+    return dict(rows)
+
+
+WORK_ITEMS.set_function(backlog, label="status")
+
+
+# --- Именованные аренды (опрос источников) ---
+
+def acquire_lease(name: str, seconds: float | None = None) -> bool:
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        if row and row[0] != WORKER_ID and row[1] >= now:
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+            (name, WORKER_ID, now + (seconds or lease_seconds())),
+        )
+    return True
+
+
+def lease_active(name: str) -> bool:
+    """Держит ли аренду кто-то (в том числе мы)"""
+    row = get_connection().execute("SELECT 1 FROM leases WHERE name = ? AND expires_at >= ?",
+                                   (name, time.time())).fetchone()
+    return row is not None
+
+
+def release_lease(name: str):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, WORKER_ID))
+
+
+# --- Доставка подписчикам ---
+
+def undelivered(uid: str, user_ids) -> list[int]:
+    """Кому план ещё не отправлялся (и не отправляется прямо сейчас)"""
+    done = {user_id for (user_id,) in get_connection().execute(
+        "SELECT user_id FROM deliveries WHERE uid = ? AND status != 'failed'", (uid,)
+    )}
+    return [user_id for user_id in user_ids if user_id not in done]
+
+
+def claim_delivery(uid: str, user_id: int) -> bool:
+    """
+    Отметка «отправляю» до запроса к Telegram. False — отправлено или
+    отправляется другим воркером. Свою отметку можно взять повторно (повтор после RetryAfter).
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT status, worker FROM deliveries WHERE uid = ? AND user_id = ?",
+                           (uid, user_id)).fetchone()
+        if row and not (row[0] == "failed" or (row[0] == "sending" and row[1] == WORKER_ID)):
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO deliveries (uid, user_id, status, worker, updated_at) "
+            "VALUES (?, ?, 'sending', ?, ?)",
+            (uid, user_id, WORKER_ID, time.time()),
+        )
+    return True
+
+
+def finish_delivery(uid: str, user_id: int, sent: bool):
+    # Только из «отправляю»: уже отправленное не превратится в failed и не уйдёт повторно
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE deliveries SET status = ?, updated_at = ? "
+            "WHERE uid = ? AND user_id = ? AND worker = ? AND status = 'sending'",
+            ("sent" if sent else "failed", time.time(), uid, user_id, WORKER_ID),
+        )
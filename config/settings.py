@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+from urllib.parse import urlparse
 
 load_dotenv()
 
@@ -9,6 +10,36 @@ class Settings:
     ZAKUPSK_API_TOKEN: str | None
     KEYWORDS: list[str]
     ALLOWED_USERS: list[int]
+    ADMIN_USERS: list[int]
+    DOWNLOAD_CONCURRENCY: int
+    PARSE_WORKERS: int
+    NOTIFY_CONCURRENCY: int
+    PIPELINE_QUEUE_SIZE: int
+    SMTP_HOST: str
+    SMTP_PORT: int
+    SMTP_STARTTLS: bool
+    SMTP_TIMEOUT: int
+    SMTP_IDLE_TIMEOUT: int
+    EMAIL_WORKERS: int
+    CHECK_INTERVAL: int
+    CHECK_INTERVAL_MIN: int
+    CHECK_INTERVAL_MAX: int
+    CHECK_JITTER: float
+    CHECK_RUN_ON_START: bool
+    METRICS_HOST: str
+    METRICS_PORT: int
+    TELEGRAM_API_URL: str | None
+    TELEGRAM_RATE: float
+    BOT_MODE: str
+    WEBHOOK_URL: str | None
+    WEBHOOK_PATH: str
+    WEBHOOK_HOST: str
+    WEBHOOK_PORT: int
+    WEBHOOK_SECRET: str | None
+    UPDATE_CONCURRENCY: int
+    WORK_LEASE_SECONDS: float
+    ZAKUPSK_RATE: float
+    GOSZAKUP_RATE: float
 
     def __init__(self):
         self.BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -19,6 +50,65 @@ class Settings:
         self.SENDER_PASSWORD = os.getenv("sender_password")
 
         self.ALLOWED_USERS = list(map(int, os.getenv("ALLOWED_USERS", "").split(",")))
+        # /stats и прочие служебные команды
+        self.ADMIN_USERS = [int(user_id) for user_id in os.getenv("ADMIN_USERS", "").split(",") if user_id.strip()]
+
+        # Конвейер проверки: параллельность стадий и размер очередей между ними
+        self.DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))
+        self.PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+        self.NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "2"))
+        self.PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+
+        # Почта: для локальной заглушки SMTP_HOST=localhost SMTP_PORT=1025 SMTP_STARTTLS=0
+        self.SMTP_HOST = os.getenv("SMTP_HOST", "mx1.qazcloud.kz")
+        self.SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+        self.SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") not in ("0", "false", "no")
+        self.SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "30"))
+        self.SMTP_IDLE_TIMEOUT = int(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+        self.EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+
+        # Планировщик: интервал проверки в секундах сжимается до MIN, пока
+        # находятся новые планы, и растягивается до MAX в тихие периоды
+        self.CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "1800"))
+        self.CHECK_INTERVAL_MIN = int(os.getenv("CHECK_INTERVAL_MIN", "600"))
+        self.CHECK_INTERVAL_MAX = int(os.getenv("CHECK_INTERVAL_MAX", "3600"))
+        self.CHECK_JITTER = float(os.getenv("CHECK_JITTER", "0.1"))
+        self.CHECK_RUN_ON_START = os.getenv("CHECK_RUN_ON_START", "1") not in ("0", "false", "no")
+
+        # Метрики в формате Prometheus: http://METRICS_HOST:METRICS_PORT/metrics, 0 — выключено.
+        # Воркерам на одной машине — разные порты: занятый порт только пишет предупреждение
+        self.METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+        # Свой сервер Bot API (локальный telegram-bot-api или заглушка из loadtest/),
+        # например http://127.0.0.1:8081; пусто — api.telegram.org
+        self.TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/") or None
+        # Сообщений в секунду на весь бот при рассылке, с запасом от лимита Telegram в 30
+        self.TELEGRAM_RATE = float(os.getenv("TELEGRAM_RATE", "25"))
+
+        # Приём обновлений: polling, webhook или worker — без обновлений, только
+        # фоновая проверка (дополнительные воркеры рядом с основным ботом).
+        # Для вебхука WEBHOOK_URL — публичный https-адрес, который регистрируется
+        # в Telegram (путь берётся из него),
+        # а сервер слушает WEBHOOK_HOST:WEBHOOK_PORT за прокси; пустой WEBHOOK_URL —
+        # вебхук не регистрируется (локальная проверка или его ставит другая реплика)
+        self.BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+        self.WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip() or None
+        self.WEBHOOK_PATH = urlparse(self.WEBHOOK_URL).path if self.WEBHOOK_URL else ""
+        self.WEBHOOK_PATH = self.WEBHOOK_PATH or os.getenv("WEBHOOK_PATH", "/telegram")
+        self.WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+        self.WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+        self.WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+        # Сколько обновлений обрабатывается одновременно (в обоих режимах)
+        self.UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "8"))
+
+        # Несколько воркеров на одной базе делят планы через аренду (bot.work_queue);
+        # аренда продлевается, пока воркер жив, и через столько секунд тишины переходит другому
+        self.WORK_LEASE_SECONDS = float(os.getenv("WORK_LEASE_SECONDS", "300"))
+
+        # Источники планов: запросов в секунду к API каждого, 0 — без ограничения
+        self.ZAKUPSK_RATE = float(os.getenv("ZAKUPSK_RATE", "10"))
+        self.GOSZAKUP_RATE = float(os.getenv("GOSZAKUP_RATE", "5"))
 
 def get_settings():
     return Settings()
@@ -0,0 +1,128 @@
+# base.py
+#
+# Общий интерфейс источников планов. Источник сам решает, как листать свой
+# API, где держать курсор и с какой скоростью можно к нему ходить; наружу он
+# отдаёт планы в одном виде (поля как у zakup.sk.kz плюс "source") и файл
+# плана в формате книги zakup.sk.kz, поэтому разбор, сравнение с историей и
+# рассылка у всех источников общие (bot.pipeline).
+
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+
+from bot.broadcast import RateLimiter
+from bot.file_cache import note_file_content
+from bot.metrics import API_BYTES, API_ERRORS, API_REQUEST_SECONDS, DOWNLOAD_BYTES, DOWNLOAD_ERRORS, DOWNLOAD_SECONDS
+from data_sources.cursor import load_cursor, save_cursor
+
+DOWNLOAD_DIR = "storage/downloads"
+os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+
+FETCH_TIMEOUT = 30         # секунд на один запрос
+FETCH_RETRIES = 4          # повторов на страницу после первой попытки
+RETRY_BACKOFF = 1.0        # базовая задержка между повторами, сек
+RETRY_BACKOFF_MAX = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None = None) -> float:
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), RETRY_BACKOFF_MAX)
+            except ValueError:
+                pass
+    delay = RETRY_BACKOFF * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), RETRY_BACKOFF_MAX)
+
+
+async def request_with_retry(client: httpx.AsyncClient, url: str, params: dict | None = None,
+                             source: str = "", limiter: RateLimiter | None = None,
+                             retries: int = FETCH_RETRIES) -> httpx.Response:
+    for attempt in range(retries + 1):
+        response = None
+        if limiter is not None:
+            await limiter.acquire()
+        try:
+            with API_REQUEST_SECONDS.time(source=source):
+                response = await client.get(url, params=params)
+            API_BYTES.inc(len(response.content), source=source)
+            if response.status_code not in RETRY_STATUSES:
+                if response.is_error:
+                    API_ERRORS.inc(source=source, status=response.status_code)
+                response.raise_for_status()
+                return response
+            error = httpx.HTTPStatusError(
+                f"HTTP {response.status_code}", request=response.request, response=response
+            )
+            API_ERRORS.inc(source=source, status=response.status_code)
+        except (httpx.TransportError, httpx.TimeoutException) as e:
+            error = e
+            API_ERRORS.inc(source=source, status=type(e).__name__)
+
+        if attempt == retries:
+            raise error
+
+        delay = _retry_delay(attempt, response)
+        logger.warning(f"🔁 {url} {params or ''}: {error}, повтор через {delay:.1f} с")
+        await asyncio.sleep(delay)
+
+
+class DataSource:
+    """
+    Источник планов. Наследники задают name, uid_prefix и реализуют
+    fetch_new (пагинация и курсор) и write_plan_file (файл плана на диск).
+    """
+
+    name = ""
+    uid_prefix = ""     # UID планов источника начинаются с него; "" — источник по умолчанию
+    enabled = True
+
+    def __init__(self, requests_per_second: float | None = None):
+        # Свой лимит на каждый источник: медленный или строгий API не тормозит остальные
+        self.limiter = RateLimiter(requests_per_second) if requests_per_second else None
+
+    def owns(self, uid: str) -> bool:
+        return bool(self.uid_prefix) and uid.startswith(self.uid_prefix)
+
+    async def fetch_new(self, year: int) -> tuple[list[dict], dict]:
+        """Планы новее курсора (с полем "source") и сдвинутый курсор — его сохраняет цикл"""
+        raise NotImplementedError
+
+    def load_cursor(self, year: int) -> dict:
+        return load_cursor(self.name, year)
+
+    def save_cursor(self, year: int, cursor: dict):
+        save_cursor(self.name, year, cursor)
+
+    def write_plan_file(self, plan: dict, local_path: str) -> tuple[int, str]:
+        """Пишет книгу плана в local_path; возвращает размер в байтах и sha256"""
+        raise NotImplementedError
+
+    def download(self, plan: dict) -> tuple[str, str] | None:
+        """Файл плана на диске и его sha256: (путь, хеш) или None. Вызывается из потока."""
+        uid = plan["excelFileUid"]
+        local_path = os.path.join(DOWNLOAD_DIR, f"{uid}.xlsx")
+        try:
+            with DOWNLOAD_SECONDS.time(source=self.name):
+                size, content_hash = self.write_plan_file(plan, local_path)
+            DOWNLOAD_BYTES.observe(size, source=self.name)
+            note_file_content(uid, content_hash)
+            return local_path, content_hash
+        except Exception as e:
+            DOWNLOAD_ERRORS.inc(source=self.name)
+            print(f"❌ Ошибка при скачивании Excel-файла {uid} ({self.name}): {e}")
+            logger.warning(f"❌ Ошибка при скачивании Excel-файла {uid} ({self.name}): {e}")
+            if os.path.exists(local_path):
+                os.remove(local_path)
+            return None
+
+    async def close(self):
+        pass
+
@@ -0,0 +1,81 @@
+# cursor.py
+#
+# Курсоры источников хранятся в базе (meta, ключ cursor:<источник>:<год>):
+# воркеры на общей базе видят один и тот же курсор.
+
+import json
+import time
+
+from bot.storage import get_connection
+
+OVERLAP_MS = 6 * 60 * 60 * 1000          # окно перекрытия для поздно опубликованных планов
+FULL_RESYNC_INTERVAL = 24 * 60 * 60      # полная пересинхронизация раз в сутки, сек
+
+
+def _cursor_key(source: str, year: int) -> str:
+    return f"{source}:{year}"
+
+
+def load_cursor(source: str, year: int) -> dict:
+    """Курсор источника: {"approveDate": ms, "uids": [...], "full_sync_at": sec}"""
+    key = _cursor_key(source, year)
+    row = get_connection().execute("SELECT value FROM meta WHERE key = ?", (f"cursor:{key}",)).fetchone()
+    return json.loads(row[0]) if row else {}
+
+
+def save_cursor(source: str, year: int, cursor: dict):
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                     (f"cursor:{_cursor_key(source, year)}", json.dumps(cursor)))
+
+
+def reset_cursor(source: str, year: int):
+    # Следующий цикл сделает полную пересинхронизацию
+    save_cursor(source, year, {})
+
+
+def needs_full_resync(cursor: dict) -> bool:
+    if not cursor.get("approveDate"):
+        return True
+    return time.time() - cursor.get("full_sync_at", 0) >= FULL_RESYNC_INTERVAL
+
+
+def cursor_since_ms(cursor: dict) -> int | None:
+    if not cursor.get("approveDate"):
+        return None
+    return cursor["approveDate"] - OVERLAP_MS
+
+
+def is_after_cursor(plan: dict, cursor: dict) -> bool:
+    approve_date = plan.get("approveDate")
+    if approve_date is None or not cursor.get("approveDate"):
+        return True
+    if approve_date < cursor["approveDate"] - OVERLAP_MS:
+        return False
+    # На самой границе отсекаем уже виденные файлы
+    return approve_date != cursor["approveDate"] or plan.get("excelFileUid") not in cursor.get("uids", [])
+
+
+def advance_cursor(cursor: dict, plans: list[dict], full_sync: bool = False) -> dict:
+    """Сдвигает high-water-mark на самый свежий approveDate из plans"""
+    high = cursor.get("approveDate") or 0
+    uids = set(cursor.get("uids", []))
+
+    for plan in plans:
+        approve_date = plan.get("approveDate")
+        uid = plan.get("excelFileUid")
+        if approve_date is None or not uid:
+            continue
+        if approve_date > high:
+            high = approve_date
+            uids = {uid}
+        elif approve_date == high:
+            uids.add(uid)
+
+    new_cursor = {
+        "approveDate": high or None,
+        "uids": sorted(uids),
+        "full_sync_at": time.time() if full_sync else cursor.get("full_sync_at", 0),
+    }
+    return new_cursor
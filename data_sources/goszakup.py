@@ -0,0 +1,226 @@
+# goszakup.py
+#
+# Источник goszakup.gov.kz: REST API OWS v3 (ows.goszakup.gov.kz) с токеном
+# Bearer GOSZAKUP_API_TOKEN. Там нет книг Excel — план приходит пунктами
+# (/v3/plans/all, постранично через next_page/search_after). Новые пункты
+# группируются по заказчику и году в «план», а файл плана собирается из них
+# в той же раскладке, что у zakup.sk.kz: 10 строк шапки и таблица с кодом ТРУ.
+# Дальше такой план идёт по общему конвейеру как любой другой.
+#
+# Курсор — id последнего прочитанного пункта; за цикл читаем не больше
+# MAX_PAGES страниц, остальное дочитывается в следующих циклах.
+
+import logging
+import os
+import re
+from datetime import datetime
+from urllib.parse import urljoin
+
+import httpx
+import requests
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+
+from bot.excel_scan import HEADER_ROWS
+from bot.file_cache import file_sha256
+from bot.metrics import FETCH_PLANS, FETCH_SECONDS
+from data_sources.base import FETCH_TIMEOUT, DataSource, request_with_retry
+
+SOURCE_NAME = "goszakup.gov.kz"
+GOSZAKUP_BASE_URL = os.getenv("GOSZAKUP_BASE_URL", "https://ows.goszakup.gov.kz").rstrip("/")
+PLANS_URL = f"{GOSZAKUP_BASE_URL}/v3/plans/all"
+PLANS_BY_BIN_URL = f"{GOSZAKUP_BASE_URL}/v3/plans/{{bin}}"
+
+UID_PREFIX = "gz-"
+PAGE_LIMIT = 500
+MAX_PAGES = 40
+# gz-<БИН>-<год>-<id последнего пункта>: новый пункт — новый UID, как перевыпуск файла на zakup.sk.kz
+UID_RE = re.compile(r"^gz-(?P<bin>\d+)-(?P<year>\d{4})-(?P<version>\d+)$")
+
+COLUMNS = [
+    ("ID пункта плана", 14),
+    ("Код ТРУ (ЕНС ТРУ)", 20),
+    ("Наименование ТРУ", 60),
+    ("Краткая характеристика", 40),
+    ("Ед. изм.", 10),
+    ("Количество", 12),
+    ("Цена за единицу, тенге", 16),
+    ("Сумма, планируемая для закупки, тенге", 20),
+    ("Способ закупки", 14),
+    ("Срок поставки", 14),
+]
+
+logger = logging.getLogger(__name__)
+
+
+def _point_row(point: dict) -> list:
+    return [
+        point.get("id"),
+        point.get("ref_enstru_code"),
+        point.get("name_ru"),
+        point.get("desc_ru"),
+        point.get("ref_units_code"),
+        point.get("count"),
+        point.get("price"),
+        point.get("amount"),
+        point.get("ref_trade_methods_id"),
+        point.get("supply_date_ru"),
+    ]
+
+
+def _approved_ms(value) -> int | None:
+    if not value:
+        return None
+    try:
+        return int(datetime.fromisoformat(str(value)).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def points_to_plans(points: list[dict], year: int) -> list[dict]:
+    """Пункты плана → планы по заказчикам в формате zakup.sk.kz (плюс сами пункты)"""
+    groups: dict[str, list[dict]] = {}
+    for point in points:
+        if point.get("is_deleted") or str(point.get("plan_fin_year")) != str(year):
+            continue
+        customer_bin = str(point.get("subject_biin") or "").strip()
+        if customer_bin:
+            groups.setdefault(customer_bin, []).append(point)
+
+    plans = []
+    for customer_bin, group in groups.items():
+        dates = [ms for ms in (_approved_ms(point.get("date_approved")) for point in group) if ms]
+        plans.append({
+            "excelFileUid": f"{UID_PREFIX}{customer_bin}-{year}-{max(point['id'] for point in group)}",
+            "customerIdentifier": customer_bin,
+            "customerName": group[0].get("subject_name_ru") or customer_bin,
+            "approveDate": max(dates) if dates else None,
+            "year": year,
+            "planType": "PREBASIC" if any(point.get("plan_preliminary") for point in group) else "BASIC",
+            "planDurationType": "ANNUAL",
+            "source": SOURCE_NAME,
+            "points": sorted(group, key=lambda point: point["id"]),
+        })
+    return plans
+
+
+def write_points_workbook(plan: dict, points: list[dict], local_path: str):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("План")
+    for idx, (_, width) in enumerate(COLUMNS):
+        ws.column_dimensions[chr(ord("A") + idx)].width = width
+
+    bold = Font(bold=True)
+    title = WriteOnlyCell(ws, value="План государственных закупок")
+    title.font = Font(bold=True, size=14)
+    title.alignment = Alignment(horizontal="center")
+    ws.merged_cells.add(f"A1:{chr(ord('A') + len(COLUMNS) - 1)}1")
+
+    header = [
+        [title],
+        [f"на {plan.get('year')} финансовый год"],
+        ["Наименование заказчика:", plan.get("customerName")],
+        ["БИН заказчика:", plan.get("customerIdentifier")],
+        ["Источник:", SOURCE_NAME],
+    ]
+    while len(header) < HEADER_ROWS - 1:
+        header.append([])
+    columns = []
+    for name, _ in COLUMNS:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = bold
+        cell.alignment = Alignment(horizontal="center", wrap_text=True)
+        columns.append(cell)
+    header.append(columns)
+
+    for row in header:
+        ws.append(row)
+    for point in points:
+        ws.append(_point_row(point))
+    wb.save(local_path)
+
+
+class GoszakupSource(DataSource):
+    name = SOURCE_NAME
+    uid_prefix = UID_PREFIX
+
+    def __init__(self, token: str | None, requests_per_second: float | None = None):
+        super().__init__(requests_per_second)
+        self.token = token
+        self.enabled = bool(token)
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._client: httpx.AsyncClient | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(FETCH_TIMEOUT), headers=self.headers,
+                                             follow_redirects=True)
+        return self._client
+
+    async def fetch_new(self, year: int) -> tuple[list[dict], dict]:
+        cursor = self.load_cursor(year)
+        after = cursor.get("after")
+        client = self._get_client()
+
+        points = []
+        url, params = PLANS_URL, {"limit": PAGE_LIMIT}
+        if after:
+            params["search_after"] = after
+        with FETCH_SECONDS.time(source=self.name, mode="incremental" if after else "full"):
+            # Страницы связаны через next_page — только последовательно
+            for _ in range(MAX_PAGES):
+                response = await request_with_retry(client, url, params, source=self.name, limiter=self.limiter)
+                data = response.json()
+                items = data.get("items") or []
+                if not items:
+                    break
+                points.extend(items)
+                after = max(after or 0, max(item["id"] for item in items))
+                next_page = data.get("next_page")
+                if not next_page:
+                    break
+                url, params = urljoin(GOSZAKUP_BASE_URL, next_page), None
+
+        plans = points_to_plans(points, year)
+        FETCH_PLANS.inc(len(plans), source=self.name)
+        if points:
+            print(f"📥 {self.name}: пунктов плана {len(points)}, заказчиков {len(plans)}")
+            logger.info(f"📥 {self.name}: пунктов плана {len(points)}, заказчиков {len(plans)}")
+        return plans, {**cursor, "after": after}
+
+    def _fetch_points_by_bin(self, customer_bin: str) -> list[dict]:
+        # Для кнопок под старыми уведомлениями: план заказчика целиком, синхронно из потока
+        points = []
+        url, params = PLANS_BY_BIN_URL.format(bin=customer_bin), {"limit": PAGE_LIMIT}
+        for _ in range(MAX_PAGES):
+            response = requests.get(url, params=params, headers=self.headers, timeout=FETCH_TIMEOUT)
+            response.raise_for_status()
+            data = response.json()
+            points.extend(data.get("items") or [])
+            if not data.get("items") or not data.get("next_page"):
+                break
+            url, params = urljoin(GOSZAKUP_BASE_URL, data["next_page"]), None
+        return points
+
+    def write_plan_file(self, plan: dict, local_path: str) -> tuple[int, str]:
+        # Пункты нужны только для файла — дальше по конвейеру (и в пул разбора) план идёт без них
+        points = plan.pop("points", None)
+        if points is None:
+            match = UID_RE.match(plan["excelFileUid"])
+            if not match:
+                raise ValueError(f"Не похоже на UID плана {self.name}: {plan['excelFileUid']}")
+            year = int(match["year"])
+            plans = points_to_plans(self._fetch_points_by_bin(match["bin"]), year)
+            if not plans:
+                raise ValueError(f"У заказчика {match['bin']} нет плана на {year}")
+            plan = {**plans[0], "excelFileUid": plan["excelFileUid"]}
+            points = plan.pop("points")
+
+        write_points_workbook(plan, points, local_path)
+        return os.path.getsize(local_path), file_sha256(local_path)
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
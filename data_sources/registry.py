@@ -0,0 +1,48 @@
+# registry.py
+#
+# Какие источники планов включены и какому источнику принадлежит план или UID.
+# zakup.sk.kz работает всегда; goszakup.gov.kz — если задан GOSZAKUP_API_TOKEN.
+
+from config.settings import get_settings
+from data_sources.base import DataSource
+from data_sources.goszakup import GoszakupSource
+from data_sources.zakupsk import ZakupSkSource
+
+_sources: list[DataSource] | None = None
+
+
+def _all_sources() -> list[DataSource]:
+    global _sources
+    if _sources is None:
+        settings = get_settings()
+        _sources = [
+            ZakupSkSource(settings.ZAKUPSK_API_TOKEN, settings.ZAKUPSK_RATE),
+            GoszakupSource(settings.GOSZAKUP_API_TOKEN, settings.GOSZAKUP_RATE),
+        ]
+    return _sources
+
+
+def get_sources() -> list[DataSource]:
+    """Включённые источники — их опрашивает каждый цикл проверки"""
+    return [source for source in _all_sources() if source.enabled]
+
+
+def source_for_uid(uid: str) -> DataSource:
+    # UID без префикса — план zakup.sk.kz, как было до появления других источников
+    sources = _all_sources()
+    for source in sources:
+        if source.owns(uid):
+            return source
+    return sources[0]
+
+
+def source_for_plan(plan: dict) -> DataSource:
+    for source in _all_sources():
+        if source.name == plan.get("source"):
+            return source
+    return source_for_uid(plan["excelFileUid"])
+
+
+async def close_sources():
+    for source in _all_sources():
+        await source.close()
@@ -1,30 +1,10 @@
-import requests
-import datetime
-
-API_URL = "https://zakup.sk.kz/eprocplan/open-api/plan-extract/filter"
-DOWNLOAD_URL_BASE = "https://zakup.sk.kz/eprocplan/api/plan/download/"
-
-def ms_to_date(ms):
-    """Преобразует timestamp в читаемую дату"""
-    return datetime.datetime.fromtimestamp(ms / 1000).strftime('%Y-%m-%d')
-
-def fetch_procurement_plans(year=2025, max_pages=20):
-    all_plans = []
-
-    for page in range(max_pages):
-        params = {
-            "year": year,
-            "size": 20,
-            "page": page,
-        }
-
-        response = requests.get(API_URL, params=params)
-        response.raise_for_status()
-        data = response.json()  # ← это сразу список!
-        all_plans.extend(data)
-
-    return all_plans
+# test_api_fetch.py
+#
+# Ручная проверка API zakup.sk.kz: печатает свежие планы. Сам клиент
+# переехал в data_sources.zakupsk; имена реэкспортируются для старого кода.
 
+from data_sources.zakupsk import *  # noqa: F401,F403
+from data_sources.zakupsk import DOWNLOAD_URL_BASE, fetch_procurement_plans, ms_to_date
 
 if __name__ == "__main__":
     plans = fetch_procurement_plans()
@@ -0,0 +1,207 @@
+# zakupsk.py
+#
+# Источник zakup.sk.kz: открытый API выгрузки планов (plan-extract/filter)
+# с постраничной выдачей и курсором по approveDate, файлы планов — готовые
+# книги Excel из файлового хранилища портала.
+
+import asyncio
+import datetime
+import hashlib
+import logging
+import os
+
+import httpx
+import requests
+
+from bot.broadcast import RateLimiter
+from bot.metrics import FETCH_PLANS, FETCH_SECONDS
+from data_sources.base import FETCH_TIMEOUT, DataSource, request_with_retry
+from data_sources.cursor import (
+    load_cursor,
+    needs_full_resync,
+    cursor_since_ms,
+    is_after_cursor,
+    advance_cursor,
+)
+
+SOURCE_NAME = "zakup.sk.kz"
+# Для нагрузочных прогонов подменяется на локальную заглушку (loadtest/)
+ZAKUP_BASE_URL = os.getenv("ZAKUP_BASE_URL", "https://zakup.sk.kz").rstrip("/")
+API_URL = f"{ZAKUP_BASE_URL}/eprocplan/open-api/plan-extract/filter"
+DOWNLOAD_URL_BASE = f"{ZAKUP_BASE_URL}/eprocplan/api/plan/download/"
+FILE_DOWNLOAD_URL_BASE = f"{ZAKUP_BASE_URL}/eprocfilestorage/open-api/files/download/"
+
+PAGE_SIZE = 20
+FETCH_CONCURRENCY = 5      # сколько страниц запрашиваем одновременно
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+logger = logging.getLogger(__name__)
+
+_client: httpx.AsyncClient | None = None
+
+
+def ms_to_date(ms):
+    """Преобразует timestamp в читаемую дату"""
+    return datetime.datetime.fromtimestamp(ms / 1000).strftime('%Y-%m-%d')
+
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(FETCH_TIMEOUT),
+        limits=httpx.Limits(max_connections=FETCH_CONCURRENCY * 2, max_keepalive_connections=FETCH_CONCURRENCY),
+        follow_redirects=True,
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий пул соединений к zakup.sk.kz на всё время жизни бота"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+async def fetch_page(client: httpx.AsyncClient, year: int, page: int, size: int = PAGE_SIZE,
+                     newest_first: bool = False, limiter: RateLimiter | None = None) -> list[dict]:
+    params = {
+        "year": year,
+        "size": size,
+        "page": page,
+    }
+    if newest_first:
+        params["sort"] = "approveDate,desc"
+    response = await request_with_retry(client, API_URL, params, source=SOURCE_NAME, limiter=limiter)
+    return response.json()  # ← это сразу список!
+
+
+def _is_newest_first(plans: list[dict]) -> bool:
+    dates = [plan.get("approveDate") or 0 for plan in plans]
+    return all(a >= b for a, b in zip(dates, dates[1:]))
+
+
+async def _fetch_pages(client: httpx.AsyncClient, year: int, max_pages: int, concurrency: int,
+                       since_ms: int | None, limiter: RateLimiter | None) -> list[dict] | None:
+    """
+    Один проход по страницам. С since_ms страницы просим отсортированными и
+    останавливаемся на планах старше since_ms; если API сортировку
+    проигнорировал, возвращает None — полученные страницы смешаны и не годятся.
+    """
+    newest_first = since_ms is not None
+    all_plans = []
+
+    # Страницы запрашиваем пачками по concurrency штук; как только API
+    # вернул неполную или пустую страницу — дальше данных нет.
+    for start in range(0, max_pages, concurrency):
+        pages = range(start, min(start + concurrency, max_pages))
+        results = await asyncio.gather(
+            *(fetch_page(client, year, page, newest_first=newest_first, limiter=limiter) for page in pages)
+        )
+
+        last_page = False
+        for data in results:
+            all_plans.extend(data)
+            if len(data) < PAGE_SIZE:
+                last_page = True
+                break
+
+        if newest_first and all_plans:
+            if not _is_newest_first(all_plans):
+                return None
+            if (all_plans[-1].get("approveDate") or 0) < since_ms:
+                return all_plans
+
+        if last_page:
+            return all_plans
+
+    return all_plans
+
+
+async def fetch_procurement_plans_async(year=2025, max_pages=20, concurrency=FETCH_CONCURRENCY,
+                                        client: httpx.AsyncClient | None = None,
+                                        since_ms: int | None = None,
+                                        limiter: RateLimiter | None = None) -> list[dict]:
+    """
+    Загружает планы постранично. Если задан since_ms, просит API отдавать
+    свежие планы первыми и останавливается, как только страницы ушли старше since_ms.
+    """
+    client = client or get_http_client()
+    plans = await _fetch_pages(client, year, max_pages, concurrency, since_ms, limiter)
+    if plans is None:
+        # Сортированные и несортированные страницы нумеруются по-разному:
+        # добирать «остаток» нельзя, выгрузку начинаем заново с нулевой страницы
+        logger.warning("⚠️ API не сортирует по approveDate, инкрементальная загрузка недоступна")
+        plans = await _fetch_pages(client, year, max_pages, concurrency, None, limiter)
+    return plans
+
+
+async def fetch_new_plans(year=2025, max_pages=20, full: bool = False,
+                          client: httpx.AsyncClient | None = None,
+                          limiter: RateLimiter | None = None) -> tuple[list[dict], dict]:
+    """
+    Возвращает планы новее курсора и сдвинутый курсор.
+    Курсор сохраняет вызывающий код — после того как планы обработаны.
+    """
+    cursor = load_cursor(SOURCE_NAME, year)
+    full = full or needs_full_resync(cursor)
+
+    with FETCH_SECONDS.time(source=SOURCE_NAME, mode="full" if full else "incremental"):
+        if full:
+            print(f"🔄 Полная пересинхронизация {SOURCE_NAME} за {year}")
+            logger.info(f"🔄 Полная пересинхронизация {SOURCE_NAME} за {year}")
+            plans = await fetch_procurement_plans_async(year, max_pages, client=client, limiter=limiter)
+        else:
+            plans = await fetch_procurement_plans_async(year, max_pages, client=client,
+                                                        since_ms=cursor_since_ms(cursor), limiter=limiter)
+            plans = [plan for plan in plans if is_after_cursor(plan, cursor)]
+    FETCH_PLANS.inc(len(plans), source=SOURCE_NAME)
+
+    return plans, advance_cursor(cursor, plans, full_sync=full)
+
+
+async def _fetch_with_own_client(year, max_pages):
+    async with create_http_client() as client:
+        return await fetch_procurement_plans_async(year, max_pages, client=client)
+
+
+def fetch_procurement_plans(year=2025, max_pages=20):
+    # Синхронная обёртка для кода, который работает вне event loop (в потоках)
+    return asyncio.run(_fetch_with_own_client(year, max_pages))
+
+
+
+class ZakupSkSource(DataSource):
+    name = SOURCE_NAME
+
+    def __init__(self, token: str | None = None, requests_per_second: float | None = None):
+        super().__init__(requests_per_second)
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    async def fetch_new(self, year: int) -> tuple[list[dict], dict]:
+        plans, cursor = await fetch_new_plans(year, limiter=self.limiter)
+        for plan in plans:
+            plan["source"] = self.name
+        return plans, cursor
+
+    def write_plan_file(self, plan: dict, local_path: str) -> tuple[int, str]:
+        # Файл идёт потоком на диск, sha256 считается по пути — без повторного чтения
+        digest = hashlib.sha256()
+        size = 0
+        url = f"{FILE_DOWNLOAD_URL_BASE}{plan['excelFileUid']}"
+        with requests.get(url, stream=True, headers=self.headers, timeout=FETCH_TIMEOUT) as response:
+            response.raise_for_status()
+            with open(local_path, "wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        return size, digest.hexdigest()
+
+    async def close(self):
+        await close_http_client()
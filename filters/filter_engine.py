@@ -0,0 +1,300 @@
+# filter_engine.py
+#
+# Правила подписчиков: коды ТРУ (точные, префиксы по сегментам, маски),
+# БИН заказчика, ключевые слова, тип и срок плана, диапазоны сумм.
+# Правила всех подписчиков собираются в обратные индексы
+# "значение → владельцы", поэтому строка плана проверяется против всех
+# подписчиков за один проход, а стоимость растёт с числом совпадений,
+# а не с числом подписчиков и правил.
+#
+# Как сочетаются правила одного подписчика:
+#   - строка подходит по коду ТРУ ИЛИ по ключевому слову;
+#   - если заданы суммы — сумма строки должна попасть в один из диапазонов;
+#   - БИН, тип и срок плана — фильтры на план целиком (любое из значений);
+#   - без правил по коду и словам действуют коды ТРУ по умолчанию.
+# Подписчики без правил получают набор по умолчанию — тот же, что был у бота.
+
+import fnmatch
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+
+from bot.excel_scan import row_to_text
+from bot.storage import get_connection
+from bot.tru_matcher import CODE_VALUE_RE, TruMatcher, WILDCARD_CHARS
+
+RULE_KINDS = ("tru", "bin", "keyword", "type", "duration", "amount")
+PLAN_KINDS = {"bin": "customerIdentifier", "type": "planType", "duration": "planDurationType"}
+
+# Владелец набора правил по умолчанию: им пользуются подписчики без своих правил
+DEFAULT_OWNER = 0
+
+# "Сумма, планируемая для закупки ТРУ без НДС" и т.п.
+AMOUNT_HEADER_RE = re.compile(r"сумм", re.IGNORECASE)
+CODE_TOKEN_RE = re.compile(r"\d{2,}(?:\.\d+)+")
+AMOUNT_RANGE_RE = re.compile(r"^\s*([\d\s.,]*)\s*-\s*([\d\s.,]*)\s*$")
+
+
+@dataclass(frozen=True)
+class Rule:
+    kind: str
+    value: str
+
+
+def parse_amount(value) -> float | None:
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    text = value.replace("\xa0", "").replace(" ", "").replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_amount_range(value: str) -> tuple[float, float]:
+    """'1000000-5000000', '-500000', '1000000-' → (нижняя, верхняя) граница"""
+    match = AMOUNT_RANGE_RE.match(value)
+    if not match:
+        amount = parse_amount(value)
+        if amount is None:
+            raise ValueError(f"Не понял диапазон сумм: {value}")
+        return amount, amount
+    low, high = (parse_amount(part) if part.strip() else None for part in match.groups())
+    if (match.group(1).strip() and low is None) or (match.group(2).strip() and high is None):
+        raise ValueError(f"Не понял диапазон сумм: {value}")
+    return (low if low is not None else float("-inf"), high if high is not None else float("inf"))
+
+
+def normalize_rule(kind: str, value: str) -> Rule:
+    """Проверяет и приводит правило к виду, в котором оно хранится и индексируется"""
+    kind = kind.strip().lower()
+    value = value.strip()
+    if kind not in RULE_KINDS:
+        raise ValueError(f"Неизвестный тип правила: {kind}. Доступны: {', '.join(RULE_KINDS)}")
+    if not value:
+        raise ValueError("Пустое значение правила")
+    if kind == "keyword":
+        value = value.lower()
+    elif kind in ("type", "duration"):
+        value = value.upper()
+    elif kind == "bin":
+        value = "".join(c for c in value if c.isdigit()) or value
+    elif kind == "amount":
+        parse_amount_range(value)
+    return Rule(kind, value)
+
+
+class RowSelector(TruMatcher):
+    """Объединение правил всех подписчиков: какие строки вообще брать из файла"""
+
+    def __init__(self, tru_codes: list[str], keywords: list[str]):
+        super().__init__(tru_codes)
+        self.keywords = sorted(set(keywords))
+        self._keyword_re = re.compile(
+            "|".join(re.escape(keyword) for keyword in sorted(self.keywords, key=len, reverse=True)),
+            re.IGNORECASE,
+        ) if self.keywords else None
+
+    def row_matches(self, row: tuple, code_column: int | None = None) -> bool:
+        if (self.exact_codes or self.patterns) and super().row_matches(row, code_column):
+            return True
+        return bool(self._keyword_re and self._keyword_re.search(row_to_text(row)))
+
+
+class FilterEngine:
+    def __init__(self, rules_by_owner: dict[int, list[Rule]], default_rules: list[Rule],
+                 default_users: set[int] = frozenset()):
+        self.default_users = set(default_users)
+
+        owners = {owner: list(rules) for owner, rules in rules_by_owner.items() if rules}
+        owners[DEFAULT_OWNER] = list(default_rules)
+        default_codes = [rule for rule in default_rules if rule.kind == "tru"]
+        for owner, rules in owners.items():
+            # Без правил по строкам — коды ТРУ по умолчанию
+            if not any(rule.kind in ("tru", "keyword") for rule in rules):
+                rules.extend(default_codes)
+
+        self.code_index: dict[str, set[int]] = {}
+        self.code_patterns: list[tuple[re.Pattern, int]] = []
+        self.code_globs: list[str] = []
+        self.keyword_index: dict[str, set[int]] = {}
+        self.plan_index: dict[str, dict[str, set[int]]] = {kind: {} for kind in PLAN_KINDS}
+        self.plan_constrained: dict[str, set[int]] = {kind: set() for kind in PLAN_KINDS}
+        self.amount_ranges: dict[int, list[tuple[float, float]]] = {}
+
+        for owner, rules in owners.items():
+            for rule in rules:
+                if rule.kind == "tru":
+                    if WILDCARD_CHARS & set(rule.value):
+                        self.code_globs.append(rule.value)
+                        self.code_patterns.append((re.compile(fnmatch.translate(rule.value)), owner))
+                    else:
+                        self.code_index.setdefault(rule.value, set()).add(owner)
+                elif rule.kind == "keyword":
+                    self.keyword_index.setdefault(rule.value, set()).add(owner)
+                elif rule.kind in PLAN_KINDS:
+                    self.plan_index[rule.kind].setdefault(rule.value, set()).add(owner)
+                    self.plan_constrained[rule.kind].add(owner)
+                elif rule.kind == "amount":
+                    self.amount_ranges.setdefault(owner, []).append(parse_amount_range(rule.value))
+
+        for ranges in self.amount_ranges.values():
+            ranges.sort()
+
+        self._keyword_re = re.compile(
+            "|".join(re.escape(keyword) for keyword in sorted(self.keyword_index, key=len, reverse=True)),
+            re.IGNORECASE,
+        ) if self.keyword_index else None
+
+    def row_selector(self) -> RowSelector:
+        return RowSelector(list(self.code_index) + self.code_globs, list(self.keyword_index))
+
+    def _plan_failures(self, plan: dict | None) -> set[int]:
+        """Владельцы, которым план не подходит по БИН, типу или сроку"""
+        failed = set()
+        if plan is None:
+            return failed
+        for kind, field_name in PLAN_KINDS.items():
+            constrained = self.plan_constrained[kind]
+            if not constrained:
+                continue
+            value = normalize_rule(kind, str(plan.get(field_name) or "-")).value
+            failed |= constrained - self.plan_index[kind].get(value, set())
+        return failed
+
+    def _code_owners(self, code: str) -> set[int]:
+        owners = set(self.code_index.get(code, ()))
+        # Префиксы по сегментам: 801019.000.000010 → 801019, 801019.000
+        dot = code.find(".")
+        while dot != -1:
+            owners |= self.code_index.get(code[:dot], set())
+            dot = code.find(".", dot + 1)
+        for pattern, owner in self.code_patterns:
+            if pattern.match(code):
+                owners.add(owner)
+        return owners
+
+    def _row_owners(self, row: tuple, row_text: str, code_column: int | None) -> set[int]:
+        codes = []
+        if code_column is not None and code_column < len(row) and row[code_column] is not None:
+            match = CODE_VALUE_RE.match(str(row[code_column]).strip())
+            if match:
+                codes.append(match.group(0))
+        if not codes:
+            codes = CODE_TOKEN_RE.findall(row_text)
+
+        owners = set()
+        for code in codes:
+            owners |= self._code_owners(code)
+        if self._keyword_re:
+            for keyword in {match.group(0).lower() for match in self._keyword_re.finditer(row_text)}:
+                owners |= self.keyword_index.get(keyword, set())
+        return owners
+
+    def _amount_ok(self, owner: int, amount: float | None) -> bool:
+        ranges = self.amount_ranges.get(owner)
+        if not ranges:
+            return True
+        if amount is None:
+            return False
+        # Диапазоны отсортированы по нижней границе — проверяем только начавшиеся
+        end = bisect_right(ranges, (amount, float("inf")))
+        return any(high >= amount for _, high in ranges[:end])
+
+    def match(self, plan: dict | None, parsed, row_indices=None) -> dict[int, list[int]]:
+        """
+        {user_id: [индексы строк parsed.matched_rows]} для всех подписчиков,
+        которым подходят строки плана. Владелец по умолчанию раскрывается
+        в подписчиков без своих правил.
+        """
+        if row_indices is None:
+            row_indices = range(len(parsed.matched_rows))
+        failed = self._plan_failures(plan)
+        amount_column = detect_amount_column(parsed.header_rows) if self.amount_ranges else None
+
+        matches: dict[int, list[int]] = {}
+        for idx in row_indices:
+            row = parsed.matched_rows[idx]
+            owners = self._row_owners(row, parsed.row_texts[idx], parsed.code_column) - failed
+            if not owners:
+                continue
+            amount = None
+            if amount_column is not None and amount_column < len(row):
+                amount = parse_amount(row[amount_column])
+            for owner in owners:
+                if self._amount_ok(owner, amount):
+                    matches.setdefault(owner, []).append(idx)
+
+        default_rows = matches.pop(DEFAULT_OWNER, None)
+        if default_rows:
+            for user_id in self.default_users:
+                matches[user_id] = default_rows
+        return matches
+
+
+def detect_amount_column(header_rows: list[tuple]) -> int | None:
+    for row in reversed(header_rows):
+        for col_idx, value in enumerate(row):
+            if isinstance(value, str) and AMOUNT_HEADER_RE.search(value):
+                return col_idx
+    return None
+
+
+# --- Хранение правил ---
+
+def load_rules(user_id: int) -> list[Rule]:
+    rows = get_connection().execute(
+        "SELECT kind, value FROM filter_rules WHERE user_id = ? ORDER BY kind, value", (user_id,)
+    ).fetchall()
+    return [Rule(kind, value) for kind, value in rows]
+
+
+def load_all_rules() -> dict[int, list[Rule]]:
+    rules = {}
+    for user_id, kind, value in get_connection().execute("SELECT user_id, kind, value FROM filter_rules"):
+        rules.setdefault(user_id, []).append(Rule(kind, value))
+    return rules
+
+
+def add_rule(user_id: int, kind: str, value: str) -> Rule:
+    rule = normalize_rule(kind, value)
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO filter_rules (user_id, kind, value) VALUES (?, ?, ?)",
+                     (user_id, rule.kind, rule.value))
+    return rule
+
+
+def remove_rule(user_id: int, kind: str, value: str) -> bool:
+    rule = normalize_rule(kind, value)
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("DELETE FROM filter_rules WHERE user_id = ? AND kind = ? AND value = ?",
+                              (user_id, rule.kind, rule.value))
+    return cursor.rowcount > 0
+
+
+def clear_rules(user_id: int):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM filter_rules WHERE user_id = ?", (user_id,))
+
+
+def default_rules(tru_codes: list[str], keywords: list[str]) -> list[Rule]:
+    rules = [normalize_rule("tru", code) for code in tru_codes if code.strip()]
+    rules += [normalize_rule("keyword", keyword) for keyword in keywords if keyword.strip()]
+    return rules
+
+
+def build_filter_engine(user_ids, tru_codes: list[str], keywords: list[str]) -> FilterEngine:
+    """Индексы для указанных подписчиков; у кого нет своих правил — набор по умолчанию"""
+    user_ids = set(user_ids)
+    all_rules = load_all_rules()
+    rules_by_owner = {user_id: rules for user_id, rules in all_rules.items() if user_id in user_ids}
+    return FilterEngine(
+        rules_by_owner,
+        default_rules(tru_codes, keywords),
+        default_users=user_ids - set(rules_by_owner),
+    )
@@ -0,0 +1,157 @@
+# fake_bot_api.py
+#
+# Заглушка Telegram Bot API для нагрузочных прогонов. Бот ходит сюда через
+# TELEGRAM_API_URL (base_url в python-telegram-bot). Записывает все вызовы
+# sendMessage/sendDocument и держит лимиты как у Telegram: около 30 сообщений
+# в секунду на бота и 1 в секунду в один чат. Превышение — 429 с retry_after,
+# заблокировавшие бота чаты — 403, как у настоящего API.
+
+import json
+import math
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from urllib.parse import parse_qs
+
+from loadtest.http_server import Faults, Request, Response, StandInServer
+
+SEND_METHODS = {"sendMessage", "sendDocument"}
+PATH_RE = re.compile(r"^/bot(?P<token>[^/]+)/(?P<method>\w+)$")
+MULTIPART_FIELD_RE = re.compile(rb'name="(?P<name>[^"]+)"\r\n\r\n(?P<value>[^\r]*)\r\n')
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """0 — токен есть, иначе через сколько секунд он появится"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+@dataclass
+class SentMessage:
+    method: str
+    chat_id: int
+    at: float
+    size: int
+    key: str    # кнопки под сообщением (в них UID плана) или текст — для поиска повторов
+
+
+class FakeBotApi(StandInServer):
+    def __init__(self, global_rate: float = 30, per_chat_rate: float = 1, per_chat_burst: float = 3,
+                 blocked_rate: float = 0.0, faults: Faults | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.chat_buckets: dict[int, TokenBucket] = {}
+        self.blocked_rate = blocked_rate
+        self.faults = faults or Faults(error_status=502)
+        self.sent: list[SentMessage] = []
+        self.calls = Counter()
+        self.rejected = Counter()
+        self._message_id = 0
+
+    def is_blocked(self, chat_id: int) -> bool:
+        # Один и тот же чат всегда либо заблокировал бота, либо нет
+        return self.blocked_rate > 0 and random.Random(chat_id).random() < self.blocked_rate
+
+    @staticmethod
+    def _params(request: Request) -> dict[str, str]:
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            return {match["name"].decode(): match["value"].decode("utf-8", "replace")
+                    for match in MULTIPART_FIELD_RE.finditer(request.body)}
+        if content_type.startswith("application/json"):
+            return {key: str(value) for key, value in json.loads(request.body or b"{}").items()}
+        return {key: values[-1] for key, values in parse_qs(request.body.decode("utf-8")).items()}
+
+    @staticmethod
+    def _error(status: int, description: str, retry_after: float | None = None) -> Response:
+        payload = {"ok": False, "error_code": status, "description": description}
+        if retry_after is not None:
+            payload["parameters"] = {"retry_after": retry_after}
+        return Response.json(payload, status)
+
+    async def handle(self, request: Request) -> Response:
+        match = PATH_RE.match(request.path)
+        if not match:
+            return self._error(404, "Not Found")
+        method = match["method"]
+        self.calls[method] += 1
+        params = self._params(request)
+
+        if method == "getMe":
+            return Response.json({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "zakupbot", "username": "zakupbot_loadtest",
+                "can_join_groups": False, "can_read_all_group_messages": False,
+                "supports_inline_queries": False,
+            }})
+        if method == "getUpdates":
+            return Response.json({"ok": True, "result": []})
+        if method not in SEND_METHODS:
+            return Response.json({"ok": True, "result": True})
+        return await self._send(method, params, len(request.body))
+
+    async def _send(self, method: str, params: dict, size: int) -> Response:
+        await self.faults.delay()
+        if self.faults.should_fail():
+            self.rejected["injected"] += 1
+            return self._error(self.faults.error_status, "Bad Gateway")
+
+        chat_id = int(params.get("chat_id", 0))
+        if self.is_blocked(chat_id):
+            self.rejected["blocked"] += 1
+            return self._error(403, "Forbidden: bot was blocked by the user")
+
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        # Токен списывается, только если запрос прошёл оба лимита
+        wait = max(self.global_bucket.wait_time(), bucket.wait_time())
+        if wait:
+            self.rejected["429"] += 1
+            # Telegram отдаёт retry_after целыми секундами
+            return self._error(429, f"Too Many Requests: retry after {math.ceil(wait)}", math.ceil(wait))
+
+        self.global_bucket.take()
+        bucket.take()
+        self._message_id += 1
+        key = params.get("reply_markup") or params.get("text", "")
+        self.sent.append(SentMessage(method, chat_id, time.monotonic(), size, key))
+        result = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if method == "sendMessage":
+            result["text"] = params.get("text", "")
+        else:
+            result["document"] = {"file_id": f"doc{self._message_id}", "file_unique_id": f"u{self._message_id}"}
+        return Response.json({"ok": True, "result": result})
+
+    def stats(self) -> dict:
+        sent = self.sent
+        span = sent[-1].at - sent[0].at if len(sent) > 1 else 0.0
+        per_method = Counter(message.method for message in sent)
+        return {
+            "calls": dict(self.calls),
+            "delivered": dict(per_method),
+            "rejected": dict(self.rejected),
+            "chats": len({message.chat_id for message in sent}),
+            # Одно и то же сообщение в тот же чат дважды — нарушение «ровно один раз»
+            "duplicates": len(sent) - len({(message.chat_id, message.key) for message in sent}),
+            "messages_per_second": round(len(sent) / span, 2) if span else None,
+        }
@@ -0,0 +1,123 @@
+# fake_smtp.py
+#
+# Заглушка SMTP-сервера для почтовой очереди (bot.mailer): бот ходит сюда с
+# SMTP_HOST/SMTP_PORT, без STARTTLS и логина. Понимает минимальный диалог
+# EHLO/MAIL/RCPT/DATA/NOOP/RSET/QUIT, считает соединения и письма в каждом из
+# них — по этому видно, переиспользует ли бот соединение. Как настоящие
+# серверы, молча закрывает соединение после idle_timeout простоя; доля писем
+# может получать временный отказ 451.
+
+import asyncio
+import hashlib
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from loadtest.http_server import Faults, StandInServer
+
+DATA_END = b".\r\n"
+
+
+@dataclass
+class ReceivedEmail:
+    connection: int
+    sender: str
+    recipients: list[str]
+    size: int
+    digest: str     # sha1 тела письма — для поиска повторов
+    at: float
+
+
+class FakeSmtp(StandInServer):
+    def __init__(self, idle_timeout: float = 300, faults: Faults | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.idle_timeout = idle_timeout
+        self.faults = faults or Faults()
+        self.received: list[ReceivedEmail] = []
+        self.connections = 0
+        self.idle_closed = 0
+        self.commands = Counter()
+        self.rejected = 0
+
+    @property
+    def url(self) -> str:
+        return f"smtp://{self.host}:{self.port}"
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        connection = self.connections
+        sender, recipients = "", []
+
+        def reply(line: str):
+            writer.write(f"{line}\r\n".encode("ascii"))
+
+        try:
+            reply("220 fake-smtp ESMTP")
+            await writer.drain()
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    # Как у настоящих серверов: соединение без дела просто закрывается
+                    self.idle_closed += 1
+                    break
+                if not line:
+                    break
+                command, _, argument = line.decode("utf-8", "replace").strip().partition(" ")
+                command = command.upper()
+                self.commands[command] += 1
+
+                if command in ("EHLO", "HELO"):
+                    writer.write(b"250-fake-smtp\r\n250-SIZE 52428800\r\n250 8BITMIME\r\n")
+                elif command == "MAIL":
+                    sender, recipients = argument.partition(":")[2].strip("<> "), []
+                    reply("250 OK")
+                elif command == "RCPT":
+                    recipients.append(argument.partition(":")[2].strip("<> "))
+                    reply("250 OK")
+                elif command == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    size, digest = 0, hashlib.sha1()
+                    while (chunk := await reader.readline()) not in (DATA_END, b""):
+                        size += len(chunk)
+                        digest.update(chunk)
+                    await self.faults.delay()
+                    if self.faults.should_fail():
+                        self.rejected += 1
+                        reply("451 Temporary failure, try again later")
+                    else:
+                        self.received.append(ReceivedEmail(connection, sender, recipients, size,
+                                                           digest.hexdigest(), time.time()))
+                        reply("250 OK queued")
+                    sender, recipients = "", []
+                elif command == "RSET":
+                    sender, recipients = "", []
+                    reply("250 OK")
+                elif command == "NOOP":
+                    reply("250 OK")
+                elif command == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 Command not implemented")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def stats(self) -> dict:
+        per_connection = Counter(email.connection for email in self.received)
+        return {
+            "emails": len(self.received),
+            "connections": self.connections,
+            "max_per_connection": max(per_connection.values(), default=0),
+            "idle_closed": self.idle_closed,
+            "rejected": self.rejected,
+            "bytes": sum(email.size for email in self.received),
+            # Одно и то же письмо тому же адресату дважды — повторная отправка
+            "duplicates": len(self.received) - len({(tuple(email.recipients), email.digest)
+                                                    for email in self.received}),
+        }
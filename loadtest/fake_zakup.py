@@ -0,0 +1,84 @@
+# fake_zakup.py
+#
+# Заглушка zakup.sk.kz: plan-extract/filter с постраничной выдачей и сортировкой
+# по approveDate, скачивание книг плана. Задержки и доля ошибок задаются
+# отдельно для API и для скачивания.
+
+import asyncio
+from collections import Counter
+
+from loadtest.fixtures import Fixtures
+from loadtest.http_server import Faults, Request, Response, StandInServer
+
+FILTER_PATH = "/eprocplan/open-api/plan-extract/filter"
+FILE_DOWNLOAD_PREFIX = "/eprocfilestorage/open-api/files/download/"
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class FakeZakup(StandInServer):
+    def __init__(self, fixtures: Fixtures, api_faults: Faults | None = None,
+                 download_faults: Faults | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.fixtures = fixtures
+        self.api_faults = api_faults or Faults()
+        self.download_faults = download_faults or Faults()
+        self.requests = Counter()
+        self.injected_errors = Counter()
+        self.bytes_served = 0
+        self._file_cache: dict[str, bytes] = {}
+
+    def _read_file(self, path: str) -> bytes:
+        # Синтетические планы делят книги из пула — в памяти они по одной копии
+        data = self._file_cache.get(path)
+        if data is None:
+            with open(path, "rb") as f:
+                data = self._file_cache[path] = f.read()
+        return data
+
+    async def handle(self, request: Request) -> Response:
+        if request.path == FILTER_PATH:
+            return await self._filter(request)
+        if request.path.startswith(FILE_DOWNLOAD_PREFIX):
+            return await self._download(request.path[len(FILE_DOWNLOAD_PREFIX):])
+        self.requests["unknown"] += 1
+        return Response(404, b"not found", "text/plain")
+
+    async def _filter(self, request: Request) -> Response:
+        self.requests["filter"] += 1
+        await self.api_faults.delay()
+        if self.api_faults.should_fail():
+            self.injected_errors["filter"] += 1
+            return Response(self.api_faults.error_status, b"injected error", "text/plain")
+
+        plans = self.fixtures.plans
+        if "year" in request.query:
+            plans = [plan for plan in plans if str(plan.get("year")) == request.query["year"]]
+        if request.query.get("sort", "").startswith("approveDate"):
+            plans = sorted(plans, key=lambda plan: plan.get("approveDate") or 0,
+                           reverse=request.query["sort"].endswith(",desc"))
+        size = int(request.query.get("size", 20))
+        page = int(request.query.get("page", 0))
+        response = Response.json(plans[page * size:(page + 1) * size])
+        self.bytes_served += len(response.body)
+        return response
+
+    async def _download(self, uid: str) -> Response:
+        self.requests["download"] += 1
+        await self.download_faults.delay()
+        if self.download_faults.should_fail():
+            self.injected_errors["download"] += 1
+            return Response(self.download_faults.error_status, b"injected error", "text/plain")
+
+        path = self.fixtures.file_path(uid)
+        if path is None:
+            return Response(404, b"file not found", "text/plain")
+        data = await asyncio.to_thread(self._read_file, path)
+        self.bytes_served += len(data)
+        return Response(200, data, XLSX_TYPE)
+
+    def stats(self) -> dict:
+        return {
+            "requests": dict(self.requests),
+            "injected_errors": dict(self.injected_errors),
+            "bytes_served": self.bytes_served,
+        }
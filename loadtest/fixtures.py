@@ -0,0 +1,156 @@
+# fixtures.py
+#
+# Наборы планов для заглушки zakup.sk.kz. Каталог фикстур:
+#   plans.json  — список планов в том виде, в каком их отдаёт plan-extract/filter
+#   files.json  — {excelFileUid: имя файла в files/}
+#   files/      — сами книги .xlsx
+# Синтетический набор собирается из небольшого пула книг (benchmarks.plan_workbook):
+# у каждого плана свой заказчик и UID, а книги повторяются, чтобы сотни планов
+# не генерировались минутами. Записанный набор снимается с настоящего API.
+#
+#   python -m loadtest.fixtures generate /tmp/fixtures --plans 500 --rows 2000
+#   python -m loadtest.fixtures record /tmp/recorded --pages 3
+
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+
+from benchmarks.plan_workbook import TARGET_CODE, generate_plan_workbook
+
+DURATION_TYPES = ["ANNUAL", "LONG_TIME"]
+PLAN_TYPES = ["PREBASIC", "BASIC", "REVIEWED"]
+
+
+@dataclass
+class Fixtures:
+    directory: str
+    plans: list[dict]
+    files: dict[str, str]   # uid → путь к книге
+
+    def file_path(self, uid: str) -> str | None:
+        return self.files.get(uid)
+
+
+def load_fixtures(directory: str) -> Fixtures:
+    with open(os.path.join(directory, "plans.json"), "r", encoding="utf-8") as f:
+        plans = json.load(f)
+    with open(os.path.join(directory, "files.json"), "r", encoding="utf-8") as f:
+        names = json.load(f)
+    files = {uid: os.path.join(directory, "files", name) for uid, name in names.items()}
+    return Fixtures(directory, plans, files)
+
+
+def _save(directory: str, plans: list[dict], names: dict[str, str]) -> Fixtures:
+    with open(os.path.join(directory, "plans.json"), "w", encoding="utf-8") as f:
+        json.dump(plans, f, ensure_ascii=False, indent=1)
+    with open(os.path.join(directory, "files.json"), "w", encoding="utf-8") as f:
+        json.dump(names, f, ensure_ascii=False, indent=1)
+    return load_fixtures(directory)
+
+
+def generate_fixtures(directory: str, plans: int = 100, rows: int = 2_000, hit_rate: float = 0.01,
+                      tru_share: float = 0.3, variants: int = 10, customers: int | None = None,
+                      year: int = 2025, seed: int = 0) -> Fixtures:
+    """
+    plans планов, из них доля tru_share с нужным кодом ТРУ; книги берутся из пула
+    variants штук. customers меньше plans — у заказчиков по нескольку планов,
+    и часть из них отсеется как повторы.
+    """
+    rng = random.Random(seed)
+    files_dir = os.path.join(directory, "files")
+    os.makedirs(files_dir, exist_ok=True)
+
+    with_tru, without_tru = [], []
+    for idx in range(max(1, variants)):
+        name = f"tru_{idx}.xlsx"
+        generate_plan_workbook(os.path.join(files_dir, name), rows, hit_rate=hit_rate, seed=seed + idx)
+        with_tru.append(name)
+        name = f"plain_{idx}.xlsx"
+        generate_plan_workbook(os.path.join(files_dir, name), rows, hit_rate=0, seed=seed + idx)
+        without_tru.append(name)
+
+    customers = customers or plans
+    now_ms = int(time.time() * 1000)
+    plan_list, names = [], {}
+    for idx in range(plans):
+        uid = str(uuid.UUID(int=rng.getrandbits(128)))
+        customer = idx % customers
+        plan_list.append({
+            "excelFileUid": uid,
+            "approveDate": now_ms - idx * 60_000,
+            "customerName": f"АО «Заказчик {customer}»",
+            "customerIdentifier": f"{100000000000 + customer}",
+            "year": year,
+            "planType": rng.choice(PLAN_TYPES),
+            "planDurationType": rng.choice(DURATION_TYPES),
+        })
+        pool = with_tru if rng.random() < tru_share else without_tru
+        names[uid] = rng.choice(pool)
+
+    return _save(directory, plan_list, names)
+
+
+def record_fixtures(directory: str, year: int = 2025, pages: int = 3) -> Fixtures:
+    """Снимает планы и их книги с настоящего zakup.sk.kz для повторных прогонов"""
+    import requests
+
+    from data_sources.zakupsk import FILE_DOWNLOAD_URL_BASE, fetch_procurement_plans
+
+    files_dir = os.path.join(directory, "files")
+    os.makedirs(files_dir, exist_ok=True)
+    plans = fetch_procurement_plans(year, max_pages=pages)
+    recorded, names = [], {}
+    for plan in plans:
+        uid = plan.get("excelFileUid")
+        if not uid or uid in names:
+            continue
+        path = os.path.join(files_dir, f"{uid}.xlsx")
+        try:
+            with requests.get(f"{FILE_DOWNLOAD_URL_BASE}{uid}", stream=True, timeout=60) as response:
+                response.raise_for_status()
+                with open(path, "wb") as f:
+                    shutil.copyfileobj(response.raw, f)
+        except Exception as e:
+            print(f"❌ {uid}: {e}")
+            continue
+        recorded.append(plan)
+        names[uid] = f"{uid}.xlsx"
+        print(f"📥 {uid}")
+    return _save(directory, recorded, names)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Фикстуры для заглушки zakup.sk.kz")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="синтетический набор планов")
+    generate.add_argument("directory")
+    generate.add_argument("--plans", type=int, default=100)
+    generate.add_argument("--rows", type=int, default=2_000, help="строк в каждой книге")
+    generate.add_argument("--hit-rate", type=float, default=0.01, help="доля строк с кодом ТРУ в книге")
+    generate.add_argument("--tru-share", type=float, default=0.3, help="доля планов с кодом ТРУ")
+    generate.add_argument("--variants", type=int, default=10, help="сколько разных книг в пуле")
+    generate.add_argument("--customers", type=int, default=None, help="число заказчиков (по умолчанию = планов)")
+    generate.add_argument("--seed", type=int, default=0)
+
+    record = commands.add_parser("record", help="снять планы с zakup.sk.kz")
+    record.add_argument("directory")
+    record.add_argument("--year", type=int, default=2025)
+    record.add_argument("--pages", type=int, default=3)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        fixtures = generate_fixtures(args.directory, args.plans, args.rows, args.hit_rate,
+                                     args.tru_share, args.variants, args.customers, seed=args.seed)
+    else:
+        fixtures = record_fixtures(args.directory, args.year, args.pages)
+    print(f"✅ {len(fixtures.plans)} планов в {args.directory} (код ТРУ {TARGET_CODE})")
+
+
+if __name__ == "__main__":
+    main()
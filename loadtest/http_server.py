@@ -0,0 +1,159 @@
+# http_server.py
+#
+# Минимальный HTTP/1.1-сервер на asyncio для заглушек zakup.sk.kz и Bot API.
+# Держит keep-alive (httpx и requests переиспользуют соединения, как с
+# настоящими серверами) и крутится в своём потоке со своим event loop,
+# чтобы нагрузка на бота не искажала задержки заглушек и наоборот.
+
+import asyncio
+import json
+import random
+import threading
+from dataclasses import dataclass
+from urllib.parse import parse_qs, urlsplit
+
+READ_TIMEOUT = 60
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+               429: "Too Many Requests", 500: "Internal Server Error", 502: "Bad Gateway",
+               503: "Service Unavailable"}
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: dict[str, str]
+    headers: dict[str, str]
+    body: bytes
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "application/json"
+
+    @classmethod
+    def json(cls, payload, status: int = 200) -> "Response":
+        return cls(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+@dataclass
+class Faults:
+    """Задержка ответа (с разбросом) и доля ответов с ошибкой"""
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+
+    async def delay(self):
+        seconds = self.latency + random.uniform(0, self.jitter)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class StandInServer:
+    """Базовый сервер: наследники реализуют handle(request) → Response"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def handle(self, request: Request) -> Response:
+        raise NotImplementedError
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Request | None:
+        request_line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+        if not request_line.strip():
+            return None
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        body = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT) if length else b""
+        parts = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        return Request(method.upper(), parts.path, query, headers, body)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                try:
+                    response = await self.handle(request)
+                except Exception as e:
+                    response = Response(500, f"{type(e).__name__}: {e}".encode("utf-8"), "text/plain")
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {response.status} {STATUS_TEXT.get(response.status, 'Unknown')}\r\n"
+                    f"Content-Type: {response.content_type}\r\n"
+                    f"Content-Length: {len(response.body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                    + response.body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self) -> str:
+        """Запускает сервер в фоновом потоке; возвращает базовый URL"""
+        ready = threading.Event()
+
+        async def serve():
+            self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            async with self._server:
+                await self._server.serve_forever()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._loop.run_until_complete(serve())
+            except asyncio.CancelledError:
+                pass
+            finally:
+                # Дожидаемся отменённых соединений, чтобы закрыть loop без висящих задач
+                pending = asyncio.all_tasks(self._loop)
+                if pending:
+                    self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.url
+
+    def stop(self):
+        if self._loop is None or self._loop.is_closed():
+            return
+
+        async def shutdown():
+            self._server.close()
+            for task in asyncio.all_tasks():
+                if task is not asyncio.current_task():
+                    task.cancel()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join(timeout=5)
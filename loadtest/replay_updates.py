@@ -0,0 +1,94 @@
+# replay_updates.py
+#
+# Шлёт записанные обновления Telegram в вебхук бота (BOT_MODE=webhook), как
+# это делал бы сам Telegram: POST JSON с заголовком секрета. Файл — одно
+# обновление, список обновлений или JSON Lines. --repeat размножает набор с
+# новыми update_id, --concurrency — сколько запросов держать в полёте.
+#
+#   python -m loadtest.replay_updates updates.json --url http://127.0.0.1:8080/telegram
+#   python -m loadtest.replay_updates updates.jsonl --repeat 100 --concurrency 20
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+
+def load_updates(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        # JSON Lines: по обновлению в строке
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return data if isinstance(data, list) else [data]
+
+
+def expand(updates: list[dict], repeat: int) -> list[dict]:
+    if repeat <= 1:
+        return updates
+    first_id = max((update.get("update_id", 0) for update in updates), default=0) + 1
+    result = []
+    for idx in range(repeat * len(updates)):
+        result.append({**updates[idx % len(updates)], "update_id": first_id + idx})
+    return result
+
+
+async def replay(url: str, updates: list[dict], secret: str | None, concurrency: int) -> dict:
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    statuses = Counter()
+    latencies = []
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async with httpx.AsyncClient(timeout=30, headers=headers) as client:
+        async def send(update: dict):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=update)
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(update) for update in updates))
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "sent": len(updates),
+        "statuses": dict(statuses),
+        "seconds": round(wall, 3),
+        "per_second": round(len(updates) / wall, 1) if wall else None,
+        "p50": round(latencies[len(latencies) // 2], 4) if latencies else None,
+        "p95": round(latencies[int(len(latencies) * 0.95)], 4) if latencies else None,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Повтор записанных обновлений Telegram в вебхук бота")
+    parser.add_argument("file", help="JSON: обновление, список обновлений или JSON Lines")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/telegram")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"), help="по умолчанию WEBHOOK_SECRET")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    updates = expand(load_updates(args.file), args.repeat)
+    result = asyncio.run(replay(args.url, updates, args.secret, args.concurrency))
+    for name, value in result.items():
+        print(f"  {name}: {value}")
+    return 0 if set(result["statuses"]) <= {200} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
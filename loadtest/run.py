@@ -0,0 +1,361 @@
+# run.py
+#
+# Нагрузочный прогон полного цикла проверки без внешних сервисов: бот ходит
+# в заглушки zakup.sk.kz и Bot API (ZAKUP_BASE_URL, TELEGRAM_API_URL), почта —
+# в заглушку SMTP (SMTP_HOST/SMTP_PORT), база и storage/ — во временном каталоге. После прогона — пропускная способность
+# и задержки по стадиям конвейера (из bot.metrics) и статистика заглушек.
+#
+#   python -m loadtest.run --plans 500 --subscribers 10000
+#   python -m loadtest.run --fixtures /tmp/recorded --api-error-rate 0.1
+#   python -m loadtest.run --send-rate 30 --tg-rate 30 --report /tmp/report.json
+#   python -m loadtest.run --plans 200 --workers 4   # воркеры делят очередь (bot.work_queue)
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from loadtest.fake_bot_api import FakeBotApi  # noqa: E402
+from loadtest.fake_smtp import FakeSmtp  # noqa: E402
+from loadtest.fake_zakup import FakeZakup  # noqa: E402
+from loadtest.fixtures import generate_fixtures, load_fixtures  # noqa: E402
+from loadtest.http_server import Faults  # noqa: E402
+
+LOADTEST_TOKEN = "123456:LOADTEST"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон цикла проверки на заглушках")
+    data = parser.add_argument_group("планы")
+    data.add_argument("--fixtures", help="каталог фикстур (loadtest.fixtures); без него — синтетика")
+    data.add_argument("--plans", type=int, default=100)
+    data.add_argument("--rows", type=int, default=2_000, help="строк в каждой книге")
+    data.add_argument("--hit-rate", type=float, default=0.01, help="доля строк с кодом ТРУ в книге")
+    data.add_argument("--tru-share", type=float, default=0.3, help="доля планов с кодом ТРУ")
+    data.add_argument("--variants", type=int, default=5, help="разных книг в пуле")
+    data.add_argument("--customers", type=int, default=None)
+
+    users = parser.add_argument_group("подписчики")
+    users.add_argument("--subscribers", type=int, default=200)
+    users.add_argument("--email-share", type=float, default=0.1, help="доля подписчиков с почтой")
+
+    zakup = parser.add_argument_group("заглушка zakup.sk.kz")
+    zakup.add_argument("--api-latency", type=float, default=0.05, help="секунд на ответ API")
+    zakup.add_argument("--api-jitter", type=float, default=0.05)
+    zakup.add_argument("--api-error-rate", type=float, default=0.02)
+    zakup.add_argument("--download-latency", type=float, default=0.1)
+    zakup.add_argument("--download-jitter", type=float, default=0.1)
+    zakup.add_argument("--download-error-rate", type=float, default=0.0)
+
+    telegram = parser.add_argument_group("заглушка Bot API")
+    telegram.add_argument("--tg-rate", type=float, default=30, help="лимит сообщений в секунду на бота")
+    telegram.add_argument("--tg-chat-rate", type=float, default=1, help="лимит сообщений в секунду в чат")
+    telegram.add_argument("--tg-latency", type=float, default=0.02)
+    telegram.add_argument("--tg-jitter", type=float, default=0.03)
+    telegram.add_argument("--tg-error-rate", type=float, default=0.0)
+    telegram.add_argument("--tg-blocked-rate", type=float, default=0.01, help="доля чатов, заблокировавших бота")
+    telegram.add_argument("--send-rate", type=float, default=None,
+                          help="TELEGRAM_RATE бота (по умолчанию из настроек)")
+
+    smtp = parser.add_argument_group("заглушка SMTP")
+    smtp.add_argument("--smtp-latency", type=float, default=0.01, help="секунд на приём письма")
+    smtp.add_argument("--smtp-error-rate", type=float, default=0.0, help="доля временных отказов 451")
+    smtp.add_argument("--smtp-idle-timeout", type=float, default=300,
+                      help="сервер закрывает соединение после стольких секунд простоя")
+    smtp.add_argument("--mail-drain", type=float, default=60,
+                      help="сколько секунд после циклов ждать, пока очередь писем опустеет")
+
+    parser.add_argument("--cycles", type=int, default=2, help="циклов подряд; второй показывает холостой ход")
+    parser.add_argument("--workers", type=int, default=1, help="процессов-воркеров на общей базе")
+    parser.add_argument("--report", help="сохранить отчёт в JSON")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочий каталог")
+    parser.add_argument("--verbose", action="store_true", help="вывод бота в консоль, а не в лог")
+    return parser.parse_args(argv)
+
+
+def seed_users(subscribers: int, email_share: float):
+    from bot.email import save_email
+    from bot.subscription import save_subscriptions
+
+    user_ids = set(range(1, subscribers + 1))
+    save_subscriptions(user_ids)
+    step = max(1, round(1 / email_share)) if email_share > 0 else 0
+    if step:
+        for user_id in range(1, subscribers + 1, step):
+            save_email(user_id, f"user{user_id}@example.kz")
+
+
+async def drain_mail(timeout: float):
+    """Ждёт, пока почтовая очередь разошлёт всё, что может (отложенные повторы не ждём)"""
+    from bot.mailer import queue_depth
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        depth = await asyncio.to_thread(queue_depth)
+        if not depth.get("pending") and not depth.get("sending"):
+            return
+        await asyncio.sleep(0.2)
+
+
+async def run_cycles(cycles: int, label: str = "", mail_drain: float = 0) -> list[dict]:
+    from telegram.ext import ApplicationBuilder
+
+    from bot.mailer import get_mail_service
+    from bot.pipeline import run_check_cycle, shutdown_parse_pool
+    from config.settings import get_settings
+    from data_sources.registry import close_sources
+
+    settings = get_settings()
+    app = (ApplicationBuilder().token(settings.BOT_TOKEN)
+           .base_url(f"{settings.TELEGRAM_API_URL}/bot")
+           .base_file_url(f"{settings.TELEGRAM_API_URL}/file/bot")
+           .build())
+    await app.initialize()
+    mail_service = get_mail_service()
+    await mail_service.start()
+    results = []
+    try:
+        for number in range(1, cycles + 1):
+            started = time.perf_counter()
+            notified = await run_check_cycle(app)
+            results.append({"cycle": number, "seconds": round(time.perf_counter() - started, 2),
+                            "notified": notified})
+            print(f"🔁 {label}Цикл {number}: {results[-1]['seconds']} с, разослано планов {notified}",
+                  file=sys.__stdout__)
+        await drain_mail(mail_drain)
+    finally:
+        await mail_service.stop()
+        await app.shutdown()
+        await close_sources()
+        shutdown_parse_pool()
+    return results
+
+
+def stage_report(wall_seconds: float) -> list[dict]:
+    from bot import metrics
+
+    rows = []
+
+    def add(name: str, histogram, **labels):
+        # По строке на каждый набор меток, включающий labels (например, на каждый источник)
+        wanted = {(label, str(value)) for label, value in labels.items()}
+        for key, stats in sorted(histogram.summary().items()):
+            if not wanted <= set(key):
+                continue
+            extra = ",".join(value for label, value in key if (label, value) not in wanted)
+            rows.append({
+                "stage": f"{name} [{extra}]" if extra else name,
+                "count": stats["count"],
+                "per_second": round(stats["count"] / wall_seconds, 2) if wall_seconds else None,
+                "avg": round(stats["avg"], 4),
+                "p95": round(stats["p95"], 4),
+                "max": round(stats["max"], 4),
+            })
+
+    add("fetch: цикл", metrics.FETCH_SECONDS)
+    add("fetch: страница API", metrics.API_REQUEST_SECONDS)
+    add("download: HTTP", metrics.DOWNLOAD_SECONDS)
+    add("parse: разбор книги", metrics.PARSE_SECONDS, mode="full")
+    for stage in ("download", "parse", "diff", "notify"):
+        add(f"стадия {stage}", metrics.STAGE_SECONDS, stage=stage)
+    add("рассылка одного плана", metrics.BROADCAST_SECONDS)
+    add("telegram: запрос", metrics.TELEGRAM_SEND_SECONDS)
+    return rows
+
+
+def counters_report() -> dict:
+    from bot import metrics
+
+    def flatten(values: dict):
+        return {",".join(f"{k}={v}" for k, v in key) or "total": value for key, value in values.items()}
+
+    return {
+        "plans_fetched": flatten(metrics.FETCH_PLANS.values),
+        "plans_notified": flatten(metrics.PLANS_NOTIFIED.values),
+        "plans_skipped": flatten(metrics.PLANS_SKIPPED.values),
+        "api_errors": flatten(metrics.API_ERRORS.values),
+        "download_errors": flatten(metrics.DOWNLOAD_ERRORS.values),
+        "telegram_messages": flatten(metrics.TELEGRAM_MESSAGES.values),
+        "telegram_errors": flatten(metrics.TELEGRAM_ERRORS.values),
+        "stage_errors": flatten(metrics.STAGE_ERRORS.values),
+        "email_queue": flatten(metrics.EMAIL_QUEUE_DEPTH.current()),
+    }
+
+
+def run_worker(index: int, cycles: int, log_path: str, verbose: bool, mail_drain: float = 0) -> dict:
+    """Один воркер в своём процессе: общие база и заглушки, свои метрики"""
+    logging.basicConfig(level=logging.INFO, filename=log_path, encoding="utf-8",
+                        format=f"%(asctime)s - w{index} - %(name)s - %(levelname)s - %(message)s")
+    started = time.perf_counter()
+    with open(log_path, "a", encoding="utf-8") as log_file, \
+            (contextlib.nullcontext() if verbose else contextlib.redirect_stdout(log_file)):
+        results = asyncio.run(run_cycles(cycles, label=f"w{index}: ", mail_drain=mail_drain))
+    wall = time.perf_counter() - started
+    for result in results:
+        result["worker"] = index
+    return {"cycles": results, "stages": stage_report(wall), "counters": counters_report()}
+
+
+def merge_workers(reports: list[dict]) -> tuple[list[dict], list[dict], dict]:
+    cycles = [cycle for report in reports for cycle in report["cycles"]]
+
+    stages: dict[str, dict] = {}
+    for report in reports:
+        for row in report["stages"]:
+            merged = stages.setdefault(row["stage"], {**row, "count": 0, "per_second": 0, "avg": 0})
+            total = merged["count"] + row["count"]
+            merged["avg"] = round((merged["avg"] * merged["count"] + row["avg"] * row["count"]) / total, 4)
+            merged["count"] = total
+            merged["per_second"] = round((merged["per_second"] or 0) + (row["per_second"] or 0), 2)
+            merged["p95"] = max(merged["p95"], row["p95"])
+            merged["max"] = max(merged["max"], row["max"])
+
+    counters: dict[str, dict] = {}
+    for report in reports:
+        for name, values in report["counters"].items():
+            merged = counters.setdefault(name, {})
+            for key, value in values.items():
+                # Очередь писем общая в базе — её не складываем
+                merged[key] = value if name == "email_queue" else merged.get(key, 0) + value
+    return cycles, list(stages.values()), counters
+
+
+def print_report(report: dict):
+    print("\n=== Циклы ===")
+    for cycle in report["cycles"]:
+        worker = f"w{cycle['worker']} " if "worker" in cycle else ""
+        print(f"  {worker}#{cycle['cycle']}: {cycle['seconds']} с, разослано планов {cycle['notified']}")
+
+    print("\n=== Стадии (суммарно за прогон) ===")
+    print(f"  {'стадия':<40} {'шт':>7} {'шт/с':>8} {'сред, с':>9} {'p95, с':>9} {'макс, с':>9}")
+    for row in report["stages"]:
+        print(f"  {row['stage']:<40} {row['count']:>7} {row['per_second'] or 0:>8} "
+              f"{row['avg']:>9} {row['p95']:>9} {row['max']:>9}")
+
+    print("\n=== Счётчики бота ===")
+    for name, values in report["counters"].items():
+        if values:
+            print(f"  {name}: {values}")
+
+    print("\n=== Заглушка zakup.sk.kz ===")
+    for name, value in report["zakup"].items():
+        print(f"  {name}: {value}")
+    print("\n=== Заглушка Bot API ===")
+    for name, value in report["bot_api"].items():
+        print(f"  {name}: {value}")
+    print("\n=== Заглушка SMTP ===")
+    for name, value in report["smtp"].items():
+        print(f"  {name}: {value}")
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # Дальше рабочий каталог меняется — относительные пути фиксируем сразу
+    if args.report:
+        args.report = os.path.abspath(args.report)
+
+    work_dir = tempfile.mkdtemp(prefix="zakupbot-loadtest-")
+    if args.fixtures:
+        fixtures = load_fixtures(os.path.abspath(args.fixtures))
+    else:
+        print(f"📄 Генерирую {args.plans} планов по {args.rows} строк...")
+        fixtures = generate_fixtures(os.path.join(work_dir, "fixtures"), args.plans, args.rows, args.hit_rate,
+                                     args.tru_share, args.variants, args.customers)
+
+    zakup = FakeZakup(
+        fixtures,
+        api_faults=Faults(args.api_latency, args.api_jitter, args.api_error_rate),
+        download_faults=Faults(args.download_latency, args.download_jitter, args.download_error_rate),
+    )
+    smtp = FakeSmtp(
+        idle_timeout=args.smtp_idle_timeout,
+        faults=Faults(args.smtp_latency, 0, args.smtp_error_rate),
+    )
+    bot_api = FakeBotApi(
+        global_rate=args.tg_rate,
+        per_chat_rate=args.tg_chat_rate,
+        blocked_rate=args.tg_blocked_rate,
+        faults=Faults(args.tg_latency, args.tg_jitter, args.tg_error_rate, error_status=502),
+    )
+
+    # Настройки и адреса читаются при импорте модулей бота — всё задаём до него
+    os.environ["ZAKUP_BASE_URL"] = zakup.start()
+    os.environ["TELEGRAM_API_URL"] = bot_api.start()
+    smtp.start()
+    os.environ.update(SMTP_HOST=smtp.host, SMTP_PORT=str(smtp.port), SMTP_STARTTLS="0",
+                      sender_email="zakupbot@example.kz", sender_password="")
+    os.environ["ZAKUPBOT_DB"] = os.path.join(work_dir, "zakupbot.db")
+    os.environ["BOT_TOKEN"] = LOADTEST_TOKEN
+    os.environ.setdefault("ALLOWED_USERS", "1")
+    if args.send_rate:
+        os.environ["TELEGRAM_RATE"] = str(args.send_rate)
+    os.chdir(work_dir)
+    os.makedirs("logs", exist_ok=True)
+
+    log_path = os.path.join(work_dir, "logs", "loadtest.log")
+    logging.basicConfig(level=logging.INFO, filename=log_path, encoding="utf-8",
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    seed_users(args.subscribers, args.email_share)
+    print(f"🚀 {len(fixtures.plans)} планов, {args.subscribers} подписчиков, циклов: {args.cycles}")
+
+    started = time.perf_counter()
+    try:
+        if args.workers > 1:
+            # spawn: окружение и рабочий каталог наследуются, база общая. Не Pool:
+            # его процессы — демоны, а воркеру нужен свой пул разбора
+            with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(run_worker, index, args.cycles, log_path, args.verbose, args.mail_drain)
+                           for index in range(1, args.workers + 1)]
+                reports = [future.result() for future in futures]
+            cycles, stages, counters = merge_workers(reports)
+        else:
+            with open(log_path, "a", encoding="utf-8") as log_file, \
+                    (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(log_file)):
+                cycles = asyncio.run(run_cycles(args.cycles, mail_drain=args.mail_drain))
+    finally:
+        zakup.stop()
+        bot_api.stop()
+        smtp.stop()
+    wall = time.perf_counter() - started
+    if args.workers <= 1:
+        stages, counters = stage_report(wall), counters_report()
+
+    report = {
+        "parameters": vars(args),
+        "wall_seconds": round(wall, 2),
+        "cycles": cycles,
+        "stages": stages,
+        "counters": counters,
+        "zakup": zakup.stats(),
+        "bot_api": bot_api.stats(),
+        "smtp": smtp.stats(),
+    }
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчёт: {args.report}")
+
+    if args.keep:
+        print(f"\n📁 Рабочий каталог: {work_dir}")
+    else:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+# jobs.py
+#
+# Планировщик фоновых задач бота. У каждой задачи своё имя, интервал со
+# случайным разбросом и статистика запусков. Следующий запуск отсчитывается
+# от начала предыдущего, поэтому долгий цикл не сдвигает расписание, а два
+# запуска одной задачи никогда не идут одновременно.
+
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveInterval:
+    """
+    Интервал, который сокращается, пока задача находит что-то новое,
+    и растёт, когда новых данных нет.
+    """
+
+    def __init__(self, base: float, minimum: float, maximum: float,
+                 speedup: float = 0.5, backoff: float = 1.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.speedup = speedup
+        self.backoff = backoff
+        self.current = min(max(base, minimum), maximum)
+
+    def update(self, found_new: bool) -> float:
+        factor = self.speedup if found_new else self.backoff
+        self.current = min(max(self.current * factor, self.minimum), self.maximum)
+        return self.current
+
+
+@dataclass
+class JobStats:
+    runs: int = 0
+    failures: int = 0
+    last_started: float | None = None
+    last_finished: float | None = None
+    last_duration: float = 0.0
+    total_duration: float = 0.0
+    max_duration: float = 0.0
+    last_error: str | None = None
+    last_result: object = None
+
+    @property
+    def avg_duration(self) -> float:
+        return self.total_duration / self.runs if self.runs else 0.0
+
+
+@dataclass
+class Job:
+    name: str
+    func: object                      # async-функция без аргументов
+    interval: float | AdaptiveInterval
+    jitter: float = 0.1               # доля интервала, ±
+    run_on_start: bool = False
+    found_new: object = bool          # результат запуска → были ли новые данные
+    stats: JobStats = field(default_factory=JobStats)
+    next_run_at: float | None = None  # time.time() следующего запуска
+    _running: asyncio.Task | None = None
+    _loop_task: asyncio.Task | None = None
+    _wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def current_interval(self) -> float:
+        if isinstance(self.interval, AdaptiveInterval):
+            return self.interval.current
+        return self.interval
+
+    def _delay(self) -> float:
+        interval = self.current_interval
+        return max(0.0, interval + random.uniform(-self.jitter, self.jitter) * interval)
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: dict[str, Job] = {}
+
+    def add_job(self, name: str, func, interval: float | AdaptiveInterval, *,
+                jitter: float = 0.1, run_on_start: bool = False, found_new=bool) -> Job:
+        if name in self.jobs:
+            raise ValueError(f"Задача {name} уже добавлена")
+        job = Job(name, func, interval, jitter=jitter, run_on_start=run_on_start, found_new=found_new)
+        self.jobs[name] = job
+        return job
+
+    def start(self):
+        for job in self.jobs.values():
+            if job._loop_task is None or job._loop_task.done():
+                job._loop_task = asyncio.create_task(self._loop(job))
+        print(f"⏰ Планировщик запущен, задач: {len(self.jobs)}")
+        logger.info(f"⏰ Планировщик запущен: {', '.join(self.jobs)}")
+
+    async def stop(self):
+        tasks = []
+        for job in self.jobs.values():
+            for task in (job._loop_task, job._running):
+                if task is not None and not task.done():
+                    task.cancel()
+                    tasks.append(task)
+            job._loop_task = None
+            job._running = None
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run_now(self, name: str):
+        """Запускает задачу вне расписания; если она уже идёт — ждёт текущий запуск"""
+        job = self.jobs[name]
+        result = await self._run(job)
+        # Расписание отсчитываем от этого запуска
+        job._wakeup.set()
+        return result
+
+    def stats(self) -> dict[str, JobStats]:
+        return {name: job.stats for name, job in self.jobs.items()}
+
+    async def _loop(self, job: Job):
+        if not job.run_on_start:
+            await self._sleep(job, job._delay())
+        while True:
+            started = time.monotonic()
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass  # уже записано в статистику и лог
+            # Отсчёт от начала запуска: долгий цикл не копит сдвиг
+            await self._sleep(job, job._delay() - (time.monotonic() - started))
+
+    async def _sleep(self, job: Job, delay: float):
+        delay = max(0.0, delay)
+        job.next_run_at = time.time() + delay
+        job._wakeup.clear()
+        try:
+            await asyncio.wait_for(job._wakeup.wait(), delay)
+            # Был внеплановый запуск — ждём полный интервал уже от него
+            await self._sleep(job, job._delay())
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self, job: Job):
+        # Один запуск на задачу: второй вызывающий ждёт тот же запуск
+        if job._running is None or job._running.done():
+            job._running = asyncio.create_task(self._execute(job))
+        return await asyncio.shield(job._running)
+
+    async def _execute(self, job: Job):
+        stats = job.stats
+        stats.last_started = time.time()
+        started = time.monotonic()
+        try:
+            result = await job.func()
+        except Exception as e:
+            stats.failures += 1
+            stats.last_error = str(e)
+            print(f"❌ Задача {job.name} завершилась с ошибкой: {e}")
+            logger.exception(f"❌ Задача {job.name} завершилась с ошибкой: {e}")
+            raise
+        else:
+            stats.last_result = result
+            stats.last_error = None
+            if isinstance(job.interval, AdaptiveInterval):
+                job.interval.update(bool(job.found_new(result)))
+            return result
+        finally:
+            duration = time.monotonic() - started
+            stats.runs += 1
+            stats.last_finished = time.time()
+            stats.last_duration = duration
+            stats.total_duration += duration
+            stats.max_duration = max(stats.max_duration, duration)
+            logger.info(f"⏱ {job.name}: {duration:.1f} с, следующий интервал {job.current_interval:.0f} с "
+                        f"(запусков {stats.runs}, ошибок {stats.failures})")
+
+
+_scheduler: Scheduler | None = None
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
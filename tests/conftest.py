@@ -0,0 +1,31 @@
+# conftest.py
+#
+# Каждый тест — со своей пустой базой SQLite во временном каталоге. Настройки
+# бот читает из окружения при каждом get_settings(), поэтому их достаточно
+# задать через monkeypatch.setenv.
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# До импорта модулей бота: путь к базе читается при импорте bot.storage
+os.environ.setdefault("ZAKUPBOT_DB", os.path.join(tempfile.mkdtemp(prefix="zakupbot-tests-"), "zakupbot.db"))
+os.environ.setdefault("ALLOWED_USERS", "1")
+
+from bot import storage  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    """Свежая база на тест; соединение потока закрывается после него"""
+    storage.close_connection()
+    monkeypatch.setattr(storage, "DB_PATH", str(tmp_path / "zakupbot.db"))
+    monkeypatch.setattr(storage, "_initialized", False)
+    yield storage.get_connection()
+    storage.close_connection()
@@ -0,0 +1,64 @@
+# Курсор инкрементальной загрузки: high-water-mark по approveDate с окном перекрытия.
+
+import time
+
+from data_sources import cursor as cursors
+from data_sources.cursor import OVERLAP_MS, advance_cursor, cursor_since_ms, is_after_cursor
+
+
+def _plan(uid: str, approve_date: int | None) -> dict:
+    return {"excelFileUid": uid, "approveDate": approve_date}
+
+
+def test_empty_cursor_needs_full_resync_and_takes_everything():
+    assert cursors.needs_full_resync({})
+    assert cursor_since_ms({}) is None
+    assert is_after_cursor(_plan("u1", 5), {})
+
+
+def test_advance_moves_to_newest_date_and_keeps_boundary_uids():
+    cursor = advance_cursor({}, [_plan("u1", 100), _plan("u2", 300), _plan("u3", 300), _plan("u4", None)],
+                            full_sync=True)
+    assert cursor["approveDate"] == 300
+    assert cursor["uids"] == ["u2", "u3"]
+    assert not cursors.needs_full_resync(cursor)
+
+    cursor = advance_cursor(cursor, [_plan("u5", 300), _plan("u6", 200)])
+    assert (cursor["approveDate"], cursor["uids"]) == (300, ["u2", "u3", "u5"])
+
+    cursor = advance_cursor(cursor, [_plan("u7", 400)])
+    assert (cursor["approveDate"], cursor["uids"]) == (400, ["u7"])
+
+
+def test_advance_without_plans_keeps_cursor():
+    cursor = advance_cursor({}, [_plan("u1", 100)], full_sync=True)
+    assert advance_cursor(cursor, []) == cursor
+
+
+def test_overlap_window_lets_late_plans_through_but_not_seen_ones():
+    high = 10 * OVERLAP_MS
+    cursor = advance_cursor({}, [_plan("u1", high)])
+
+    assert cursor_since_ms(cursor) == high - OVERLAP_MS
+    assert not is_after_cursor(_plan("u1", high), cursor)
+    assert is_after_cursor(_plan("u2", high), cursor)
+    # Опубликован поздно, но в пределах окна — берём; дубли отсечёт UID
+    assert is_after_cursor(_plan("u3", high - OVERLAP_MS // 2), cursor)
+    assert not is_after_cursor(_plan("u4", high - OVERLAP_MS - 1), cursor)
+
+
+def test_full_resync_due_once_a_day(monkeypatch):
+    cursor = advance_cursor({}, [_plan("u1", 100)], full_sync=True)
+    now = time.time()
+    monkeypatch.setattr(cursors.time, "time", lambda: now + cursors.FULL_RESYNC_INTERVAL + 1)
+    assert cursors.needs_full_resync(cursor)
+
+
+def test_cursor_is_shared_through_the_database():
+    cursor = advance_cursor({}, [_plan("u1", 100)], full_sync=True)
+    cursors.save_cursor("zakup.sk.kz", 2025, cursor)
+
+    assert cursors.load_cursor("zakup.sk.kz", 2025) == cursor
+    assert cursors.load_cursor("zakup.sk.kz", 2024) == {}
+    cursors.reset_cursor("zakup.sk.kz", 2025)
+    assert cursors.needs_full_resync(cursors.load_cursor("zakup.sk.kz", 2025))
@@ -0,0 +1,45 @@
+# Раскладка листа (ширины колонок, объединения шапки) из сырого XML xlsx.
+
+from openpyxl import Workbook
+
+from bot.excel_scan import open_plan_sheet, read_sheet_layout
+
+
+def _save_workbook(path, active_title="План"):
+    wb = Workbook()
+    wb.active.title = "Титул"
+    ws = wb.create_sheet("План")
+    ws.column_dimensions["A"].width = 12.5
+    ws.column_dimensions["C"].width = 40
+    ws.merge_cells("A1:D1")
+    ws.merge_cells("B2:C3")
+    ws.merge_cells("A30:B30")    # ниже шапки — не нужно
+    for row in range(1, 31):
+        ws.cell(row=row, column=5, value=row)
+    wb.active = wb.sheetnames.index(active_title)
+    wb.save(path)
+
+
+def test_reads_layout_of_active_sheet(tmp_path):
+    path = str(tmp_path / "plan.xlsx")
+    _save_workbook(path)
+
+    wb, ws = open_plan_sheet(path)
+    try:
+        widths, merged = read_sheet_layout(path, ws)
+    finally:
+        wb.close()
+
+    assert widths == {"A": 12.5, "C": 40.0}
+    assert sorted(merged) == ["A1:D1", "B2:C3"]
+
+
+def test_other_sheet_layout_is_not_mixed_in(tmp_path):
+    path = str(tmp_path / "plan.xlsx")
+    _save_workbook(path, active_title="Титул")
+
+    wb, ws = open_plan_sheet(path)
+    try:
+        assert read_sheet_layout(path, ws) == ({}, [])
+    finally:
+        wb.close()
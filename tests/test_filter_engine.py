@@ -0,0 +1,70 @@
+# Обратные индексы правил подписчиков: строка плана проверяется против всех сразу.
+
+import pytest
+
+from bot.plan_parser import ParsedPlan
+from filters.filter_engine import add_rule, build_filter_engine, load_rules
+
+HEADER = ("№", "Код ТРУ", "Наименование", "Сумма без НДС")
+DEFAULT_CODE = "620000.000.000001"
+
+
+def _parsed(rows: list[tuple]) -> ParsedPlan:
+    return ParsedPlan(header_rows=[HEADER], matched_rows=rows,
+                      row_texts=[" | ".join(str(value) for value in row) for row in rows], code_column=1)
+
+
+ROWS = [
+    (1, "801019.000.000010", "Обучение персонала", 2_000_000),
+    (2, "801019.000.000020", "Курсы повышения квалификации", 9_000_000),
+    (3, DEFAULT_CODE, "Аудит информационной безопасности", 500_000),
+    (4, "351110.100.000000", "Электроэнергия", 100),
+]
+
+
+def test_rules_are_normalized_when_stored():
+    add_rule(1, "Keyword", "  АУДИТ ")
+    add_rule(1, "bin", "123 456 789 012")
+    assert {(rule.kind, rule.value) for rule in load_rules(1)} == {("keyword", "аудит"), ("bin", "123456789012")}
+    with pytest.raises(ValueError):
+        add_rule(1, "color", "red")
+
+
+def test_code_prefix_glob_and_keyword_rules_match_their_owners():
+    add_rule(1, "tru", "801019")              # префикс по сегментам
+    add_rule(2, "tru", "35111?.*")            # маска
+    add_rule(3, "keyword", "аудит")
+    engine = build_filter_engine([1, 2, 3, 4], [DEFAULT_CODE], [])
+
+    assert engine.match(None, _parsed(ROWS)) == {1: [0, 1], 2: [3], 3: [2], 4: [2]}
+
+
+def test_row_selector_covers_every_subscriber_rule():
+    add_rule(1, "tru", "801019")
+    add_rule(3, "keyword", "электро")
+    selector = build_filter_engine([1, 3], [DEFAULT_CODE], []).row_selector()
+
+    assert [selector.row_matches(row, 1) for row in ROWS] == [True, True, True, True]
+
+
+def test_plan_level_filters_and_amount_ranges():
+    add_rule(1, "tru", "801019")
+    add_rule(1, "amount", "1000000-5000000")
+    add_rule(2, "tru", "801019")
+    add_rule(2, "bin", "999999999999")
+    engine = build_filter_engine([1, 2], [DEFAULT_CODE], [])
+
+    assert engine.match({"customerIdentifier": "111111111111"}, _parsed(ROWS)) == {1: [0]}
+    assert engine.match({"customerIdentifier": "999999999999"}, _parsed(ROWS)) == {1: [0], 2: [0, 1]}
+
+
+def test_match_limited_to_given_rows():
+    add_rule(1, "tru", "801019")
+    engine = build_filter_engine([1], [DEFAULT_CODE], [])
+    assert engine.match(None, _parsed(ROWS), [1, 2]) == {1: [1]}
+
+
+def test_unknown_subscribers_rules_are_not_indexed():
+    add_rule(7, "tru", "351110")
+    engine = build_filter_engine([1], [DEFAULT_CODE], [])
+    assert engine.match(None, _parsed(ROWS)) == {1: [2]}
@@ -0,0 +1,105 @@
+# Почтовая очередь против заглушки SMTP (loadtest.fake_smtp): одно соединение
+# на пачку писем, переподключение после простоя и обрыва.
+
+import asyncio
+import time
+
+import pytest
+
+from bot import mailer
+from bot.email import build_email_message
+from loadtest.fake_smtp import FakeSmtp
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    server = FakeSmtp(idle_timeout=0.5)
+    server.start()
+    monkeypatch.setenv("SMTP_HOST", server.host)
+    monkeypatch.setenv("SMTP_PORT", str(server.port))
+    monkeypatch.setenv("SMTP_STARTTLS", "0")
+    monkeypatch.setenv("sender_email", "zakupbot@example.kz")
+    monkeypatch.setenv("sender_password", "")
+    yield server
+    server.stop()
+
+
+def _message(to_email: str):
+    return build_email_message(to_email, "План", "plan.xlsx", b"xlsx")
+
+
+def test_connection_reused_for_a_batch(smtp):
+    connection = mailer.SmtpConnection(idle_timeout=60)
+    for idx in range(3):
+        connection.send(_message(f"user{idx}@example.kz"))
+    connection.close()
+
+    assert smtp.stats()["emails"] == 3
+    assert smtp.connections == 1
+
+
+def test_reconnects_after_server_closed_idle_connection(smtp):
+    # Клиент ещё считает соединение живым, а сервер его уже закрыл
+    connection = mailer.SmtpConnection(idle_timeout=60)
+    connection.send(_message("a@example.kz"))
+    time.sleep(0.8)
+    connection.send(_message("b@example.kz"))
+    connection.close()
+
+    assert smtp.stats()["emails"] == 2
+    assert smtp.idle_closed == 1
+    assert smtp.connections == 2
+
+
+def test_checks_connection_with_noop_after_client_idle_timeout(smtp):
+    connection = mailer.SmtpConnection(idle_timeout=0.1)
+    connection.send(_message("a@example.kz"))
+    time.sleep(0.2)
+    connection.send(_message("b@example.kz"))
+    connection.close()
+
+    assert smtp.commands["NOOP"] == 1
+    assert smtp.connections == 1
+
+
+def test_service_drains_queue_over_one_connection(smtp):
+    async def run():
+        service = mailer.MailService(workers=1)
+        await service.start()
+        try:
+            for idx in range(5):
+                mailer.enqueue_email(f"user{idx}@example.kz", "План", "plan.xlsx", b"xlsx")
+            for _ in range(100):
+                if not mailer.queue_depth():
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            await service.stop()
+
+    asyncio.run(run())
+    stats = smtp.stats()
+    assert stats["emails"] == 5
+    assert stats["duplicates"] == 0
+    assert smtp.connections == 1
+    assert mailer.queue_depth() == {}
+
+
+def test_transient_failure_is_retried_later(smtp, db):
+    smtp.faults.error_rate = 1.0
+
+    async def run():
+        service = mailer.MailService(workers=1)
+        await service.start()
+        mailer.enqueue_email("a@example.kz", "План", "plan.xlsx", b"xlsx")
+        for _ in range(100):
+            if smtp.rejected and not mailer.queue_depth().get("sending"):
+                break
+            await asyncio.sleep(0.05)
+        await service.stop()
+
+    asyncio.run(run())
+    status, attempts, next_attempt_at = db.execute(
+        "SELECT status, attempts, next_attempt_at FROM email_queue").fetchone()
+    assert (status, attempts) == ("pending", 1)
+    assert next_attempt_at > time.time()
+    assert smtp.rejected == 1
@@ -0,0 +1,158 @@
+# Протокол нескольких воркеров на общей базе: аренда планов, её истечение,
+# контрольные точки и отметки доставки. Второй воркер — тот же процесс
+# с подменённым bot.work_queue.WORKER_ID.
+
+import time
+
+import pytest
+
+from bot import work_queue
+
+WORKER_A = "host:1:aaaaaa"
+WORKER_B = "host:2:bbbbbb"
+
+
+def _plan(uid: str, customer_bin: str = "111111111111", approve_date: int = 1) -> dict:
+    return {"excelFileUid": uid, "customerIdentifier": customer_bin, "approveDate": approve_date}
+
+
+@pytest.fixture
+def as_worker(monkeypatch):
+    def switch(worker_id: str):
+        monkeypatch.setattr(work_queue, "WORKER_ID", worker_id)
+    switch(WORKER_A)
+    return switch
+
+
+def _status(db, uid: str) -> tuple:
+    return db.execute("SELECT status, lease_owner, attempts FROM work_items WHERE uid = ?", (uid,)).fetchone()
+
+
+def test_enqueue_skips_known_uids():
+    assert work_queue.enqueue([_plan("u1"), _plan("u2", "222222222222")]) == 2
+    assert work_queue.enqueue([_plan("u1"), _plan("u3", "333333333333")]) == 1
+
+
+def test_two_workers_never_claim_the_same_plan(as_worker, db):
+    work_queue.enqueue([_plan("u1")])
+
+    assert [plan["excelFileUid"] for plan in work_queue.claim(5)] == ["u1"]
+    as_worker(WORKER_B)
+    assert work_queue.claim(5) == []
+    assert _status(db, "u1") == ("leased", WORKER_A, 1)
+
+
+def test_customer_plans_stay_with_one_worker(as_worker):
+    # Планы одного заказчика — строго одному воркеру, иначе разойдётся история ТРУ
+    work_queue.enqueue([_plan("u1"), _plan("u2"), _plan("u3", "222222222222")])
+
+    assert [plan["excelFileUid"] for plan in work_queue.claim(1)] == ["u1"]
+    as_worker(WORKER_B)
+    assert [plan["excelFileUid"] for plan in work_queue.claim(5)] == ["u3"]
+    as_worker(WORKER_A)
+    assert [plan["excelFileUid"] for plan in work_queue.claim(5)] == ["u2"]
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(as_worker, db, monkeypatch):
+    monkeypatch.setenv("WORK_LEASE_SECONDS", "0.2")
+    work_queue.enqueue([_plan("u1")])
+    assert work_queue.claim(1)
+
+    as_worker(WORKER_B)
+    assert work_queue.claim(1) == []
+    time.sleep(0.3)
+    assert [plan["excelFileUid"] for plan in work_queue.claim(1)] == ["u1"]
+    assert _status(db, "u1") == ("leased", WORKER_B, 2)
+
+    # Очнувшийся прежний владелец план уже не продлит и не закроет
+    as_worker(WORKER_A)
+    assert work_queue.renew(["u1"]) == 0
+    work_queue.complete("u1")
+    assert _status(db, "u1")[0] == "leased"
+
+
+def test_renew_keeps_lease_alive(as_worker, monkeypatch):
+    monkeypatch.setenv("WORK_LEASE_SECONDS", "0.3")
+    work_queue.enqueue([_plan("u1")])
+    assert work_queue.claim(1)
+
+    for _ in range(3):
+        time.sleep(0.15)
+        assert work_queue.renew(["u1"]) == 1
+    as_worker(WORKER_B)
+    assert work_queue.claim(1) == []
+
+
+def test_retry_gives_up_after_max_attempts(as_worker, db, monkeypatch):
+    work_queue.enqueue([_plan("u1")])
+    for attempt in range(1, work_queue.MAX_ATTEMPTS + 1):
+        assert work_queue.claim(1)
+        work_queue.retry("u1", f"ошибка {attempt}")
+
+    assert _status(db, "u1") == ("failed", None, work_queue.MAX_ATTEMPTS)
+    assert work_queue.claim(1) == []
+
+
+def test_checkpoint_survives_restart_and_complete_removes_it(as_worker, db, monkeypatch):
+    monkeypatch.setenv("WORK_LEASE_SECONDS", "0.1")
+    work_queue.enqueue([_plan("u1")])
+    assert work_queue.claim(1)
+    work_queue.save_checkpoint("u1", work_queue.STAGE_PARSED, {"rows": [("a", 1)]})
+
+    # Воркер упал; план берёт другой и продолжает с контрольной точки
+    time.sleep(0.2)
+    as_worker(WORKER_B)
+    assert work_queue.claim(1)
+    assert work_queue.load_checkpoint("u1") == (work_queue.STAGE_PARSED, {"rows": [("a", 1)]})
+
+    work_queue.complete("u1")
+    assert work_queue.load_checkpoint("u1") is None
+    assert _status(db, "u1")[0] == "done"
+    assert db.execute("SELECT 1 FROM notified_uids WHERE uid = 'u1'").fetchone()
+
+
+def test_fetch_lease_is_exclusive_until_released(as_worker):
+    assert work_queue.acquire_lease("fetch", 60)
+    as_worker(WORKER_B)
+    assert not work_queue.acquire_lease("fetch", 60)
+    assert work_queue.lease_active("fetch")
+
+    as_worker(WORKER_A)
+    work_queue.release_lease("fetch")
+    as_worker(WORKER_B)
+    assert work_queue.acquire_lease("fetch", 60)
+
+
+def test_delivery_in_flight_at_crash_is_not_repeated(as_worker):
+    assert work_queue.claim_delivery("u1", 10)
+    assert work_queue.claim_delivery("u1", 20)
+    work_queue.finish_delivery("u1", 10, sent=True)
+    # Воркер A упал, не подтвердив отправку подписчику 20
+
+    as_worker(WORKER_B)
+    assert work_queue.undelivered("u1", [10, 20, 30]) == [30]
+    assert not work_queue.claim_delivery("u1", 10)
+    assert not work_queue.claim_delivery("u1", 20)
+    assert work_queue.claim_delivery("u1", 30)
+
+
+def test_own_delivery_claim_can_be_taken_again(as_worker):
+    # Повтор после RetryAfter тем же воркером
+    assert work_queue.claim_delivery("u1", 10)
+    assert work_queue.claim_delivery("u1", 10)
+
+
+def test_failed_delivery_is_retried_and_sent_is_final(as_worker):
+    assert work_queue.claim_delivery("u1", 10)
+    work_queue.finish_delivery("u1", 10, sent=False)
+
+    as_worker(WORKER_B)
+    assert work_queue.undelivered("u1", [10]) == [10]
+    assert work_queue.claim_delivery("u1", 10)
+    work_queue.finish_delivery("u1", 10, sent=True)
+
+    # Запоздалый отказ от прежнего владельца не отменяет отправку
+    as_worker(WORKER_A)
+    work_queue.finish_delivery("u1", 10, sent=False)
+    assert work_queue.undelivered("u1", [10]) == []
+    assert not work_queue.claim_delivery("u1", 10)
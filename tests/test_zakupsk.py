@@ -0,0 +1,51 @@
+# Постраничная выгрузка zakup.sk.kz против подменённого транспорта httpx.
+
+import asyncio
+
+import httpx
+
+from data_sources import zakupsk
+
+PAGE_SIZE = zakupsk.PAGE_SIZE
+
+
+def _plans(count: int) -> list[dict]:
+    # Порядок «как в базе портала»: approveDate скачет, сортировки нет
+    return [{"id": idx, "approveDate": (idx * 7919) % 1000} for idx in range(count)]
+
+
+def _fetch(plans: list[dict], **kwargs) -> tuple[list[dict], list[dict]]:
+    requests_seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = dict(request.url.params)
+        requests_seen.append(params)
+        page = int(params["page"])
+        # Заглушка сортировку игнорирует, как и проблемный API
+        return httpx.Response(200, json=plans[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await zakupsk.fetch_procurement_plans_async(2025, max_pages=10, concurrency=2,
+                                                               client=client, **kwargs)
+
+    return asyncio.run(run()), requests_seen
+
+
+def test_full_fetch_reads_until_short_page():
+    plans = _plans(PAGE_SIZE * 3 + 5)
+    fetched, seen = _fetch(plans)
+    assert fetched == plans
+    assert all("sort" not in params for params in seen)
+
+
+def test_ignored_sort_restarts_unsorted_from_first_page():
+    plans = _plans(PAGE_SIZE * 3 + 5)
+    fetched, seen = _fetch(plans, since_ms=0)
+
+    assert fetched == plans
+    sorted_requests = [params for params in seen if "sort" in params]
+    unsorted_requests = [params for params in seen if "sort" not in params]
+    assert sorted_requests
+    # Повторный проход целиком без сортировки, начиная с нулевой страницы
+    assert [int(params["page"]) for params in unsorted_requests] == [0, 1, 2, 3]